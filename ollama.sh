@@ -19,13 +19,14 @@ show_help() {
     echo "Uso: $0 [comando] [opción]"
     echo ""
     echo "Comandos:"
-    echo "  start [webui]           - Iniciar Ollama (default: solo Ollama)"
+    echo "  start [webui|gateway]   - Iniciar Ollama (default: solo Ollama)"
     echo "  stop                    - Detener todos los servicios"
-    echo "  restart [webui]         - Reiniciar servicios"
-    echo "  logs [ollama|webui]     - Mostrar logs (default: ollama)"
+    echo "  restart [webui|gateway] - Reiniciar servicios"
+    echo "  logs [ollama|webui|gateway] - Mostrar logs (default: ollama)"
     echo "  status                  - Mostrar estado de los contenedores"
     echo "  test                    - Probar la API de Ollama"
     echo "  pull [modelo]           - Descargar modelo específico"
+    echo "  pull-all [modelos...]   - Descargar varios modelos en paralelo (default: todos los de la lista)"
     echo "  list                    - Listar modelos disponibles"
     echo "  clean                   - Limpiar contenedores y datos"
     echo "  help                    - Mostrar esta ayuda"
@@ -47,10 +48,12 @@ show_help() {
     echo "Ejemplos:"
     echo "  $0 start                # Iniciar solo Ollama"
     echo "  $0 start webui          # Iniciar Ollama + interfaz web"
+    echo "  $0 start gateway        # Iniciar Ollama + interfaz web + pasarela"
     echo "  $0 pull opencoder:1.5b  # Descargar modelo OpenCoder 1.5B"
     echo "  $0 pull deepseek-coder:6.7b  # Descargar modelo DeepSeek Coder"
     echo "  $0 pull deepseek-r1     # Descargar modelo DeepSeek-R1 (5.2GB)"
     echo "  $0 pull deepseek-r1:1.5b # Descargar modelo DeepSeek-R1 1.5B (ligero)"
+    echo "  $0 pull-all deepseek-r1:7b opencoder:8b  # Descargar dos modelos a la vez"
     echo "  $0 list                 # Ver modelos disponibles"
     echo "  $0 test                 # Probar la API"
     echo ""
@@ -81,7 +84,7 @@ check_docker_compose() {
 
 # Función para crear directorios de datos si no existen
 create_data_dirs() {
-    mkdir -p data/ollama data/open-webui
+    mkdir -p data/ollama data/ollama-2 data/open-webui
 }
 
 # Función para iniciar servicios
@@ -99,6 +102,14 @@ start_service() {
             echo -e "  🤖 Ollama: http://localhost:11434"
             echo -e "  🌐 Open WebUI: http://localhost:8080"
             ;;
+        "gateway")
+            echo -e "${GREEN}Iniciando Ollama + Open WebUI + pasarela...${NC}"
+            docker compose --profile webui --profile gateway up -d
+            echo -e "${GREEN}Servicios iniciados:${NC}"
+            echo -e "  🤖 Ollama: http://localhost:11434"
+            echo -e "  🚦 Pasarela: http://localhost:11436 (estado en /gateway/stats)"
+            echo -e "  🌐 Open WebUI: http://localhost:8080"
+            ;;
         ""|"ollama")
             echo -e "${GREEN}Iniciando Ollama...${NC}"
             docker compose up -d ollama
@@ -106,7 +117,7 @@ start_service() {
             ;;
         *)
             echo -e "${RED}Error: Opción inválida '$option'${NC}"
-            echo "Opciones válidas: ollama, webui"
+            echo "Opciones válidas: ollama, webui, gateway"
             exit 1
             ;;
     esac
@@ -137,12 +148,15 @@ show_logs() {
         "webui")
             docker compose logs -f open-webui
             ;;
+        "gateway")
+            docker compose logs -f gateway
+            ;;
         "ollama"|"")
             docker compose logs -f ollama
             ;;
         *)
             echo -e "${RED}Error: Opción inválida '$service'${NC}"
-            echo "Opciones válidas: ollama, webui"
+            echo "Opciones válidas: ollama, webui, gateway"
             exit 1
             ;;
     esac
@@ -259,6 +273,10 @@ main() {
         "pull")
             pull_model $option
             ;;
+        "pull-all")
+            shift
+            python3 "$(dirname "$0")/test/pull_manager.py" "$@"
+            ;;
         "list")
             list_models
             ;;
@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+"""
+Procesamiento por lotes de prompts desde un fichero JSONL
+Cada línea de entrada es un objeto {"model": ..., "prompt": ..., "options": {...}}.
+El fichero se lee en streaming a través de una cola acotada, así que la memoria no
+depende de su tamaño; los resultados se escriben en el JSONL de salida según terminan.
+Con --budget deja de enviar líneas al agotarse el tiempo; --resume continúa donde se quedó.
+
+Uso: python batch_runner.py entrada.jsonl salida.jsonl [--workers 4] [--model M] [--resume] [--budget S]
+"""
+
+import argparse
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional, Set, Tuple
+
+# Importar utilidades comunes
+try:
+    from ollama_test_utils import (
+        check_ollama_status,
+        format_error,
+        generate,
+        get_client,
+        make_client,
+        set_client,
+        set_sampler,
+        set_budget,
+        budget_exhausted,
+        SERVER_METRICS
+    )
+    from ollama_metrics import start_metrics_server, write_metrics
+    from resource_sampler import ResourceSampler
+except ImportError as e:
+    print(f"❌ Error: No se puede importar {e.name or 'un módulo'}: {e}")
+    print("   Asegúrate de que los scripts de test/ estén en el mismo directorio "
+          "y de haber instalado test/requirements.txt")
+    sys.exit(1)
+
+# Marca de fin de la cola para los workers
+_DONE = None
+
+def parse_args() -> argparse.Namespace:
+    """Leer los argumentos de la línea de comandos"""
+    parser = argparse.ArgumentParser(description="Procesar un fichero JSONL de prompts contra Ollama")
+    parser.add_argument("input", type=Path, help="Fichero JSONL de entrada")
+    parser.add_argument("output", type=Path, help="Fichero JSONL de salida")
+    parser.add_argument("--workers", type=int, default=4,
+                        help="Peticiones simultáneas (por defecto: 4)")
+    parser.add_argument("--model", default=None,
+                        help="Modelo para las líneas que no indican ninguno")
+    parser.add_argument("--prompt-field", default="prompt",
+                        help="Campo de cada línea que contiene el prompt (por defecto: prompt)")
+    parser.add_argument("--max-tokens", type=int, default=300,
+                        help="Tokens máximos por respuesta si la línea no fija num_predict (por defecto: 300)")
+    parser.add_argument("--timeout", type=float, default=180,
+                        help="Timeout por petición en segundos (por defecto: 180)")
+    parser.add_argument("--resume", action="store_true",
+                        help="Continuar una ejecución interrumpida en vez de empezar de cero")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="Exponer métricas Prometheus en http://localhost:PUERTO/metrics")
+    parser.add_argument("--metrics-file", type=Path, default=None,
+                        help="Volcar las métricas en formato OpenMetrics a este fichero al terminar")
+    parser.add_argument("--resources", type=Path, default=None,
+                        help="Muestrear CPU y memoria de Ollama y guardar en este fichero JSON "
+                             "las muestras alineadas con cada petición")
+    parser.add_argument("--resource-interval", type=float, default=1.0,
+                        help="Segundos entre muestras de recursos (por defecto: 1)")
+    parser.add_argument("--budget", type=float, default=None,
+                        help="Tiempo total máximo en segundos: al agotarse se cortan las peticiones "
+                             "en curso y no se envían más (se repiten con --resume)")
+    args = parser.parse_args()
+    if args.workers < 1:
+        parser.error("--workers debe ser >= 1")
+    if args.budget is not None and args.budget <= 0:
+        parser.error("--budget debe ser > 0")
+    return args
+
+def is_retryable(result: Dict[str, Any]) -> bool:
+    """
+    Fallos que no dependen de la línea: sin respuesta del servidor (conexión, timeout) o
+    error 5xx. Se repiten con --resume; los errores de la entrada y los 4xx son definitivos.
+    """
+    status = result.get("status_code")
+    return not result["success"] and (status is None or status >= 500)
+
+def drop_retryable(output: Path) -> Set[int]:
+    """Quitar de la salida los resultados que se pueden repetir y devolver sus líneas"""
+    retry: Set[int] = set()
+    if not output.exists():
+        return retry
+    tmp = output.with_name(output.name + ".tmp")
+    with open(output, encoding="utf-8") as src, open(tmp, "w", encoding="utf-8") as dst:
+        for raw in src:
+            try:
+                record = json.loads(raw)
+                if record.get("retryable"):
+                    retry.add(record["line"])
+                    continue
+            except (json.JSONDecodeError, KeyError, AttributeError):
+                pass
+            dst.write(raw)
+    os.replace(tmp, output)
+    return retry
+
+class Checkpoint:
+    """
+    Última línea hasta la que todo está completado. Las peticiones terminan desordenadas,
+    así que se guardan aparte las líneas ya escritas por encima del checkpoint; como mucho
+    hay tantas como peticiones en vuelo, por lo que la memoria sigue acotada.
+    Las líneas de 'retry' fallaron sin llegar a procesarse y se repiten aunque estén por debajo.
+    """
+
+    def __init__(self, path: Path, line: int = 0, completed: Optional[Set[int]] = None,
+                 retry: Optional[Set[int]] = None):
+        self.path = path
+        self.line = line
+        self.completed = completed or set()
+        self.retry = retry or set()
+        self._advance()
+
+    @classmethod
+    def load(cls, path: Path, output: Path, retry: Optional[Set[int]] = None) -> "Checkpoint":
+        """Recuperar el checkpoint y las líneas sueltas ya escritas en la salida"""
+        line = int(path.read_text().strip() or 0) if path.exists() else 0
+        completed = set()
+        if output.exists():
+            with open(output, encoding="utf-8") as f:
+                for raw in f:
+                    try:
+                        done = json.loads(raw)["line"]
+                    except (json.JSONDecodeError, KeyError, TypeError):
+                        continue  # línea a medio escribir al caer el proceso
+                    if done > line:
+                        completed.add(done)
+        return cls(path, line, completed, retry)
+
+    def is_done(self, line: int) -> bool:
+        """Indicar si una línea ya se procesó en una ejecución anterior"""
+        return line not in self.retry and (line <= self.line or line in self.completed)
+
+    def mark(self, line: int) -> None:
+        """Registrar una línea terminada y avanzar el checkpoint si es posible"""
+        self.retry.discard(line)
+        if line <= self.line:
+            return
+        self.completed.add(line)
+        if self._advance():
+            tmp = self.path.with_name(self.path.name + ".tmp")
+            tmp.write_text(f"{self.line}\n")
+            os.replace(tmp, self.path)
+
+    def _advance(self) -> bool:
+        moved = False
+        while self.line + 1 in self.completed:
+            self.line += 1
+            self.completed.discard(self.line)
+            moved = True
+        return moved
+
+def read_records(path: Path) -> Iterator[Tuple[int, Optional[Dict[str, Any]], Optional[str]]]:
+    """
+    Leer el JSONL línea a línea devolviendo (número de línea, registro, error).
+    Las líneas vacías se devuelven sin registro ni error.
+    """
+    with open(path, encoding="utf-8") as f:
+        for number, raw in enumerate(f, start=1):
+            if not raw.strip():
+                yield number, None, None
+                continue
+            try:
+                record = json.loads(raw)
+            except json.JSONDecodeError as e:
+                yield number, None, f"JSON inválido: {e}"
+                continue
+            if not isinstance(record, dict):
+                yield number, None, "la línea no es un objeto JSON"
+                continue
+            yield number, record, None
+
+class BatchRunner:
+    """Pipeline lector -> cola acotada -> workers -> escritor incremental"""
+
+    def __init__(self, args: argparse.Namespace, checkpoint: Checkpoint):
+        self.args = args
+        self.checkpoint = checkpoint
+        self.jobs: "queue.Queue" = queue.Queue(maxsize=args.workers * 2)
+        self.write_lock = threading.Lock()
+        self.output = open(args.output, "a", encoding="utf-8")
+        if self.output.tell() > 0 and not self._ends_with_newline(args.output):
+            # Cerrar la línea que quedó a medias si el proceso cayó mientras escribía
+            self.output.write("\n")
+        self.processed = 0
+        self.failed = 0
+        self.retryable = 0
+        self.skipped = 0
+        self.unsent = 0  # líneas que ya estaban en la cola al agotarse el presupuesto
+        self.stopped = False  # el presupuesto dejó parte del fichero sin leer
+        self.tokens = 0
+        self.start_time = time.time()
+
+    @staticmethod
+    def _ends_with_newline(path: Path) -> bool:
+        with open(path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    def run(self) -> None:
+        """Procesar el fichero completo"""
+        workers = [threading.Thread(target=self.worker, daemon=True) for _ in range(self.args.workers)]
+        for worker in workers:
+            worker.start()
+        try:
+            for number, record, error in read_records(self.args.input):
+                if budget_exhausted():
+                    # Sin marcar en el checkpoint: --resume sigue desde aquí
+                    self.stopped = True
+                    break
+                if self.checkpoint.is_done(number):
+                    self.skipped += 1
+                    continue
+                if record is None and error is None:
+                    # Línea vacía: no hay nada que enviar, pero el checkpoint debe pasar por ella
+                    with self.write_lock:
+                        self.checkpoint.mark(number)
+                    continue
+                # put() bloquea cuando la cola está llena: así se limita la memoria
+                self.jobs.put((number, record, error))
+        except BaseException:
+            # Descartar lo pendiente; las peticiones en vuelo terminan y se escriben
+            self.drain()
+            raise
+        finally:
+            for _ in workers:
+                self.jobs.put(_DONE)
+            for worker in workers:
+                worker.join()
+            self.output.close()
+
+    def drain(self) -> None:
+        """Vaciar la cola sin procesar sus trabajos"""
+        while True:
+            try:
+                self.jobs.get_nowait()
+            except queue.Empty:
+                return
+
+    def worker(self) -> None:
+        """Consumir trabajos de la cola hasta recibir la marca de fin"""
+        while True:
+            job = self.jobs.get()
+            if job is _DONE:
+                return
+            number, record, error = job
+            if budget_exhausted():
+                # Tampoco se escribe ni se marca: queda pendiente para --resume
+                with self.write_lock:
+                    self.unsent += 1
+                continue
+            try:
+                output = self.process(record, error)
+            except Exception as e:
+                # Un fallo inesperado en una línea no puede dejar al lote sin workers
+                output = {"success": False, "error": f"{type(e).__name__}: {e}"}
+            self.write(number, output)
+
+    def process(self, record: Optional[Dict[str, Any]], error: Optional[str]) -> Dict[str, Any]:
+        """Ejecutar la petición de una línea y construir su registro de salida"""
+        if error is None:
+            model = record.get("model") or self.args.model
+            prompt = record.get(self.args.prompt_field)
+            options = record.get("options")
+            if not model:
+                error = "sin modelo (usa --model para indicar uno por defecto)"
+            elif not isinstance(model, str):
+                error = "'model' debe ser un texto"
+            elif not isinstance(prompt, str):
+                error = f"sin campo '{self.args.prompt_field}'"
+            elif options is not None and not isinstance(options, dict):
+                error = "'options' debe ser un objeto JSON"
+        if error is not None:
+            return {"success": False, "error": error}
+
+        result = generate(model, prompt, self.args.max_tokens, timeout=self.args.timeout,
+                          options=options)
+        output = {
+            "model": model,
+            "success": result["success"],
+            "error": None if result["success"] else format_error(result),
+            "response": result["response"],
+            "wall_time": result["wall_time"]
+        }
+        if is_retryable(result):
+            # Incluye las cortadas por el presupuesto. El checkpoint avanza igualmente;
+            # --resume la quita de la salida y la repite
+            output["retryable"] = True
+        for key in ("id", "request_id"):
+            if key in record:
+                output[key] = record[key]
+        for key in SERVER_METRICS:
+            output[key] = result.get(key)
+        return output
+
+    def write(self, number: int, output: Dict[str, Any]) -> None:
+        """Escribir un resultado y actualizar el checkpoint y el progreso"""
+        output = {"line": number, **output}
+        with self.write_lock:
+            self.output.write(json.dumps(output, ensure_ascii=False) + "\n")
+            self.output.flush()
+            self.checkpoint.mark(number)
+            self.processed += 1
+            if not output["success"]:
+                self.failed += 1
+            if output.get("retryable"):
+                self.retryable += 1
+            self.tokens += output.get("eval_count") or 0
+            if self.processed % 100 == 0:
+                elapsed = time.time() - self.start_time
+                print(f"   📨 {self.processed} procesadas ({self.failed} con error), "
+                      f"{self.processed / elapsed:.2f} peticiones/s, línea {self.checkpoint.line}")
+
+def main():
+    """Función principal"""
+    args = parse_args()
+
+    print("📦 Procesamiento por Lotes")
+    print("=" * 50)
+
+    if not args.input.exists():
+        print(f"❌ No existe el fichero de entrada: {args.input}")
+        sys.exit(1)
+
+    checkpoint_path = args.output.with_name(args.output.name + ".checkpoint")
+    if args.resume:
+        retry = drop_retryable(args.output)
+        checkpoint = Checkpoint.load(checkpoint_path, args.output, retry)
+        print(f"🔁 Reanudando desde la línea {checkpoint.line + 1}"
+              + (f" y repitiendo {len(retry)} líneas con fallos de conexión o del servidor" if retry else ""))
+    else:
+        if args.output.exists():
+            print(f"⚠️  Se sobrescribe {args.output} (usa --resume para continuar una ejecución)")
+            args.output.unlink()
+        if checkpoint_path.exists():
+            checkpoint_path.unlink()
+        checkpoint = Checkpoint(checkpoint_path)
+
+    if not check_ollama_status():
+        return
+
+    # Si OLLAMA_URL apunta a la pasarela (gateway.py), los lotes ceden el paso a las peticiones interactivas
+    set_client(make_client(pool_size=args.workers, headers={"X-Priority": "batch"}))
+    if args.metrics_port:
+        start_metrics_server(args.metrics_port)
+        print(f"📈 Métricas en http://localhost:{args.metrics_port}/metrics")
+    sampler = None
+    if args.resources:
+        sampler = ResourceSampler(get_client(), args.resource_interval).start()
+        set_sampler(sampler)
+        print(f"🖥️  Muestreando recursos cada {args.resource_interval:g}s ({sampler.describe()})")
+    runner = BatchRunner(args, checkpoint)
+    if args.budget:
+        set_budget(args.budget)
+    try:
+        runner.run()
+    except KeyboardInterrupt:
+        print(f"\n⏹️  Interrumpido; reanuda con --resume (checkpoint en la línea {checkpoint.line})")
+        sys.exit(130)
+
+    elapsed = time.time() - runner.start_time
+    print("\n" + "=" * 50)
+    print("📊 RESUMEN DEL LOTE")
+    print("=" * 50)
+    print(f"📨 Procesadas: {runner.processed} ({runner.failed} con error), omitidas: {runner.skipped}")
+    if runner.retryable:
+        print(f"🔁 {runner.retryable} fallaron por la conexión, el servidor o el presupuesto: "
+              f"se repetirán con --resume")
+    if runner.stopped or runner.unsent:
+        rest = " y el resto del fichero sin leer" if runner.stopped else ""
+        print(f"⏳ Presupuesto de {args.budget:g}s agotado: {runner.unsent} líneas en cola sin enviar{rest}; "
+              f"continúa con --resume (checkpoint en la línea {checkpoint.line})")
+    if elapsed > 0:
+        print(f"⏱️  Tiempo: {elapsed:.1f}s ({runner.processed / elapsed:.2f} peticiones/s, "
+              f"{runner.tokens / elapsed:.1f} tokens/s)")
+    print(f"💾 Resultados en {args.output}")
+    if sampler:
+        sampler.stop()
+        sampler.print_summary()
+        sampler.write(args.resources)
+        print(f"🖥️  Muestras de recursos guardadas en {args.resources}")
+    if args.metrics_file:
+        write_metrics(args.metrics_file)
+        print(f"📈 Métricas guardadas en {args.metrics_file}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+Benchmark A/B intercalado entre dos servidores o dos etiquetas de modelo
+Envía el mismo conjunto de prompts a los dos destinos por parejas, en orden aleatorio
+dentro de cada pareja y con los prompts barajados en cada ronda, de modo que la carga
+de la máquina, la temperatura o cualquier otro ruido ambiental afecte por igual a A y B.
+Las diferencias de latencia, TTFT y tokens/s se calculan sobre las parejas con
+intervalos de confianza bootstrap y se da un veredicto sobre si B es más rápido.
+
+Uso: python benchmark_ab.py --model-a deepseek-r1:7b --model-b deepseek-r1:7b-qwen-distill-q8_0
+     python benchmark_ab.py --model-a deepseek-r1:7b --url-a http://localhost:11434 \\
+         --url-b http://localhost:11435 [--rounds 10] [--prompts coding reasoning]
+"""
+
+import argparse
+import json
+import random
+import statistics
+import sys
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import requests
+
+# Importar utilidades comunes
+try:
+    from ollama_test_utils import (
+        budget_exhausted,
+        format_error,
+        generate_stream,
+        set_budget,
+        DEADLINE_ERROR,
+        EXAMPLE_PROMPTS,
+        MODEL_TESTS
+    )
+    from ollama_client import DEFAULT_BASE_URL, OllamaClient
+    from benchmark_load import resolve_prompts
+except ImportError as e:
+    print(f"❌ Error: No se puede importar {e.name or 'un módulo'}: {e}")
+    print("   Asegúrate de que los scripts de test/ estén en el mismo directorio "
+          "y de haber instalado test/requirements.txt")
+    sys.exit(1)
+
+def tokens_per_second(result: Dict[str, Any]) -> Optional[float]:
+    """Velocidad de generación según las métricas del servidor"""
+    return result["eval_count"] / (result["eval_duration"] / 1e9) if result["eval_duration"] else None
+
+# Métricas comparadas: nombre, forma de obtenerla de un resultado y si mayor es mejor
+COMPARED_METRICS = {
+    "latency": ("Latencia", lambda r: r["wall_time"], False),
+    "ttft": ("TTFT", lambda r: r["ttft"], False),
+    "tps": ("Tokens/s", tokens_per_second, True)
+}
+
+class Target:
+    """Un destino del A/B: servidor y modelo"""
+
+    def __init__(self, label: str, url: str, model: str):
+        self.label = label
+        self.url = url
+        self.model = model
+        self.client = OllamaClient(url)
+        self.version: Optional[str] = None
+
+    def check(self) -> bool:
+        """Comprobar que el servidor responde y guardar su versión"""
+        try:
+            response = self.client.get("/api/version", timeout=5)
+            response.raise_for_status()
+            self.version = response.json().get("version", "unknown")
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"❌ {self.label}: no se puede conectar con {self.url}: {e}")
+            return False
+        print(f"✅ {self.label}: {self.model} en {self.url} (Ollama {self.version})")
+        return True
+
+    def __str__(self) -> str:
+        return f"{self.model} @ {self.url}"
+
+def parse_args() -> argparse.Namespace:
+    """Leer los argumentos de la línea de comandos"""
+    parser = argparse.ArgumentParser(description="Benchmark A/B intercalado")
+    parser.add_argument("--model-a", required=True, help="Modelo de A")
+    parser.add_argument("--model-b", default=None, help="Modelo de B (por defecto: el de A)")
+    parser.add_argument("--url-a", default=DEFAULT_BASE_URL,
+                        help=f"Servidor de A (por defecto: {DEFAULT_BASE_URL})")
+    parser.add_argument("--url-b", default=None, help="Servidor de B (por defecto: el de A)")
+    parser.add_argument("--prompts", nargs="+", choices=sorted(set(MODEL_TESTS) | set(EXAMPLE_PROMPTS)),
+                        default=None,
+                        help="Prompts de MODEL_TESTS/EXAMPLE_PROMPTS (por defecto: todos los "
+                             "de EXAMPLE_PROMPTS)")
+    parser.add_argument("--rounds", type=int, default=10,
+                        help="Rondas; en cada una se envían todos los prompts a A y a B (por defecto: 10)")
+    parser.add_argument("--max-tokens", type=int, default=128,
+                        help="Tokens máximos por respuesta (por defecto: 128)")
+    parser.add_argument("--timeout", type=float, default=300,
+                        help="Timeout por petición en segundos (por defecto: 300)")
+    parser.add_argument("--bootstrap", type=int, default=2000,
+                        help="Remuestreos bootstrap (por defecto: 2000)")
+    parser.add_argument("--confidence", type=float, default=0.95,
+                        help="Nivel de confianza de los intervalos (por defecto: 0.95)")
+    parser.add_argument("--primary", choices=list(COMPARED_METRICS), default="latency",
+                        help="Métrica que decide el veredicto (por defecto: latency)")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Semilla del orden aleatorio y del bootstrap (por defecto: 0)")
+    parser.add_argument("--budget", type=float, default=None,
+                        help="Tiempo total máximo en segundos: al agotarse se corta la pareja en curso "
+                             "y se analizan las parejas completas")
+    parser.add_argument("--output", type=Path, default=None,
+                        help="Guardar las parejas y el análisis en un fichero JSON")
+    args = parser.parse_args()
+    args.model_b = args.model_b or args.model_a
+    args.url_b = args.url_b or args.url_a
+    if (args.model_a, args.url_a) == (args.model_b, args.url_b):
+        parser.error("A y B son el mismo destino: cambia --model-b o --url-b")
+    if args.rounds < 2:
+        parser.error("--rounds debe ser >= 2")
+    if args.budget is not None and args.budget <= 0:
+        parser.error("--budget debe ser > 0")
+    return args
+
+def run_pairs(a: Target, b: Target, prompts: List[str], args: argparse.Namespace,
+              rng: random.Random) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Ejecutar las rondas y devolver las parejas completas (resultado de A y de B con el mismo
+    prompt, uno justo después del otro) y el número de parejas descartadas por errores.
+    """
+    # Temperatura 0 y semilla fija: los dos destinos reciben exactamente la misma petición
+    options = {"temperature": 0, "seed": 42}
+    pairs, failed = [], 0
+    for round_number in range(args.rounds):
+        order = list(range(len(prompts)))
+        rng.shuffle(order)
+        for index in order:
+            if budget_exhausted():
+                print(f"   ⏳ Presupuesto agotado en la ronda {round_number + 1}: "
+                      f"se analizan las {len(pairs)} parejas completas")
+                return pairs, failed
+            first, second = (a, b) if rng.random() < 0.5 else (b, a)
+            results = {}
+            for target in (first, second):
+                results[target.label] = generate_stream(target.model, prompts[index], args.max_tokens,
+                                                        timeout=args.timeout, options=options,
+                                                        client=target.client)
+            if any(r["error"] == DEADLINE_ERROR for r in results.values()):
+                # La pareja cortada queda incompleta y no se cuenta como fallo
+                continue
+            errors = [f"{label}: {format_error(r)}" for label, r in results.items() if not r["success"]]
+            if errors:
+                failed += 1
+                print(f"   ❌ Ronda {round_number + 1}, prompt {index + 1}: {'; '.join(errors)}")
+                continue
+            pairs.append({"round": round_number, "prompt": index, "first": first.label,
+                          "a": results["A"], "b": results["B"]})
+        print(f"   Ronda {round_number + 1}/{args.rounds}: {len(pairs)} parejas")
+    return pairs, failed
+
+def bootstrap_ci(values_a: List[float], values_b: List[float],
+                 statistic: Callable[[List[float], List[float]], float],
+                 resamples: int, confidence: float, rng: random.Random) -> Tuple[float, float]:
+    """Intervalo bootstrap por percentiles remuestreando parejas (se conserva el emparejamiento)"""
+    n = len(values_a)
+    estimates = []
+    for _ in range(resamples):
+        indices = [rng.randrange(n) for _ in range(n)]
+        estimates.append(statistic([values_a[i] for i in indices], [values_b[i] for i in indices]))
+    estimates.sort()
+    alpha = (1 - confidence) / 2
+    low = estimates[int(alpha * (resamples - 1))]
+    high = estimates[int((1 - alpha) * (resamples - 1))]
+    return low, high
+
+def relative_change(values_a: List[float], values_b: List[float]) -> float:
+    """Cambio relativo de la media de B respecto a la de A"""
+    mean_a = statistics.mean(values_a)
+    return statistics.mean(values_b) / mean_a - 1 if mean_a else 0.0
+
+def analyze(pairs: List[Dict[str, Any]], args: argparse.Namespace,
+            rng: random.Random) -> Dict[str, Dict[str, Any]]:
+    """Media de A y B, cambio relativo con su intervalo y veredicto de cada métrica"""
+    analysis = {}
+    for key, (name, extract, higher_is_better) in COMPARED_METRICS.items():
+        values = [(extract(p["a"]), extract(p["b"])) for p in pairs]
+        values = [(va, vb) for va, vb in values if va is not None and vb is not None]
+        if len(values) < 2:
+            continue
+        values_a = [va for va, _ in values]
+        values_b = [vb for _, vb in values]
+        change = relative_change(values_a, values_b)
+        low, high = bootstrap_ci(values_a, values_b, relative_change, args.bootstrap, args.confidence, rng)
+        # B es mejor si todo el intervalo cae del lado bueno
+        if (low > 0 and higher_is_better) or (high < 0 and not higher_is_better):
+            verdict = "B mejor"
+        elif (high < 0 and higher_is_better) or (low > 0 and not higher_is_better):
+            verdict = "B peor"
+        else:
+            verdict = "sin diferencia"
+        analysis[key] = {
+            "name": name,
+            "n": len(values),
+            "mean_a": statistics.mean(values_a),
+            "mean_b": statistics.mean(values_b),
+            "change": change,
+            "ci": [low, high],
+            "verdict": verdict
+        }
+    return analysis
+
+def print_report(a: Target, b: Target, analysis: Dict[str, Dict[str, Any]],
+                 pairs: List[Dict[str, Any]], failed: int, args: argparse.Namespace) -> None:
+    """Tabla de diferencias y veredicto"""
+    print("\n" + "=" * 80)
+    print("📊 RESULTADO A/B")
+    print("=" * 80)
+    print(f"A: {a} (Ollama {a.version})")
+    print(f"B: {b} (Ollama {b.version})")
+    print(f"{len(pairs)} parejas ({failed} descartadas por errores), "
+          f"intervalos al {args.confidence * 100:.0f}% con {args.bootstrap} remuestreos")
+    print(f"\n{'Métrica':<12}{'A':>10}{'B':>10}{'Cambio':>10}{'Intervalo':>22}   Veredicto")
+    for item in analysis.values():
+        unit = "" if item["name"] == "Tokens/s" else "s"
+        ci = f"[{item['ci'][0] * 100:+.1f}%, {item['ci'][1] * 100:+.1f}%]"
+        print(f"{item['name']:<12}{item['mean_a']:>9.2f}{unit or ' '}{item['mean_b']:>9.2f}{unit or ' '}"
+              f"{item['change'] * 100:>+9.1f}%{ci:>22}   {item['verdict']}")
+
+    tokens_a = statistics.mean(p["a"]["eval_count"] for p in pairs)
+    tokens_b = statistics.mean(p["b"]["eval_count"] for p in pairs)
+    if abs(tokens_b - tokens_a) > 0.1 * max(tokens_a, 1):
+        print(f"\n⚠️  A genera {tokens_a:.0f} tokens de media y B {tokens_b:.0f}: la latencia total no es "
+              f"comparable, fíjate en TTFT y tokens/s")
+
+    primary = analysis.get(args.primary)
+    if primary is None:
+        print("\n❓ No hay datos suficientes para dar un veredicto")
+        return
+    change = abs(primary["change"]) * 100
+    if primary["verdict"] == "B mejor":
+        print(f"\n🏆 B es más rápido que A en {primary['name'].lower()}: {change:.1f}% "
+              f"(intervalo {primary['ci'][0] * 100:+.1f}% a {primary['ci'][1] * 100:+.1f}%)")
+    elif primary["verdict"] == "B peor":
+        print(f"\n🐢 B es más lento que A en {primary['name'].lower()}: {change:.1f}% "
+              f"(intervalo {primary['ci'][0] * 100:+.1f}% a {primary['ci'][1] * 100:+.1f}%)")
+    else:
+        print(f"\n🤝 Sin diferencia significativa en {primary['name'].lower()}: el intervalo "
+              f"{primary['ci'][0] * 100:+.1f}% a {primary['ci'][1] * 100:+.1f}% incluye el 0; "
+              f"aumenta --rounds para afinar")
+
+def main():
+    """Función principal"""
+    args = parse_args()
+
+    print("⚖️  Benchmark A/B Intercalado")
+    print("=" * 50)
+
+    a = Target("A", args.url_a, args.model_a)
+    b = Target("B", args.url_b, args.model_b)
+    if not (a.check() and b.check()):
+        return
+    prompts = resolve_prompts(args.model_a, args.prompts or list(EXAMPLE_PROMPTS))
+    rng = random.Random(args.seed)
+
+    if args.budget:
+        set_budget(args.budget)
+    # La carga de los modelos no debe contar en la primera pareja
+    for target in (a, b):
+        warmup = generate_stream(target.model, prompts[0], 8, timeout=args.timeout, client=target.client)
+        if not warmup["success"]:
+            print(f"❌ No se pudo preparar {target.label} ({target}): {format_error(warmup)}")
+            return
+    print(f"🔀 {args.rounds} rondas de {len(prompts)} prompts, orden aleatorio en cada pareja")
+
+    pairs, failed = run_pairs(a, b, prompts, args, rng)
+    if len(pairs) < 2:
+        print("📋 No hay parejas suficientes para comparar")
+        return
+    analysis = analyze(pairs, args, rng)
+    print_report(a, b, analysis, pairs, failed, args)
+
+    if args.output:
+        data = {
+            "a": {"url": a.url, "model": a.model, "version": a.version},
+            "b": {"url": b.url, "model": b.model, "version": b.version},
+            "analysis": analysis,
+            "pairs": [{**p, "a": {k: v for k, v in p["a"].items() if k not in ("response", "token_gaps")},
+                       "b": {k: v for k, v in p["b"].items() if k not in ("response", "token_gaps")}}
+                      for p in pairs]
+        }
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps(data, indent=2, ensure_ascii=False), encoding="utf-8")
+        print(f"💾 Resultados guardados en {args.output}")
+
+if __name__ == "__main__":
+    main()
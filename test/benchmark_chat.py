@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Benchmark de conversaciones de varios turnos y reutilización de la caché del prompt
+Mantiene sesiones de N turnos y mide cómo crecen prompt_eval_count y prompt_eval_duration
+en cada turno según cómo se envía el historial:
+
+  history  /api/chat reenviando todos los mensajes; el servidor reutiliza el prefijo en caché
+  context  /api/generate devolviendo el array 'context' de la respuesta anterior
+  fresh    /api/chat con el mismo historial, pero cambiando el primer mensaje en cada turno
+           para que no haya prefijo reutilizable (referencia sin caché)
+
+Con --budget se corta el turno en curso al agotarse el tiempo y se promedian los turnos completos.
+
+Uso: python benchmark_chat.py --model deepseek-r1:1.5b [--turns 6] [--sessions 2] [--modes history fresh]
+"""
+
+import argparse
+import sys
+import uuid
+from typing import Any, Dict, List, Tuple
+
+# Importar utilidades comunes
+try:
+    from ollama_test_utils import (
+        check_ollama_status,
+        chat_stream,
+        format_error,
+        generate_stream,
+        load_model,
+        set_budget,
+        budget_exhausted,
+        DEADLINE_ERROR,
+        EXAMPLE_PROMPTS
+    )
+except ImportError as e:
+    print(f"❌ Error: No se puede importar {e.name or 'un módulo'}: {e}")
+    print("   Asegúrate de que los scripts de test/ estén en el mismo directorio "
+          "y de haber instalado test/requirements.txt")
+    sys.exit(1)
+
+MODES = ["history", "context", "fresh"]
+
+# Preguntas de seguimiento que se encadenan tras el primer prompt
+FOLLOW_UPS = [
+    "Explícalo con más detalle.",
+    "Dame un ejemplo concreto.",
+    "¿Qué ventajas e inconvenientes tiene?",
+    "Compáralo con una alternativa.",
+    "Resume todo lo anterior en tres puntos.",
+    "¿Qué errores comunes se cometen?",
+    "¿Cómo lo explicarías a un principiante?"
+]
+
+def parse_args() -> argparse.Namespace:
+    """Leer los argumentos de la línea de comandos"""
+    parser = argparse.ArgumentParser(description="Benchmark de conversaciones de varios turnos")
+    parser.add_argument("--model", required=True, help="Modelo a probar (p. ej. deepseek-r1:1.5b)")
+    parser.add_argument("--turns", type=int, default=6,
+                        help="Turnos por conversación (por defecto: 6)")
+    parser.add_argument("--sessions", type=int, default=2,
+                        help="Conversaciones por modo; se promedian por turno (por defecto: 2)")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=MODES,
+                        help="Formas de enviar el historial a comparar (por defecto: todas)")
+    parser.add_argument("--max-tokens", type=int, default=128,
+                        help="Tokens máximos por respuesta (por defecto: 128)")
+    parser.add_argument("--timeout", type=float, default=180,
+                        help="Timeout por petición en segundos (por defecto: 180)")
+    parser.add_argument("--budget", type=float, default=None,
+                        help="Tiempo total máximo en segundos: al agotarse se corta el turno en curso "
+                             "y las conversaciones que falten quedan sin hacer")
+    args = parser.parse_args()
+    if args.turns < 1 or args.sessions < 1:
+        parser.error("--turns y --sessions deben ser >= 1")
+    if args.budget is not None and args.budget <= 0:
+        parser.error("--budget debe ser > 0")
+    return args
+
+def user_prompt(turn: int) -> str:
+    """Mensaje del usuario en un turno"""
+    if turn == 0:
+        return EXAMPLE_PROMPTS["general"]
+    return FOLLOW_UPS[(turn - 1) % len(FOLLOW_UPS)]
+
+def run_session(model_name: str, mode: str, turns: int, max_tokens: int,
+                timeout: float) -> Tuple[List[Dict[str, Any]], bool]:
+    """
+    Mantener una conversación y devolver el resultado de cada turno completo y si el
+    presupuesto la cortó. Cada sesión empieza con un identificador propio para no
+    aprovechar la caché de otra.
+    """
+    session = f"Sesión {uuid.uuid4().hex[:8]}"
+    messages: List[Dict[str, str]] = []
+    context: List[int] = []
+    results = []
+    for turn in range(turns):
+        prompt = user_prompt(turn)
+        if mode == "context":
+            text = f"[{session}] {prompt}" if turn == 0 else prompt
+            result = generate_stream(model_name, text, max_tokens, timeout=timeout, context=context)
+        else:
+            messages.append({"role": "user", "content": prompt})
+            # En modo fresh el primer mensaje cambia en cada turno e invalida el prefijo en caché
+            system = f"{session}, turno {turn}" if mode == "fresh" else session
+            result = chat_stream(model_name, [{"role": "system", "content": system}] + messages,
+                                 max_tokens, timeout=timeout)
+        if result["error"] == DEADLINE_ERROR:
+            # Un turno cortado no mide nada comparable: se descarta
+            print(f"   ⏳ {mode}, turno {turn + 1}: {format_error(result)}")
+            return results, True
+        if not result["success"]:
+            print(f"   ❌ {mode}, turno {turn + 1}: {format_error(result)}")
+            break
+        results.append(result)
+        if mode == "context":
+            context = result["context"]
+        else:
+            messages.append({"role": "assistant", "content": result["response"]})
+    return results, False
+
+def average_by_turn(sessions: List[List[Dict[str, Any]]], turns: int) -> List[Dict[str, float]]:
+    """Promediar las métricas de cada turno entre sesiones"""
+    rows = []
+    for turn in range(turns):
+        results = [session[turn] for session in sessions if len(session) > turn]
+        if not results:
+            break
+        n = len(results)
+        rows.append({
+            "turn": turn + 1,
+            "prompt_tokens": sum(r["prompt_eval_count"] for r in results) / n,
+            "prompt_time": sum(r["prompt_eval_duration"] for r in results) / n / 1e9,
+            "ttft": sum(r["ttft"] or r["wall_time"] for r in results) / n,
+            "total": sum(r["wall_time"] for r in results) / n
+        })
+    return rows
+
+def print_mode(mode: str, rows: List[Dict[str, float]]) -> None:
+    """Tabla por turno de un modo"""
+    print(f"\n💬 {mode}")
+    print(f"{'Turno':>7}{'Tokens evaluados':>18}{'Eval. prompt':>14}{'TTFT':>9}{'Total':>9}")
+    for row in rows:
+        print(f"{row['turn']:>7}{row['prompt_tokens']:>18.0f}{row['prompt_time'] * 1000:>12.0f}ms"
+              f"{row['ttft']:>8.2f}s{row['total']:>8.2f}s")
+
+def print_comparison(table: Dict[str, List[Dict[str, float]]]) -> None:
+    """Comparar el último turno común de cada modo con la referencia sin caché"""
+    if "fresh" not in table or len(table) < 2:
+        return
+    last = min(len(rows) for rows in table.values())
+    if last == 0:
+        return
+    baseline = table["fresh"][last - 1]
+    print(f"\n⚡ Turno {last} frente a reenviar el historial sin caché "
+          f"({baseline['prompt_tokens']:.0f} tokens, {baseline['prompt_time'] * 1000:.0f}ms):")
+    for mode, rows in table.items():
+        if mode == "fresh":
+            continue
+        row = rows[last - 1]
+        saved = baseline["prompt_time"] - row["prompt_time"]
+        print(f"   • {mode}: {row['prompt_tokens']:.0f} tokens evaluados, "
+              f"{saved * 1000:.0f}ms menos de evaluación, TTFT {row['ttft']:.2f}s frente a {baseline['ttft']:.2f}s")
+
+def main():
+    """Función principal"""
+    args = parse_args()
+
+    print("💬 Benchmark de Conversaciones")
+    print("=" * 50)
+
+    if not check_ollama_status():
+        return
+
+    if args.budget:
+        set_budget(args.budget)
+    # La carga del modelo no debe contar en el primer turno de la primera sesión
+    loaded = load_model(args.model)
+    if not loaded["success"]:
+        print(f"❌ No se pudo cargar {args.model}: {format_error(loaded)}")
+        return
+
+    table = {}
+    cut = 0  # conversaciones cortadas por el presupuesto de tiempo
+    untested = 0  # conversaciones sin empezar
+    for mode in args.modes:
+        if budget_exhausted():
+            untested += args.sessions
+            continue
+        print(f"🔄 {mode}: {args.sessions} conversaciones de {args.turns} turnos")
+        sessions = []
+        for _ in range(args.sessions):
+            if budget_exhausted():
+                untested += 1
+                continue
+            results, was_cut = run_session(args.model, mode, args.turns, args.max_tokens, args.timeout)
+            sessions.append(results)
+            cut += was_cut
+        rows = average_by_turn(sessions, args.turns)
+        if rows:
+            table[mode] = rows
+
+    print("\n" + "=" * 50)
+    print("📊 COSTE DEL HISTORIAL POR TURNO")
+    print("=" * 50)
+    for mode, rows in table.items():
+        print_mode(mode, rows)
+    print_comparison(table)
+    if cut or untested:
+        budget = f" de {args.budget:g}s" if args.budget else ""
+        print(f"\n⏳ Presupuesto{budget} agotado: {cut} conversaciones cortadas, {untested} sin empezar")
+        missing = [mode for mode in args.modes if mode not in table]
+        if missing:
+            print(f"   Modos sin medir: {', '.join(missing)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+Latencia en frío frente a en caliente y precarga de modelos
+Uso: python benchmark_coldstart.py measure [--models M ...] [--warm 3] [--budget 600]
+     python benchmark_coldstart.py preload [--models M ...] [--keep-alive 30m]
+
+measure  Descarga cada modelo, mide la primera petición (con la carga incluida)
+         y la repite con el modelo ya residente; con --budget los modelos que no
+         da tiempo a medir quedan sin probar
+preload  Carga los modelos con el keep_alive indicado y comprueba en /api/ps
+         que siguen en memoria
+"""
+
+import argparse
+import sys
+import time
+from typing import List, Dict, Any, Optional
+
+# Importar utilidades comunes
+try:
+    from ollama_test_utils import (
+        check_ollama_status,
+        categorize_model,
+        generate_stream,
+        get_available_models,
+        get_loaded_models,
+        latency_summary,
+        load_model,
+        unload_model,
+        format_error,
+        set_budget,
+        budget_exhausted,
+        DEADLINE_ERROR,
+        AVAILABLE_MODELS,
+        MODEL_TESTS,
+        EXAMPLE_PROMPTS
+    )
+except ImportError as e:
+    print(f"❌ Error: No se puede importar {e.name or 'un módulo'}: {e}")
+    print("   Asegúrate de que los scripts de test/ estén en el mismo directorio "
+          "y de haber instalado test/requirements.txt")
+    sys.exit(1)
+
+def parse_args() -> argparse.Namespace:
+    """Leer los argumentos de la línea de comandos"""
+    parser = argparse.ArgumentParser(description="Latencia en frío/caliente y precarga de modelos")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    measure = commands.add_parser("measure", help="Medir la latencia en frío y en caliente")
+    measure.add_argument("--models", nargs="+", default=None,
+                         help="Modelos (clave de AVAILABLE_MODELS o nombre); por defecto, "
+                              "los de AVAILABLE_MODELS que estén descargados")
+    measure.add_argument("--warm", type=int, default=3,
+                         help="Repeticiones en caliente por modelo (por defecto: 3)")
+    measure.add_argument("--max-tokens", type=int, default=64,
+                         help="Tokens máximos por respuesta (por defecto: 64)")
+    measure.add_argument("--budget", type=float, default=None,
+                         help="Tiempo total máximo en segundos: al agotarse se corta la petición en curso "
+                              "y los modelos que falten quedan sin medir")
+
+    preload = commands.add_parser("preload", help="Precargar modelos con keep_alive")
+    preload.add_argument("--models", nargs="+", default=None,
+                         help="Modelos (clave de AVAILABLE_MODELS o nombre); por defecto, "
+                              "los de AVAILABLE_MODELS que estén descargados")
+    preload.add_argument("--keep-alive", default="30m",
+                         help="Tiempo que el modelo debe seguir residente, p. ej. 30m, 2h o -1 "
+                              "para siempre (por defecto: 30m)")
+    args = parser.parse_args()
+    if getattr(args, "budget", None) is not None and args.budget <= 0:
+        parser.error("--budget debe ser > 0")
+    return args
+
+def resolve_models(names: Optional[List[str]]) -> List[str]:
+    """Traducir claves de AVAILABLE_MODELS y quedarse con los modelos descargados"""
+    downloaded = get_available_models()
+    if names:
+        models = [AVAILABLE_MODELS.get(name, name) for name in names]
+    else:
+        models = list(AVAILABLE_MODELS.values())
+    # /api/tags añade ':latest' a los modelos sin etiqueta
+    resolved = []
+    for model in models:
+        if model in downloaded:
+            resolved.append(model)
+        elif f"{model}:latest" in downloaded:
+            resolved.append(f"{model}:latest")
+        elif names:
+            print(f"⚠️  Modelo '{model}' no está descargado")
+    return resolved
+
+def pick_prompt(model_name: str) -> str:
+    """Prompt de MODEL_TESTS según la categoría del modelo"""
+    category = categorize_model(model_name)
+    if category in MODEL_TESTS:
+        return MODEL_TESTS[category]["prompt"]
+    return EXAMPLE_PROMPTS["general"]
+
+def first_response(result: Dict[str, Any]) -> float:
+    """Tiempo hasta el primer token, o hasta el final si la respuesta vino vacía"""
+    return result["ttft"] if result["ttft"] is not None else result["wall_time"]
+
+def measure_model(model_name: str, warm: int, max_tokens: int) -> Optional[Dict[str, Any]]:
+    """Medir una petición en frío y 'warm' peticiones en caliente sobre un modelo"""
+    print(f"\n🧊 {model_name}")
+    if not unload_model(model_name):
+        print("   ❌ No se pudo descargar el modelo de memoria")
+        return None
+
+    prompt = pick_prompt(model_name)
+    cold = generate_stream(model_name, prompt, max_tokens)
+    if cold["error"] == DEADLINE_ERROR:
+        print(f"   ⏳ En frío: {format_error(cold)}")
+        return None
+    if not cold["success"]:
+        print(f"   ❌ Error en frío: {format_error(cold)}")
+        return None
+    print(f"   Frío:     carga {cold['load_duration'] / 1e9:.2f}s, primer token {first_response(cold):.2f}s, "
+          f"total {cold['wall_time']:.2f}s")
+
+    warm_results = []
+    for _ in range(warm):
+        result = generate_stream(model_name, prompt, max_tokens)
+        if result["error"] == DEADLINE_ERROR:
+            # Una petición cortada no mide nada comparable: se descarta
+            print(f"   ⏳ En caliente: {format_error(result)}")
+            break
+        if result["success"]:
+            warm_results.append(result)
+    if not warm_results:
+        if not budget_exhausted():
+            print("   ❌ Fallaron todas las peticiones en caliente")
+        return None
+    warm_ttft = latency_summary([first_response(r) for r in warm_results])["p50"]
+    warm_load = latency_summary([r["load_duration"] / 1e9 for r in warm_results])["p50"]
+    warm_total = latency_summary([r["wall_time"] for r in warm_results])["p50"]
+    print(f"   Caliente: carga {warm_load:.2f}s, primer token {warm_ttft:.2f}s, total {warm_total:.2f}s "
+          f"(mediana de {len(warm_results)})")
+
+    return {
+        "model": model_name,
+        "cold_load": cold["load_duration"] / 1e9,
+        "cold_ttft": first_response(cold),
+        "warm_load": warm_load,
+        "warm_ttft": warm_ttft
+    }
+
+def run_measure(args: argparse.Namespace) -> None:
+    """Modo measure: tabla de latencia en frío/caliente por modelo"""
+    models = resolve_models(args.models)
+    if not models:
+        print("📋 No hay modelos disponibles")
+        return
+
+    if args.budget:
+        set_budget(args.budget)
+    rows = []
+    untested = []  # sin medir por el presupuesto de tiempo
+    for model_name in models:
+        if budget_exhausted():
+            untested.append(model_name)
+            continue
+        row = measure_model(model_name, args.warm, args.max_tokens)
+        if row:
+            rows.append(row)
+        elif budget_exhausted():
+            untested.append(model_name)
+    if rows:
+        print_table(rows)
+    if untested:
+        print(f"⏳ Sin medir por el presupuesto de {args.budget:g}s: {', '.join(untested)}")
+
+def print_table(rows: List[Dict[str, Any]]) -> None:
+    """Tabla de latencia en frío/caliente y ahorro total de precargar"""
+    print("\n" + "=" * 70)
+    print("📊 FRÍO vs CALIENTE (primer token)")
+    print("=" * 70)
+    print(f"{'Modelo':<36}{'Carga':>8}{'Frío':>9}{'Caliente':>10}{'Ahorro':>9}")
+    for row in rows:
+        saving = row["cold_ttft"] - row["warm_ttft"]
+        print(f"{row['model']:<36}{row['cold_load']:>7.2f}s{row['cold_ttft']:>8.2f}s"
+              f"{row['warm_ttft']:>9.2f}s{saving:>8.2f}s")
+    total_saving = sum(row["cold_ttft"] - row["warm_ttft"] for row in rows)
+    print(f"\n⚡ Precargar estos {len(rows)} modelos ahorra {total_saving:.2f}s "
+          f"en la primera respuesta de cada uno")
+
+def run_preload(args: argparse.Namespace) -> None:
+    """Modo preload: cargar los modelos y comprobar que quedan residentes"""
+    models = resolve_models(args.models)
+    if not models:
+        print("📋 No hay modelos disponibles")
+        return
+
+    # Ollama acepta un número de segundos o una duración ("30m", "2h")
+    keep_alive = int(args.keep_alive) if args.keep_alive.lstrip("-").isdigit() else args.keep_alive
+
+    # Se cargan de uno en uno: cargas simultáneas compiten por disco y memoria
+    for model_name in models:
+        result = load_model(model_name, keep_alive=keep_alive)
+        if result["success"]:
+            print(f"🔥 {model_name} cargado en {result['wall_time']:.2f}s")
+        else:
+            print(f"❌ {model_name}: {format_error(result)}")
+
+    time.sleep(0.5)
+    loaded = get_loaded_models()
+    print("\n📋 Modelos residentes (/api/ps):")
+    resident = 0
+    for model_name in models:
+        info = loaded.get(model_name)
+        if info is None:
+            print(f"   ❌ {model_name} no está en memoria (¿memoria insuficiente?)")
+            continue
+        resident += 1
+        vram_gb = info.get("size_vram", 0) / (1024**3)
+        print(f"   ✅ {model_name} ({vram_gb:.1f}GB en VRAM, expira: {info.get('expires_at', '?')})")
+    print(f"\n🎯 {resident}/{len(models)} modelos residentes con keep_alive={args.keep_alive}")
+
+def main():
+    """Función principal"""
+    args = parse_args()
+
+    print("🧊 Arranque en Frío y Precarga de Modelos")
+    print("=" * 50)
+
+    if not check_ollama_status():
+        return
+
+    if args.command == "measure":
+        run_measure(args)
+    else:
+        run_preload(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+"""
+Benchmark de carga contra un modelo de Ollama
+Uso: python benchmark_load.py --model MODELO --mode closed --users 4 --duration 60
+     python benchmark_load.py --model MODELO --mode open --rps 0.5 --duration 120
+     python benchmark_load.py --model MODELO --mode saturation --duration 30 --slo 20
+
+Modos:
+  closed  N usuarios virtuales concurrentes; cada uno envía la siguiente petición
+          en cuanto recibe la respuesta anterior
+  open    Llegadas de Poisson a una tasa objetivo (peticiones por segundo),
+          independientes de lo que tarde el servidor en responder
+  saturation
+          Modo closed por escalones (1, 2, 4, ... usuarios) hasta que el throughput se
+          estanca o el p95 de latencia supera el SLO; informa del punto de saturación
+          y del OLLAMA_NUM_PARALLEL recomendado
+"""
+
+import argparse
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, List, Dict, Any, Optional
+
+# Importar utilidades comunes
+try:
+    from ollama_test_utils import (
+        check_ollama_status,
+        categorize_model,
+        generate_stream,
+        get_client,
+        get_model_digests,
+        get_ollama_version,
+        latency_summary,
+        load_model,
+        make_client,
+        percentile,
+        set_budget,
+        set_client,
+        set_sampler,
+        budget_exhausted,
+        DEADLINE_ERROR,
+        MODEL_TESTS,
+        EXAMPLE_PROMPTS
+    )
+    from ollama_balancer import BalancedOllamaClient, print_nodes
+    from ollama_metrics import start_metrics_server, write_metrics
+    from resource_sampler import ResourceSampler
+    from results_store import ResultsStore, DEFAULT_RESULTS_PATH
+except ImportError as e:
+    print(f"❌ Error: No se puede importar {e.name or 'un módulo'}: {e}")
+    print("   Asegúrate de que los scripts de test/ estén en el mismo directorio "
+          "y de haber instalado test/requirements.txt")
+    sys.exit(1)
+
+def parse_args() -> argparse.Namespace:
+    """Leer los argumentos de la línea de comandos"""
+    prompt_keys = sorted(set(MODEL_TESTS) | set(EXAMPLE_PROMPTS))
+    parser = argparse.ArgumentParser(description="Benchmark de carga contra un modelo de Ollama")
+    parser.add_argument("--model", required=True, help="Modelo a probar (p. ej. deepseek-r1:1.5b)")
+    parser.add_argument("--mode", choices=["closed", "open", "saturation"], default="closed",
+                        help="closed: usuarios concurrentes; open: llegadas de Poisson; "
+                             "saturation: subir la concurrencia hasta saturar (por defecto: closed)")
+    parser.add_argument("--users", type=int, default=4,
+                        help="Usuarios virtuales concurrentes en modo closed (por defecto: 4)")
+    parser.add_argument("--rps", type=float, default=0.5,
+                        help="Peticiones por segundo objetivo en modo open (por defecto: 0.5)")
+    parser.add_argument("--max-inflight", type=int, default=64,
+                        help="Peticiones simultáneas máximas en modo open (por defecto: 64)")
+    parser.add_argument("--duration", type=float, default=60,
+                        help="Duración de la fase de envío en segundos; en modo saturation, "
+                             "la de cada escalón (por defecto: 60)")
+    parser.add_argument("--max-users", type=int, default=64,
+                        help="Concurrencia máxima a probar en modo saturation (por defecto: 64)")
+    parser.add_argument("--slo", type=float, default=None,
+                        help="Latencia p95 máxima aceptable en segundos (modo saturation)")
+    parser.add_argument("--plateau", type=float, default=0.1,
+                        help="Mejora relativa mínima de tokens/s para seguir subiendo en modo "
+                             "saturation (por defecto: 0.1 = 10%%)")
+    parser.add_argument("--requests", type=int, default=None,
+                        help="Detener tras este número de peticiones (opcional)")
+    parser.add_argument("--prompts", nargs="+", choices=prompt_keys, default=None,
+                        help="Prompts de MODEL_TESTS/EXAMPLE_PROMPTS a usar en rotación "
+                             "(por defecto: el de la categoría del modelo)")
+    parser.add_argument("--max-tokens", type=int, default=300,
+                        help="Tokens máximos por respuesta (por defecto: 300)")
+    parser.add_argument("--timeout", type=float, default=180,
+                        help="Timeout de lectura por petición en segundos (por defecto: 180)")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="Semilla para las llegadas de Poisson")
+    parser.add_argument("--results", type=Path, default=DEFAULT_RESULTS_PATH,
+                        help=f"Fichero donde guardar las métricas (por defecto: {DEFAULT_RESULTS_PATH})")
+    parser.add_argument("--no-save", action="store_true",
+                        help="No guardar las métricas de esta ejecución")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="Exponer métricas Prometheus en http://localhost:PUERTO/metrics")
+    parser.add_argument("--metrics-file", type=Path, default=None,
+                        help="Volcar las métricas en formato OpenMetrics a este fichero al terminar")
+    parser.add_argument("--resources", type=Path, default=None,
+                        help="Muestrear CPU y memoria de Ollama y guardar en este fichero JSON "
+                             "las muestras alineadas con cada petición")
+    parser.add_argument("--resource-interval", type=float, default=1.0,
+                        help="Segundos entre muestras de recursos (por defecto: 1)")
+    parser.add_argument("--budget", type=float, default=None,
+                        help="Tiempo total máximo en segundos, peticiones en curso incluidas: "
+                             "al agotarse se cortan y no se envían más")
+    args = parser.parse_args()
+    if args.users < 1 or args.rps <= 0 or args.max_inflight < 1 or args.duration <= 0 or args.max_users < 1:
+        parser.error("--users, --rps, --max-inflight, --max-users y --duration deben ser positivos")
+    if args.budget is not None and args.budget <= 0:
+        parser.error("--budget debe ser > 0")
+    return args
+
+def resolve_prompts(model_name: str, keys: Optional[List[str]]) -> List[str]:
+    """Obtener los textos de los prompts a partir de sus nombres en MODEL_TESTS/EXAMPLE_PROMPTS"""
+    if not keys:
+        category = categorize_model(model_name)
+        keys = [category if category in MODEL_TESTS else "general"]
+    prompts = []
+    for key in keys:
+        if key in MODEL_TESTS:
+            prompts.append(MODEL_TESTS[key]["prompt"])
+        else:
+            prompts.append(EXAMPLE_PROMPTS[key])
+    return prompts
+
+class LoadRun:
+    """Estado compartido de una ejecución: prompts en rotación, límite de peticiones y resultados"""
+
+    def __init__(self, model_name: str, prompts: List[str], max_tokens: int, timeout: float,
+                 max_requests: Optional[int],
+                 on_result: Optional[Callable[[Dict[str, Any]], None]] = None):
+        self.model_name = model_name
+        self.on_result = on_result
+        self.prompts = prompts
+        self.max_tokens = max_tokens
+        self.timeout = timeout
+        self.max_requests = max_requests
+        self.results: List[Dict[str, Any]] = []
+        self.issued = 0
+        self.lock = threading.Lock()
+
+    def next_prompt(self) -> Optional[str]:
+        """Reservar la siguiente petición; devuelve None si ya se alcanzó el límite"""
+        with self.lock:
+            if self.max_requests is not None and self.issued >= self.max_requests:
+                return None
+            if budget_exhausted():
+                return None
+            prompt = self.prompts[self.issued % len(self.prompts)]
+            self.issued += 1
+            return prompt
+
+    def execute(self, prompt: str, scheduled_time: float) -> None:
+        """Enviar una petición y guardar sus métricas junto con el retraso de cola del cliente"""
+        dispatch_time = time.time()
+        result = generate_stream(self.model_name, prompt, self.max_tokens, timeout=self.timeout)
+        if result.get("skipped"):
+            # Esperaba en la cola del pool cuando se agotó el presupuesto: nunca se envió
+            return
+        result["queue_delay"] = dispatch_time - scheduled_time
+        if result["success"]:
+            # Lo que no explica total_duration lo ha pasado esperando un hueco en el servidor
+            result["server_queue"] = max(0.0, result["wall_time"] - result["total_duration"] / 1e9)
+        result["category"] = categorize_model(self.model_name)
+        if self.on_result:
+            self.on_result(result)
+        with self.lock:
+            self.results.append(result)
+
+def run_closed_loop(run: LoadRun, users: int, duration: float) -> float:
+    """N usuarios concurrentes enviando peticiones una tras otra; devuelve el tiempo transcurrido"""
+    start_time = time.time()
+    end_time = start_time + duration
+
+    def user_loop() -> None:
+        while time.time() < end_time:
+            prompt = run.next_prompt()
+            if prompt is None:
+                return
+            run.execute(prompt, time.time())
+
+    threads = [threading.Thread(target=user_loop, daemon=True) for _ in range(users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.time() - start_time
+
+def run_open_loop(run: LoadRun, rps: float, duration: float, max_inflight: int,
+                  seed: Optional[int] = None) -> float:
+    """Llegadas de Poisson a 'rps' peticiones por segundo; devuelve el tiempo transcurrido"""
+    rng = random.Random(seed)
+    start_time = time.time()
+    end_time = start_time + duration
+    with ThreadPoolExecutor(max_workers=max_inflight) as executor:
+        next_arrival = start_time
+        while True:
+            next_arrival += rng.expovariate(rps)
+            if next_arrival >= end_time:
+                break
+            time.sleep(max(0.0, next_arrival - time.time()))
+            prompt = run.next_prompt()
+            if prompt is None:
+                break
+            # Si todos los workers están ocupados la petición espera en la cola del pool
+            executor.submit(run.execute, prompt, next_arrival)
+    return time.time() - start_time
+
+def summarize(results: List[Dict[str, Any]], elapsed: float) -> Dict[str, Any]:
+    """Calcular percentiles, throughput y tasas de error de una ejecución"""
+    # Las respuestas de la caché no miden al servidor
+    ok = [r for r in results if r["success"] and not r["cached"]]
+    timeouts = [r for r in results if r["error"] == "timeout"]
+    cut = [r for r in results if r["error"] == DEADLINE_ERROR]
+    errors = [r for r in results if not r["success"] and r["error"] not in ("timeout", DEADLINE_ERROR)]
+    total = len(results)
+    tokens = sum(r["eval_count"] for r in ok)
+    return {
+        "requests": total,
+        "successful": len(ok),
+        "elapsed": elapsed,
+        "throughput_rps": len(ok) / elapsed if elapsed > 0 else 0.0,
+        "tokens_per_second": tokens / elapsed if elapsed > 0 else 0.0,
+        "error_rate": len(errors) / total if total else 0.0,
+        "timeout_rate": len(timeouts) / total if total else 0.0,
+        # Cortadas al agotarse --budget: cuentan aparte y con los tokens que llegaron a recibir
+        "cut": len(cut),
+        "cut_tokens": sum(r.get("partial_tokens", 0) for r in cut),
+        "latency": latency_summary([r["wall_time"] for r in ok]),
+        "ttft": latency_summary([r["ttft"] for r in ok if r["ttft"] is not None]),
+        "queue_delay": latency_summary([r["queue_delay"] for r in results]),
+        "server_queue": latency_summary([r["server_queue"] for r in ok])
+    }
+
+def print_report(summary: Dict[str, Any]) -> None:
+    """Mostrar el informe de la ejecución"""
+    def row(label: str, stats: Dict[str, float]) -> None:
+        print(f"   {label:<22} p50 {stats['p50']:7.2f}s   p90 {stats['p90']:7.2f}s   "
+              f"p99 {stats['p99']:7.2f}s   máx {stats['max']:7.2f}s")
+
+    print("\n" + "=" * 50)
+    print("📊 RESULTADOS DE CARGA")
+    print("=" * 50)
+    print(f"📨 Peticiones: {summary['requests']} ({summary['successful']} correctas) "
+          f"en {summary['elapsed']:.1f}s")
+    print(f"🚀 Throughput: {summary['throughput_rps']:.2f} peticiones/s, "
+          f"{summary['tokens_per_second']:.1f} tokens/s agregados")
+    print(f"❌ Errores: {summary['error_rate'] * 100:.1f}%   "
+          f"⏰ Timeouts: {summary['timeout_rate'] * 100:.1f}%")
+    if summary["cut"]:
+        print(f"✂️  {summary['cut']} peticiones cortadas por el presupuesto de tiempo "
+              f"({summary['cut_tokens']} tokens recibidos, fuera de las latencias)")
+    print("⏱️  Latencias:")
+    row("extremo a extremo", summary["latency"])
+    row("primer token (TTFT)", summary["ttft"])
+    row("cola del cliente", summary["queue_delay"])
+    row("cola del servidor", summary["server_queue"])
+
+def run_saturation(model_name: str, prompts: List[str], max_tokens: int, timeout: float,
+                   step_duration: float, max_users: int, slo: Optional[float], plateau: float,
+                   on_result: Optional[Callable[[Dict[str, Any]], None]] = None) -> List[Dict[str, Any]]:
+    """
+    Ejecutar escalones en modo closed duplicando la concurrencia (1, 2, 4, ...) y parar
+    cuando los tokens/s no mejoran al menos 'plateau' o el p95 de latencia supera 'slo'.
+    """
+    steps = []
+    users = 1
+    while users <= max_users:
+        if budget_exhausted():
+            print("   ⏳ Presupuesto de tiempo agotado")
+            break
+        run = LoadRun(model_name, prompts, max_tokens, timeout, None, on_result)
+        elapsed = run_closed_loop(run, users, step_duration)
+        summary = summarize(run.results, elapsed)
+        if budget_exhausted() and summary["cut"]:
+            # Un escalón incompleto no es comparable con los anteriores
+            print(f"   ⏳ Presupuesto agotado durante el escalón de {users} usuarios: se descarta")
+            break
+        latencies = [r["wall_time"] for r in run.results if r["success"]]
+        step = {
+            "users": users,
+            "requests": summary["requests"],
+            "tokens_per_second": summary["tokens_per_second"],
+            "throughput_rps": summary["throughput_rps"],
+            "p95": percentile(latencies, 95) if latencies else float("inf"),
+            "error_rate": summary["error_rate"] + summary["timeout_rate"]
+        }
+        steps.append(step)
+        print(f"   👥 {users:>3} usuarios: {step['tokens_per_second']:7.1f} tokens/s, "
+              f"{step['throughput_rps']:.2f} peticiones/s, p95 {step['p95']:.2f}s, "
+              f"errores {step['error_rate'] * 100:.0f}%")
+
+        if slo is not None and step["p95"] > slo:
+            print(f"   ⛔ p95 por encima del SLO ({slo:.2f}s)")
+            break
+        if len(steps) > 1 and step["tokens_per_second"] < steps[-2]["tokens_per_second"] * (1 + plateau):
+            print(f"   ⛔ El throughput ya no mejora un {plateau * 100:.0f}%")
+            break
+        users *= 2
+    return steps
+
+def find_knee(steps: List[Dict[str, Any]], slo: Optional[float], plateau: float) -> Optional[Dict[str, Any]]:
+    """
+    Punto de saturación: el último escalón que cumple el SLO y aún mejoraba el throughput
+    al menos 'plateau' respecto al anterior. Más concurrencia solo añade cola.
+    """
+    knee = None
+    for step in steps:
+        if step["error_rate"] > 0.5 or (slo is not None and step["p95"] > slo):
+            break
+        if knee is not None and step["tokens_per_second"] < knee["tokens_per_second"] * (1 + plateau):
+            break
+        knee = step
+    return knee
+
+def print_saturation_report(steps: List[Dict[str, Any]], knee: Optional[Dict[str, Any]]) -> None:
+    """Mostrar la tabla de escalones y la recomendación de OLLAMA_NUM_PARALLEL"""
+    print("\n" + "=" * 50)
+    print("📊 BÚSQUEDA DEL PUNTO DE SATURACIÓN")
+    print("=" * 50)
+    print(f"{'Usuarios':>9}{'Tokens/s':>11}{'Pet./s':>9}{'p95':>9}")
+    for step in steps:
+        marker = "  ◀ saturación" if step is knee else ""
+        print(f"{step['users']:>9}{step['tokens_per_second']:>11.1f}{step['throughput_rps']:>9.2f}"
+              f"{step['p95']:>8.2f}s{marker}")
+    if knee is None:
+        print("\n❌ Ni siquiera una petición a la vez cumple el SLO")
+        return
+    print(f"\n🎯 Se sostienen {knee['users']} peticiones simultáneas "
+          f"({knee['tokens_per_second']:.1f} tokens/s, p95 {knee['p95']:.2f}s)")
+    print(f"💡 Recomendación: OLLAMA_NUM_PARALLEL={knee['users']} para el servicio ollama "
+          f"(variable en .env, la lee docker-compose.yml)")
+
+def main():
+    """Función principal"""
+    args = parse_args()
+
+    print("🏋️  Benchmark de Carga de Ollama")
+    print("=" * 50)
+
+    if not check_ollama_status():
+        return
+
+    prompts = resolve_prompts(args.model, args.prompts)
+    pool_size = {"closed": args.users, "open": args.max_inflight, "saturation": args.max_users}[args.mode]
+    set_client(make_client(pool_size=pool_size))
+    if args.metrics_port:
+        start_metrics_server(args.metrics_port)
+        print(f"📈 Métricas en http://localhost:{args.metrics_port}/metrics")
+    sampler = None
+    if args.resources:
+        sampler = ResourceSampler(get_client(), args.resource_interval).start()
+        set_sampler(sampler)
+        print(f"🖥️  Muestreando recursos cada {args.resource_interval:g}s ({sampler.describe()})")
+    on_result = None
+    if not args.no_save:
+        writer = ResultsStore(args.results).start_run(f"benchmark_load:{args.mode}", get_ollama_version(),
+                                                      get_model_digests())
+        on_result = writer.add
+        print(f"💾 Guardando resultados en {args.results} (ejecución {writer.run_id})")
+    if args.budget:
+        set_budget(args.budget)
+        print(f"⏳ Presupuesto de {args.budget:g}s para toda la ejecución")
+
+    if args.mode == "saturation":
+        # Cargar el modelo antes para que el primer escalón no incluya la carga en frío
+        load_model(args.model)
+        print(f"📶 Modo saturation: escalones de {args.duration:.0f}s hasta {args.max_users} usuarios "
+              f"con {args.model}")
+        steps = run_saturation(args.model, prompts, args.max_tokens, args.timeout, args.duration,
+                               args.max_users, args.slo, args.plateau, on_result)
+        print_saturation_report(steps, find_knee(steps, args.slo, args.plateau))
+    else:
+        run = LoadRun(args.model, prompts, args.max_tokens, args.timeout, args.requests, on_result)
+        if args.mode == "closed":
+            print(f"👥 Modo closed: {args.users} usuarios durante {args.duration:.0f}s con {args.model}")
+            elapsed = run_closed_loop(run, args.users, args.duration)
+        else:
+            print(f"📈 Modo open: {args.rps} peticiones/s durante {args.duration:.0f}s con {args.model}")
+            elapsed = run_open_loop(run, args.rps, args.duration, args.max_inflight, args.seed)
+
+        if not run.results:
+            print("📋 No se completó ninguna petición")
+            return
+        print_report(summarize(run.results, elapsed))
+
+    if isinstance(get_client(), BalancedOllamaClient):
+        print_nodes(get_client())
+    if sampler:
+        sampler.stop()
+        sampler.print_summary()
+        sampler.write(args.resources)
+        print(f"🖥️  Muestras de recursos guardadas en {args.resources}")
+    if args.metrics_file:
+        write_metrics(args.metrics_file)
+        print(f"📈 Métricas guardadas en {args.metrics_file}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+Barrido de opciones de generación para encontrar la configuración más rápida por modelo
+Prueba el producto cartesiano de num_ctx, num_batch y num_thread (y de las variantes
+cuantizadas que se pasen como modelos), repite cada punto varias veces y descarta
+pronto los puntos claramente peores que el mejor encontrado hasta el momento.
+Con --budget el barrido se detiene al agotarse el tiempo y lista los puntos sin medir.
+
+Uso: python benchmark_options.py --models deepseek-r1:7b deepseek-r1:7b-qwen-distill-q8_0 \\
+         --num-ctx 2048 4096 --num-batch 128 512 --num-thread auto 4 8 --repeats 5
+"""
+
+import argparse
+import itertools
+import math
+import statistics
+import sys
+from typing import Any, Dict, List, Optional
+
+# Importar utilidades comunes
+try:
+    from ollama_test_utils import (
+        check_ollama_status,
+        categorize_model,
+        format_error,
+        generate_stream,
+        get_available_models,
+        latency_summary,
+        set_budget,
+        budget_exhausted,
+        DEADLINE_ERROR,
+        AVAILABLE_MODELS,
+        MODEL_TESTS,
+        EXAMPLE_PROMPTS
+    )
+except ImportError as e:
+    print(f"❌ Error: No se puede importar {e.name or 'un módulo'}: {e}")
+    print("   Asegúrate de que los scripts de test/ estén en el mismo directorio "
+          "y de haber instalado test/requirements.txt")
+    sys.exit(1)
+
+# Opciones que se barren, en el orden en que aparecen en la tabla
+SWEEP_OPTIONS = ["num_ctx", "num_batch", "num_thread"]
+
+# Valores t de Student (dos colas, 95%) por grados de libertad; a partir de 10, la normal
+T_95 = {1: 12.71, 2: 4.30, 3: 3.18, 4: 2.78, 5: 2.57, 6: 2.45, 7: 2.36, 8: 2.31, 9: 2.26}
+
+def option_value(text: str) -> Optional[int]:
+    """Valor de una opción en la línea de comandos: un entero o 'auto' (lo decide Ollama)"""
+    if text == "auto":
+        return None
+    try:
+        return int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"'{text}' no es un entero ni 'auto'")
+
+def parse_args() -> argparse.Namespace:
+    """Leer los argumentos de la línea de comandos"""
+    parser = argparse.ArgumentParser(description="Barrido de opciones de generación por modelo")
+    parser.add_argument("--models", nargs="+", required=True,
+                        help="Modelos o variantes cuantizadas a comparar (clave de AVAILABLE_MODELS o nombre)")
+    parser.add_argument("--num-ctx", nargs="+", type=option_value, default=[2048, 4096],
+                        help="Valores de num_ctx (por defecto: 2048 4096)")
+    parser.add_argument("--num-batch", nargs="+", type=option_value, default=[None],
+                        help="Valores de num_batch (por defecto: auto)")
+    parser.add_argument("--num-thread", nargs="+", type=option_value, default=[None],
+                        help="Valores de num_thread (por defecto: auto)")
+    parser.add_argument("--repeats", type=int, default=5,
+                        help="Repeticiones por punto (por defecto: 5)")
+    parser.add_argument("--min-repeats", type=int, default=2,
+                        help="Repeticiones antes de poder descartar un punto (por defecto: 2)")
+    parser.add_argument("--max-tokens", type=int, default=128,
+                        help="Tokens máximos por respuesta (por defecto: 128)")
+    parser.add_argument("--timeout", type=float, default=300,
+                        help="Timeout por petición en segundos (por defecto: 300)")
+    parser.add_argument("--budget", type=float, default=None,
+                        help="Tiempo total máximo en segundos: al agotarse se corta la petición en curso "
+                             "y los puntos que falten quedan sin medir")
+    args = parser.parse_args()
+    if args.min_repeats < 2 or args.repeats < args.min_repeats:
+        parser.error("se necesita 2 <= --min-repeats <= --repeats")
+    if args.budget is not None and args.budget <= 0:
+        parser.error("--budget debe ser > 0")
+    return args
+
+def resolve_models(names: List[str]) -> List[str]:
+    """Traducir claves de AVAILABLE_MODELS y quedarse con los modelos descargados"""
+    downloaded = get_available_models()
+    resolved = []
+    for name in names:
+        model = AVAILABLE_MODELS.get(name, name)
+        # /api/tags añade ':latest' a los modelos sin etiqueta
+        if model not in downloaded and f"{model}:latest" in downloaded:
+            model = f"{model}:latest"
+        if model in downloaded:
+            resolved.append(model)
+        else:
+            print(f"⚠️  Modelo '{model}' no está descargado")
+    return resolved
+
+def build_points(models: List[str], args: argparse.Namespace) -> List[Dict[str, Any]]:
+    """Producto cartesiano de modelos y valores de opciones"""
+    points = []
+    for model, *values in itertools.product(models, args.num_ctx, args.num_batch, args.num_thread):
+        points.append({"model": model, "options": dict(zip(SWEEP_OPTIONS, values))})
+    return points
+
+def point_label(point: Dict[str, Any]) -> str:
+    """Descripción corta de un punto del barrido"""
+    values = ", ".join(f"{key}={value if value is not None else 'auto'}"
+                       for key, value in point["options"].items())
+    return f"{point['model']} ({values})"
+
+def confidence_interval(values: List[float]) -> float:
+    """Semiancho del intervalo de confianza al 95% de la media"""
+    if len(values) < 2:
+        return float("inf")
+    t = T_95.get(len(values) - 1, 1.96)
+    return t * statistics.stdev(values) / math.sqrt(len(values))
+
+def tokens_per_second(result: Dict[str, Any]) -> float:
+    """Velocidad de generación según las métricas del servidor"""
+    return result["eval_count"] / (result["eval_duration"] / 1e9) if result["eval_duration"] else 0.0
+
+def run_point(point: Dict[str, Any], prompt: str, args: argparse.Namespace,
+              best: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Medir un punto: una petición de calentamiento (cambiar num_ctx o num_batch recarga el
+    modelo) y hasta 'repeats' peticiones. Tras 'min_repeats' se abandona el punto si su
+    intervalo de tokens/s queda entero por debajo del intervalo del mejor punto del modelo.
+    Si el presupuesto corta una petición, se descarta y el punto se queda con las anteriores.
+    """
+    # Temperatura 0 y semilla fija: todas las configuraciones generan respuestas comparables
+    options = {key: value for key, value in point["options"].items() if value is not None}
+    options.update({"temperature": 0, "seed": 42})
+    point.update({"results": [], "pruned": False, "cut": False, "error": None, "load": 0.0})
+
+    warmup = generate_stream(point["model"], prompt, args.max_tokens, timeout=args.timeout,
+                             options=options)
+    if warmup["error"] == DEADLINE_ERROR:
+        point["cut"] = True
+        return point
+    if not warmup["success"]:
+        point["error"] = format_error(warmup)
+        return point
+    point["load"] = warmup["load_duration"] / 1e9
+
+    for i in range(args.repeats):
+        result = generate_stream(point["model"], prompt, args.max_tokens, timeout=args.timeout,
+                                 options=options)
+        if result["error"] == DEADLINE_ERROR:
+            # Una petición cortada no mide nada comparable
+            point["cut"] = True
+            break
+        if not result["success"]:
+            point["error"] = format_error(result)
+            break
+        point["results"].append(result)
+        if best is not None and i + 1 >= args.min_repeats:
+            speeds = [tokens_per_second(r) for r in point["results"]]
+            upper = statistics.mean(speeds) + confidence_interval(speeds)
+            if upper < best["tps_mean"] - best["tps_ci"]:
+                point["pruned"] = True
+                break
+    summarize_point(point)
+    return point
+
+def summarize_point(point: Dict[str, Any]) -> None:
+    """Añadir al punto la media de tokens/s con su intervalo y las latencias"""
+    speeds = [tokens_per_second(r) for r in point["results"]]
+    point["tps_mean"] = statistics.mean(speeds) if speeds else 0.0
+    point["tps_ci"] = confidence_interval(speeds)
+    point["latency"] = latency_summary([r["wall_time"] for r in point["results"]])
+    point["ttft"] = latency_summary([r["ttft"] for r in point["results"] if r["ttft"] is not None])
+
+def print_ranking(points: List[Dict[str, Any]], untested: List[Dict[str, Any]],
+                  budget: Optional[float]) -> None:
+    """Tabla de configuraciones ordenadas por tokens/s y puntos que el presupuesto dejó sin medir"""
+    measured = sorted((p for p in points if p["results"]), key=lambda p: p["tps_mean"], reverse=True)
+    print("\n" + "=" * 100)
+    print("📊 CONFIGURACIONES ORDENADAS POR TOKENS/S")
+    print("=" * 100)
+    print(f"{'#':>3} {'Modelo':<34}{'num_ctx':>8}{'batch':>7}{'thread':>7}"
+          f"{'Tokens/s':>16}{'Latencia':>10}{'TTFT':>8}{'Carga':>8}{'n':>4}")
+    for rank, point in enumerate(measured, start=1):
+        values = [point["options"][key] for key in SWEEP_OPTIONS]
+        ctx, batch, thread = ("auto" if v is None else str(v) for v in values)
+        ci = f"±{point['tps_ci']:.1f}" if point["tps_ci"] != float("inf") else ""
+        note = "  (descartado)" if point["pruned"] else "  (cortado)" if point["cut"] else ""
+        print(f"{rank:>3} {point['model']:<34}{ctx:>8}{batch:>7}{thread:>7}"
+              f"{point['tps_mean']:>9.1f}{ci:>7}{point['latency']['p50']:>9.2f}s"
+              f"{point['ttft']['p50']:>7.2f}s{point['load']:>7.2f}s{len(point['results']):>4}{note}")
+
+    failed = [p for p in points if p["error"]]
+    for point in failed:
+        print(f"❌ {point_label(point)}: {point['error']}")
+
+    cut = [p for p in points if p["cut"]]
+    if cut or untested:
+        # Un punto cortado conserva las repeticiones completas; sin ninguna, queda sin medir
+        unmeasured = [p for p in cut if not p["results"]] + untested
+        limit = f" de {budget:g}s" if budget else ""
+        print(f"⏳ Presupuesto{limit} agotado: {len(cut)} puntos cortados, "
+              f"{len(unmeasured)} sin medir")
+        for point in unmeasured:
+            print(f"   ⏭️  {point_label(point)}")
+
+    best_by_model: Dict[str, Dict[str, Any]] = {}
+    for point in measured:
+        best_by_model.setdefault(point["model"], point)
+    if best_by_model:
+        print("\n🏆 Mejor configuración por modelo:")
+        for model, point in best_by_model.items():
+            print(f"   • {point_label(point)}: {point['tps_mean']:.1f} tokens/s")
+
+def main():
+    """Función principal"""
+    args = parse_args()
+
+    print("🎛️  Barrido de Opciones de Generación")
+    print("=" * 50)
+
+    if not check_ollama_status():
+        return
+
+    models = resolve_models(args.models)
+    if not models:
+        print("📋 No hay modelos disponibles")
+        return
+
+    points = build_points(models, args)
+    print(f"🔢 {len(points)} configuraciones, hasta {args.repeats} repeticiones cada una")
+
+    if args.budget:
+        set_budget(args.budget)
+    best: Dict[str, Dict[str, Any]] = {}
+    measured = []
+    untested = []  # sin empezar por el presupuesto de tiempo
+    for n, point in enumerate(points, start=1):
+        if budget_exhausted():
+            untested.append(point)
+            continue
+        category = categorize_model(point["model"])
+        prompt = MODEL_TESTS[category]["prompt"] if category in MODEL_TESTS else EXAMPLE_PROMPTS["general"]
+        run_point(point, prompt, args, best.get(point["model"]))
+        measured.append(point)
+        if point["error"] and not point["results"]:
+            print(f"   [{n}/{len(points)}] ❌ {point_label(point)}: {point['error']}")
+            continue
+        if point["cut"] and not point["results"]:
+            print(f"   [{n}/{len(points)}] ⏳ {point_label(point)}: cortado por el presupuesto")
+            continue
+        status = ("descartado" if point["pruned"] else
+                  f"{len(point['results'])} repeticiones" + (", cortado" if point["cut"] else ""))
+        print(f"   [{n}/{len(points)}] {point_label(point)}: {point['tps_mean']:.1f} tokens/s ({status})")
+        current = best.get(point["model"])
+        if not point["pruned"] and not point["cut"] and (current is None or point["tps_mean"] > current["tps_mean"]):
+            best[point["model"]] = point
+
+    print_ranking(measured, untested, args.budget)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Tiempos de la fase de razonamiento de los modelos deepseek-r1
+Separa, según llegan los tokens, el bloque <think>…</think> de la respuesta y mide por
+tamaño de modelo (1.5b … 70b): tokens de razonamiento, momento en que termina el
+razonamiento, tiempo hasta el primer token de la respuesta y tokens/s de la respuesta.
+Con --slo indica el modelo más pequeño cuyo primer token de respuesta llega a tiempo.
+
+Uso: python benchmark_reasoning.py [--models deepseek-r1-1.5b deepseek-r1-7b] [--runs 3]
+     python benchmark_reasoning.py --slo 20 [--min-tps 10] [--output razonamiento.json]
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+# Importar utilidades comunes
+try:
+    from ollama_test_utils import (
+        categorize_model,
+        check_ollama_status,
+        format_error,
+        generate_stream,
+        get_available_models,
+        get_catalog,
+        latency_summary,
+        load_model,
+        set_budget,
+        budget_exhausted,
+        DEADLINE_ERROR,
+        EXAMPLE_PROMPTS,
+        MODEL_TESTS
+    )
+    from benchmark_coldstart import resolve_models
+except ImportError as e:
+    print(f"❌ Error: No se puede importar {e.name or 'un módulo'}: {e}")
+    print("   Asegúrate de que los scripts de test/ estén en el mismo directorio "
+          "y de haber instalado test/requirements.txt")
+    sys.exit(1)
+
+# Por defecto, el prompt de MODEL_TESTS y el de razonamiento de EXAMPLE_PROMPTS
+DEFAULT_PROMPTS = [MODEL_TESTS["deepseek-r1"]["prompt"], EXAMPLE_PROMPTS["reasoning"]]
+
+def parse_args() -> argparse.Namespace:
+    """Leer los argumentos de la línea de comandos"""
+    parser = argparse.ArgumentParser(description="Tiempos de razonamiento y respuesta de deepseek-r1")
+    parser.add_argument("--models", nargs="+", default=None,
+                        help="Modelos (clave de AVAILABLE_MODELS o nombre); por defecto, "
+                             "todos los deepseek-r1 descargados")
+    parser.add_argument("--runs", type=int, default=3,
+                        help="Peticiones por modelo y prompt (por defecto: 3)")
+    parser.add_argument("--prompts", nargs="+", default=None,
+                        help="Claves de EXAMPLE_PROMPTS o textos (por defecto: los de razonamiento)")
+    parser.add_argument("--max-tokens", type=int, default=2048,
+                        help="Tokens máximos por respuesta, razonamiento incluido (por defecto: 2048)")
+    parser.add_argument("--timeout", type=float, default=600,
+                        help="Segundos máximos entre fragmentos (por defecto: 600)")
+    parser.add_argument("--slo", type=float, default=None,
+                        help="Objetivo de tiempo hasta el primer token de la respuesta (p90, segundos)")
+    parser.add_argument("--min-tps", type=float, default=None,
+                        help="Tokens/s mínimos de la respuesta para cumplir el objetivo")
+    parser.add_argument("--budget", type=float, default=None,
+                        help="Tiempo total máximo en segundos: al agotarse se corta la petición en curso "
+                             "y los modelos que falten quedan sin probar")
+    parser.add_argument("--output", type=Path, default=None, help="Guardar el informe en JSON")
+    args = parser.parse_args()
+    if args.runs < 1:
+        parser.error("--runs debe ser >= 1")
+    if args.budget is not None and args.budget <= 0:
+        parser.error("--budget debe ser > 0")
+    return args
+
+def order_by_size(models: List[str]) -> List[str]:
+    """Ordenar de menor a mayor según el tamaño del índice local de modelos"""
+    sizes = get_catalog().sizes()
+    return sorted(models, key=lambda model: (sizes.get(model, 0), model))
+
+def phase_metrics(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Métricas de fase de una petición; sin bloque de razonamiento, todo es respuesta"""
+    if result.get("reasoning"):
+        return result["reasoning"]
+    tps = result["eval_count"] / (result["eval_duration"] / 1e9) if result["eval_duration"] else None
+    return {"reasoning_tokens": 0, "answer_tokens": result["eval_count"], "reasoning_chars": 0,
+            "think_time": 0.0, "answer_ttft": result["ttft"], "answer_tps": tps}
+
+def measure_model(model_name: str, prompts: List[str], args: argparse.Namespace) -> Dict[str, Any]:
+    """Lanzar 'runs' peticiones por prompt a un modelo ya cargado y resumir sus fases"""
+    print(f"\n🧠 {model_name}")
+    phases = []
+    errors = 0
+    cut = False
+    for prompt in prompts:
+        if budget_exhausted():
+            break
+        for run in range(args.runs):
+            result = generate_stream(model_name, prompt, args.max_tokens, timeout=args.timeout)
+            if result["error"] == DEADLINE_ERROR:
+                # Una petición cortada no mide nada comparable: se descarta
+                print(f"   ⏳ {format_error(result)}")
+                cut = True
+                break
+            if not result["success"]:
+                errors += 1
+                print(f"   ❌ {format_error(result)}")
+                continue
+            phase = phase_metrics(result)
+            phases.append(phase)
+            think = f"{phase['think_time']:.2f}s" if phase["think_time"] is not None else "sin terminar"
+            answer = f"{phase['answer_ttft']:.2f}s" if phase["answer_ttft"] is not None else "-"
+            print(f"   {len(phases):>2}. razonamiento {phase['reasoning_tokens']:>5} tokens hasta {think:>12} | "
+                  f"respuesta desde {answer:>8}, {phase['answer_tokens']} tokens")
+
+    def summary(key: str) -> Optional[Dict[str, float]]:
+        values = [p[key] for p in phases if p[key] is not None]
+        return latency_summary(values) if values else None
+
+    return {
+        "model": model_name,
+        "runs": len(phases),
+        "errors": errors,
+        "cut": cut,
+        # El razonamiento no terminó dentro de --max-tokens: no hubo respuesta
+        "truncated": sum(1 for p in phases if p["answer_ttft"] is None),
+        "reasoning_tokens": summary("reasoning_tokens"),
+        "think_time": summary("think_time"),
+        "answer_ttft": summary("answer_ttft"),
+        "answer_tps": summary("answer_tps")
+    }
+
+def meets_slo(report: Dict[str, Any], args: argparse.Namespace) -> bool:
+    """El p90 del primer token de respuesta y la velocidad cumplen el objetivo"""
+    if not report["runs"] or report["truncated"] or report["answer_ttft"] is None:
+        return False
+    if report["answer_ttft"]["p90"] > args.slo:
+        return False
+    if args.min_tps is not None:
+        return report["answer_tps"] is not None and report["answer_tps"]["p50"] >= args.min_tps
+    return True
+
+def print_report(reports: List[Dict[str, Any]], args: argparse.Namespace) -> None:
+    """Tabla por modelo, de menor a mayor, y el modelo recomendado si hay objetivo"""
+    def cell(stats: Optional[Dict[str, float]], key: str, fmt: str) -> str:
+        return format(stats[key], fmt) if stats else "-"
+
+    print("\n" + "=" * 104)
+    print("📊 RAZONAMIENTO Y RESPUESTA POR MODELO (medianas salvo indicación)")
+    print("=" * 104)
+    print(f"{'Modelo':<24}{'n':>4}{'Err':>5}{'Cortadas':>10}{'Tok. razón.':>13}{'Fin razón.':>12}"
+          f"{'1er tok. resp.':>16}{'p90':>9}{'Resp. tok/s':>13}")
+    for report in reports:
+        print(f"{report['model']:<24}{report['runs']:>4}{report['errors']:>5}{report['truncated']:>10}"
+              f"{cell(report['reasoning_tokens'], 'p50', '.0f'):>13}"
+              f"{cell(report['think_time'], 'p50', '.2f'):>11}s"
+              f"{cell(report['answer_ttft'], 'p50', '.2f'):>15}s"
+              f"{cell(report['answer_ttft'], 'p90', '.2f'):>8}s"
+              f"{cell(report['answer_tps'], 'p50', '.1f'):>13}")
+    if any(report["truncated"] for report in reports):
+        print(f"⚠️  Algunas respuestas no pasaron del razonamiento: aumenta --max-tokens (ahora {args.max_tokens})")
+
+    if args.slo is None:
+        return
+    target = f"primer token de respuesta p90 ≤ {args.slo:g}s"
+    if args.min_tps is not None:
+        target += f" y ≥ {args.min_tps:g} tokens/s"
+    passing = [report for report in reports if meets_slo(report, args)]
+    if passing:
+        print(f"\n🎯 Modelo más pequeño que cumple ({target}): {passing[0]['model']}")
+    else:
+        print(f"\n🎯 Ningún modelo cumple ({target})")
+
+def main():
+    """Función principal"""
+    args = parse_args()
+
+    print("🧠 Benchmark de Razonamiento")
+    print("=" * 50)
+    if not check_ollama_status():
+        return
+
+    if args.models:
+        models = resolve_models(args.models)
+    else:
+        models = [model for model in get_available_models() if categorize_model(model) == "deepseek-r1"]
+    if not models:
+        print("❌ No hay modelos deepseek-r1 descargados (./ollama.sh pull deepseek-r1:1.5b)")
+        return
+    models = order_by_size(models)
+    prompts = [EXAMPLE_PROMPTS.get(prompt, prompt) for prompt in args.prompts] if args.prompts else DEFAULT_PROMPTS
+    print(f"📋 {len(models)} modelos, {len(prompts)} prompts x {args.runs} repeticiones, "
+          f"hasta {args.max_tokens} tokens")
+
+    if args.budget:
+        set_budget(args.budget)
+    reports = []
+    untested = []  # sin medir por el presupuesto de tiempo
+    failed = []  # sin ninguna petición correcta por otros errores
+    for model_name in models:
+        if budget_exhausted():
+            untested.append(model_name)
+            continue
+        # La carga no debe contar en el tiempo hasta la respuesta
+        loaded = load_model(model_name)
+        if not loaded["success"]:
+            print(f"\n❌ {model_name}: no se pudo cargar ({format_error(loaded)})")
+            if loaded["error"] == DEADLINE_ERROR or budget_exhausted():
+                untested.append(model_name)
+            else:
+                failed.append(model_name)
+            continue
+        report = measure_model(model_name, prompts, args)
+        if report["runs"]:
+            reports.append(report)
+        elif report["cut"] or budget_exhausted():
+            untested.append(model_name)
+        else:
+            failed.append(model_name)
+
+    print_report(reports, args)
+    if failed:
+        print(f"❌ Sin ninguna respuesta correcta: {', '.join(failed)}")
+    if untested:
+        budget = f" de {args.budget:g}s" if args.budget else ""
+        print(f"⏳ Sin medir por el presupuesto{budget}: {', '.join(untested)}")
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps({"max_tokens": args.max_tokens, "prompts": prompts,
+                                           "models": reports, "untested": untested, "failed": failed},
+                                          ensure_ascii=False, indent=2),
+                               encoding="utf-8")
+        print(f"💾 Informe guardado en {args.output}")
+
+if __name__ == "__main__":
+    main()
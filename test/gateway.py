@@ -0,0 +1,525 @@
+#!/usr/bin/env python3
+"""
+Pasarela local delante de Ollama
+Reenvía toda la API (con streaming) y añade, para las peticiones de inferencia:
+  - Una cola por modelo con prioridades: las peticiones interactivas (Open WebUI, por
+    defecto) pasan antes que las de lotes (cabecera "X-Priority: batch"), y como mucho
+    --concurrency peticiones por modelo llegan a la vez al servidor.
+  - Unión de peticiones idénticas en curso: si llega un /api/generate con el mismo cuerpo
+    que otro que aún no ha terminado, no se envía de nuevo; se le reenvía la misma
+    respuesta (desde el principio) a todos los clientes que la esperan.
+
+El estado se consulta en /gateway/stats (JSON) y /metrics (Prometheus): profundidad de
+cada cola, peticiones en curso y tasa de aciertos de la unión de peticiones.
+
+Uso: python gateway.py [--port 11436] [--upstream http://localhost:11434] [--concurrency 2]
+"""
+
+import argparse
+import hashlib
+import heapq
+import itertools
+import json
+import select
+import socket
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import requests
+
+# Importar utilidades comunes
+try:
+    from ollama_client import DEFAULT_BASE_URL, OllamaClient
+    from ollama_metrics import PROMETHEUS_CONTENT_TYPE
+except ImportError as e:
+    print(f"❌ Error: No se puede importar {e.name or 'un módulo'}: {e}")
+    print("   Asegúrate de que los scripts de test/ estén en el mismo directorio "
+          "y de haber instalado test/requirements.txt")
+    sys.exit(1)
+
+# Prioridades por nombre (menor = antes); se eligen con la cabecera X-Priority
+PRIORITIES = {"interactive": 0, "batch": 1}
+
+# Endpoints que pasan por la cola de su modelo; el resto se reenvía sin más
+QUEUED_PATHS = ("/api/generate", "/api/chat", "/api/embed", "/api/embeddings")
+# Endpoints cuyas peticiones idénticas en curso se unen en una sola
+COALESCED_PATHS = ("/api/generate",)
+
+class QueueTimeout(Exception):
+    """La petición esperó en la cola más de lo permitido"""
+
+class Cancelled(Exception):
+    """Todos los clientes que esperaban la respuesta se desconectaron"""
+
+class ModelQueue:
+    """Cola con prioridades y límite de peticiones simultáneas para un modelo"""
+
+    def __init__(self, concurrency: int):
+        self.concurrency = concurrency
+        self.condition = threading.Condition()
+        self.heap: List[Tuple[int, int]] = []
+        self.sequence = itertools.count()
+        self.active = 0
+        self.served = 0
+        self.waits: List[float] = []
+
+    def enqueue(self, priority: int) -> int:
+        """Ponerse a la cola y devolver el número de turno con el que esperar en wait()"""
+        ticket = next(self.sequence)
+        with self.condition:
+            heapq.heappush(self.heap, (priority, ticket))
+        return ticket
+
+    def promote(self, ticket: int, priority: int) -> None:
+        """Subir de prioridad un turno que aún espera (p. ej. una petición interactiva se une a un lote)"""
+        with self.condition:
+            for index, (current, queued) in enumerate(self.heap):
+                if queued == ticket and priority < current:
+                    self.heap[index] = (priority, ticket)
+                    heapq.heapify(self.heap)
+                    self.condition.notify_all()
+                    return
+
+    def acquire(self, priority: int, timeout: Optional[float] = None,
+                cancelled: Optional[Callable[[], bool]] = None) -> None:
+        """Ponerse a la cola y esperar turno"""
+        self.wait(self.enqueue(priority), timeout, cancelled)
+
+    def wait(self, ticket: int, timeout: Optional[float] = None,
+             cancelled: Optional[Callable[[], bool]] = None) -> None:
+        """
+        Esperar turno: primero la prioridad y, dentro de ella, el orden de llegada.
+        Si 'cancelled' pasa a ser cierto (hay que avisar con wake()), se deja el puesto en la cola.
+        """
+        start_time = time.time()
+        with self.condition:
+            while self.heap[0][1] != ticket or self.active >= self.concurrency:
+                remaining = None if timeout is None else timeout - (time.time() - start_time)
+                expired = remaining is not None and remaining <= 0
+                if expired or (cancelled and cancelled()):
+                    self.heap = [entry for entry in self.heap if entry[1] != ticket]
+                    heapq.heapify(self.heap)
+                    self.condition.notify_all()
+                    if expired:
+                        raise QueueTimeout(f"más de {timeout:g}s en la cola")
+                    raise Cancelled()
+                self.condition.wait(remaining)
+            heapq.heappop(self.heap)
+            self.active += 1
+            self.served += 1
+            self.waits = self.waits[-999:] + [time.time() - start_time]
+            # Puede haber hueco para la siguiente de la cola
+            self.condition.notify_all()
+
+    def release(self) -> None:
+        with self.condition:
+            self.active -= 1
+            self.condition.notify_all()
+
+    def wake(self) -> None:
+        """Despertar a los que esperan turno para que comprueben si siguen haciendo falta"""
+        with self.condition:
+            self.condition.notify_all()
+
+    def depth(self) -> Dict[str, int]:
+        """Peticiones esperando, por nombre de prioridad"""
+        names = {value: name for name, value in PRIORITIES.items()}
+        with self.condition:
+            counts = {name: 0 for name in PRIORITIES}
+            for priority, _ in self.heap:
+                counts[names[priority]] += 1
+        return counts
+
+class Flight:
+    """
+    Una petición al servidor real cuya respuesta se guarda según llega para que la lean
+    uno o varios clientes, cada uno desde el principio y a su propio ritmo.
+    """
+
+    def __init__(self, method: str, path: str, body: bytes, headers: Dict[str, str], priority: int):
+        self.method = method
+        self.path = path
+        self.body = body
+        self.headers = headers
+        # La más urgente de las de todos los clientes unidos; 'ticket' es su turno en la cola
+        self.priority = priority
+        self.ticket: Optional[int] = None
+        self.status: Optional[int] = None
+        self.content_type = "application/json"
+        self.chunks: List[bytes] = []
+        self.done = False
+        self.condition = threading.Condition()
+        self.waiters = 1
+        # Sin clientes esperando se deja de leer del servidor (Ollama cancela la generación)
+        self.cancelled = False
+        self.queue: Optional[ModelQueue] = None
+        self.response: Optional[requests.Response] = None
+
+    def join(self, priority: int) -> bool:
+        """
+        Sumar un cliente a la petición, si aún no ha terminado ni se ha cancelado.
+        Si es más urgente, la petición sube a su prioridad mientras espera en la cola.
+        """
+        with self.condition:
+            if self.done or self.cancelled:
+                return False
+            self.waiters += 1
+            if priority >= self.priority:
+                return True
+            self.priority = priority
+            queue, ticket = self.queue, self.ticket
+        if queue and ticket is not None:
+            queue.promote(ticket, priority)
+        return True
+
+    def leave(self) -> None:
+        """Un cliente deja de esperar; si era el último, se cancela la petición al servidor"""
+        with self.condition:
+            self.waiters -= 1
+            if self.waiters > 0 or self.done or self.cancelled:
+                return
+            self.cancelled = True
+            response = self.response
+            self.condition.notify_all()
+        if self.queue:
+            self.queue.wake()
+        if response is not None:
+            response.close()
+
+    def run(self, client: OllamaClient, queue: Optional[ModelQueue],
+            queue_timeout: Optional[float], on_finish) -> None:
+        """Esperar turno en la cola del modelo y leer la respuesta completa del servidor"""
+        try:
+            if queue:
+                # Con la prioridad que haya en este momento; join() sube las posteriores
+                with self.condition:
+                    self.queue = queue
+                    self.ticket = queue.enqueue(self.priority)
+                queue.wait(self.ticket, queue_timeout, lambda: self.cancelled)
+            try:
+                self.relay(client)
+            finally:
+                if queue:
+                    queue.release()
+        except Cancelled:
+            pass
+        except QueueTimeout as e:
+            self.fail(503, str(e))
+        except requests.exceptions.RequestException as e:
+            if not self.cancelled:
+                self.fail(502, f"gateway: {e}")
+        finally:
+            on_finish(self)
+            with self.condition:
+                self.done = True
+                self.condition.notify_all()
+
+    def relay(self, client: OllamaClient) -> None:
+        """Guardar la respuesta del servidor según llega, hasta el final o hasta la cancelación"""
+        if self.cancelled:
+            return
+        response = client.request(self.method, self.path, data=self.body or None,
+                                  headers=self.headers, stream=True)
+        with response:
+            with self.condition:
+                if self.cancelled:
+                    return
+                self.response = response
+                self.status = response.status_code
+                self.content_type = response.headers.get("Content-Type", self.content_type)
+                self.condition.notify_all()
+            try:
+                for chunk in response.iter_content(chunk_size=None):
+                    with self.condition:
+                        if self.cancelled:
+                            return
+                        if chunk:
+                            self.chunks.append(chunk)
+                            self.condition.notify_all()
+            except Exception:
+                # leave() cierra la respuesta desde otro hilo: el error de lectura es la cancelación
+                if not self.cancelled:
+                    raise
+
+    def fail(self, status: int, message: str) -> None:
+        """Responder con un error si el servidor no llegó a contestar"""
+        with self.condition:
+            if self.status is None:
+                self.status = status
+                self.content_type = "application/json"
+                self.chunks = [json.dumps({"error": message}).encode()]
+            self.condition.notify_all()
+
+    def wait_status(self, abandoned: Optional[Callable[[], bool]] = None) -> Optional[Tuple[int, str]]:
+        """Esperar el código de estado; None si 'abandoned' indica que el cliente se fue antes"""
+        with self.condition:
+            while self.status is None and not self.done:
+                if abandoned and abandoned():
+                    return None
+                self.condition.wait(1 if abandoned else None)
+            return self.status or 502, self.content_type
+
+    def iter_chunks(self) -> Iterator[bytes]:
+        """Todos los fragmentos desde el principio, esperando a los que aún no han llegado"""
+        index = 0
+        while True:
+            with self.condition:
+                while index >= len(self.chunks) and not self.done:
+                    self.condition.wait()
+                if index >= len(self.chunks):
+                    return
+                chunk = self.chunks[index]
+            index += 1
+            yield chunk
+
+class Gateway:
+    """Colas por modelo, peticiones en curso y contadores de la pasarela"""
+
+    def __init__(self, upstream: str, concurrency: int = 2, coalesce: bool = True,
+                 queue_timeout: Optional[float] = None, timeout: float = 600):
+        self.client = OllamaClient(upstream, timeout=timeout, pool_size=64)
+        self.concurrency = concurrency
+        self.coalesce = coalesce
+        self.queue_timeout = queue_timeout
+        self.lock = threading.Lock()
+        self.queues: Dict[str, ModelQueue] = {}
+        self.flights: Dict[str, Flight] = {}
+        self.requests: Dict[str, int] = {}
+        self.coalesced: Dict[str, int] = {}
+        self.started = time.time()
+
+    def queue(self, model: str) -> ModelQueue:
+        with self.lock:
+            if model not in self.queues:
+                self.queues[model] = ModelQueue(self.concurrency)
+            return self.queues[model]
+
+    def submit(self, method: str, path: str, body: bytes, headers: Dict[str, str],
+               priority: int) -> Flight:
+        """Devolver la petición en curso idéntica a esta o lanzar una nueva"""
+        model = None
+        if method == "POST" and path in QUEUED_PATHS:
+            try:
+                model = json.loads(body or b"{}").get("model")
+            except (ValueError, AttributeError):
+                model = None
+        key = None
+        if model and self.coalesce and path in COALESCED_PATHS:
+            key = hashlib.sha256(path.encode() + b"\0" + body).hexdigest()
+
+        with self.lock:
+            if model:
+                self.requests[model] = self.requests.get(model, 0) + 1
+            if key and key in self.flights and self.flights[key].join(priority):
+                self.coalesced[model] = self.coalesced.get(model, 0) + 1
+                return self.flights[key]
+            flight = Flight(method, path, body, headers, priority)
+            if key:
+                self.flights[key] = flight
+
+        def finish(done: Flight) -> None:
+            # A partir de aquí una petición idéntica vuelve a ir al servidor
+            if key:
+                with self.lock:
+                    if self.flights.get(key) is done:
+                        del self.flights[key]
+
+        queue = self.queue(model) if model else None
+        threading.Thread(target=flight.run, daemon=True,
+                         args=(self.client, queue, self.queue_timeout, finish)).start()
+        return flight
+
+    def stats(self) -> Dict[str, Any]:
+        """Estado por modelo y tasa de aciertos global de la unión de peticiones"""
+        with self.lock:
+            queues = dict(self.queues)
+            requests_by_model = dict(self.requests)
+            coalesced = dict(self.coalesced)
+            in_flight = len(self.flights)
+        models = {}
+        for model in sorted(set(queues) | set(requests_by_model)):
+            queue = queues.get(model)
+            waits = sorted(queue.waits) if queue else []
+            models[model] = {
+                "queued": queue.depth() if queue else {name: 0 for name in PRIORITIES},
+                "active": queue.active if queue else 0,
+                "concurrency": self.concurrency,
+                "requests": requests_by_model.get(model, 0),
+                "upstream": queue.served if queue else 0,
+                "coalesced": coalesced.get(model, 0),
+                "queue_wait_p50": waits[len(waits) // 2] if waits else 0.0
+            }
+        total = sum(requests_by_model.values())
+        hits = sum(coalesced.values())
+        return {
+            "uptime": time.time() - self.started,
+            "requests": total,
+            "coalesced": hits,
+            "coalesce_hit_rate": hits / total if total else 0.0,
+            "coalescing_in_flight": in_flight,
+            "models": models
+        }
+
+    def render_metrics(self) -> str:
+        """Estadísticas en el formato de exposición de Prometheus"""
+        stats = self.stats()
+        lines = [
+            "# HELP ollama_gateway_queue_depth Peticiones esperando en la cola del modelo",
+            "# TYPE ollama_gateway_queue_depth gauge"
+        ]
+        for model, data in stats["models"].items():
+            for priority, count in data["queued"].items():
+                lines.append(f'ollama_gateway_queue_depth{{model="{model}",priority="{priority}"}} {count}')
+        for name, key, kind, description in (
+                ("ollama_gateway_active_requests", "active", "gauge", "Peticiones en curso en el servidor"),
+                ("ollama_gateway_requests_total", "requests", "counter", "Peticiones de inferencia recibidas"),
+                ("ollama_gateway_upstream_requests_total", "upstream", "counter",
+                 "Peticiones de inferencia enviadas al servidor"),
+                ("ollama_gateway_coalesced_total", "coalesced", "counter",
+                 "Peticiones servidas con la respuesta de otra idéntica en curso")):
+            lines += [f"# HELP {name} {description}", f"# TYPE {name} {kind}"]
+            for model, data in stats["models"].items():
+                lines.append(f'{name}{{model="{model}"}} {data[key]}')
+        lines += [
+            "# HELP ollama_gateway_coalesce_hit_ratio Fracción de peticiones unidas a otra en curso",
+            "# TYPE ollama_gateway_coalesce_hit_ratio gauge",
+            f"ollama_gateway_coalesce_hit_ratio {stats['coalesce_hit_rate']:.6f}"
+        ]
+        return "\n".join(lines) + "\n"
+
+class GatewayHandler(BaseHTTPRequestHandler):
+    """Reenvía cada petición a través de la pasarela"""
+
+    protocol_version = "HTTP/1.1"
+    server: "GatewayServer"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def do_GET(self) -> None:
+        if self.path == "/gateway/stats":
+            self.send_body(json.dumps(self.server.gateway.stats(), indent=2).encode(), "application/json")
+        elif self.path == "/metrics":
+            self.send_body(self.server.gateway.render_metrics().encode(), PROMETHEUS_CONTENT_TYPE)
+        else:
+            self.forward("GET")
+
+    def do_POST(self) -> None:
+        self.forward("POST")
+
+    def do_DELETE(self) -> None:
+        self.forward("DELETE")
+
+    def do_HEAD(self) -> None:
+        # Open WebUI y los balanceadores comprueban la salud con HEAD /
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def send_body(self, body: bytes, content_type: str, status: int = 200) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def forward(self, method: str) -> None:
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        name = self.headers.get("X-Priority", self.server.default_priority).strip().lower()
+        if name not in PRIORITIES:
+            self.send_body(json.dumps({"error": f"X-Priority desconocida: {name}"}).encode(),
+                           "application/json", 400)
+            return
+        headers = {"Content-Type": self.headers.get("Content-Type", "application/json")}
+        flight = self.server.gateway.submit(method, self.path, body, headers, PRIORITIES[name])
+        try:
+            waited = flight.wait_status(self.client_gone)
+            if waited is None:
+                self.close_connection = True
+                return
+            status, content_type = waited
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for chunk in flight.iter_chunks():
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+        finally:
+            # La respuesta se sigue leyendo mientras quede algún cliente esperándola
+            flight.leave()
+
+    def client_gone(self) -> bool:
+        """El cliente cerró la conexión (se comprueba sin bloquear mientras espera turno)"""
+        try:
+            readable, _, _ = select.select([self.connection], [], [], 0)
+            return bool(readable) and not self.connection.recv(1, socket.MSG_PEEK)
+        except OSError:
+            return True
+
+class GatewayServer(ThreadingHTTPServer):
+    """Servidor HTTP de la pasarela"""
+
+    daemon_threads = True
+
+    def __init__(self, address, gateway: Gateway, default_priority: str = "interactive",
+                 verbose: bool = False):
+        super().__init__(address, GatewayHandler)
+        self.gateway = gateway
+        self.default_priority = default_priority
+        self.verbose = verbose
+
+def print_stats(stats: Dict[str, Any]) -> None:
+    """Resumen legible de /gateway/stats"""
+    print(f"\n📊 {stats['requests']} peticiones, {stats['coalesced']} unidas a otra en curso "
+          f"({stats['coalesce_hit_rate']:.0%})")
+    for model, data in stats["models"].items():
+        queued = ", ".join(f"{name} {count}" for name, count in data["queued"].items())
+        print(f"   {model:<36} en cola: {queued} | en curso: {data['active']}/{data['concurrency']} | "
+              f"al servidor: {data['upstream']} | unidas: {data['coalesced']} | "
+              f"espera p50: {data['queue_wait_p50']:.2f}s")
+
+def parse_args() -> argparse.Namespace:
+    """Leer los argumentos de la línea de comandos"""
+    parser = argparse.ArgumentParser(description="Pasarela con colas por modelo y unión de peticiones idénticas")
+    parser.add_argument("--host", default="0.0.0.0", help="Dirección de escucha (por defecto: 0.0.0.0)")
+    parser.add_argument("--port", type=int, default=11436, help="Puerto de la pasarela (por defecto: 11436)")
+    parser.add_argument("--upstream", default=DEFAULT_BASE_URL,
+                        help=f"Servidor Ollama real (por defecto: {DEFAULT_BASE_URL})")
+    parser.add_argument("--concurrency", type=int, default=2,
+                        help="Peticiones simultáneas por modelo hacia el servidor (por defecto: 2)")
+    parser.add_argument("--default-priority", choices=sorted(PRIORITIES), default="interactive",
+                        help="Prioridad de las peticiones sin cabecera X-Priority (por defecto: interactive)")
+    parser.add_argument("--queue-timeout", type=float, default=None,
+                        help="Segundos máximos en cola antes de responder 503 (por defecto: sin límite)")
+    parser.add_argument("--no-coalesce", action="store_true",
+                        help="No unir peticiones idénticas en curso")
+    parser.add_argument("--verbose", action="store_true", help="Mostrar una línea por petición")
+    args = parser.parse_args()
+    if args.concurrency < 1:
+        parser.error("--concurrency debe ser >= 1")
+    return args
+
+def main():
+    """Función principal"""
+    args = parse_args()
+    gateway = Gateway(args.upstream, args.concurrency, not args.no_coalesce, args.queue_timeout)
+    server = GatewayServer((args.host, args.port), gateway, args.default_priority, args.verbose)
+    print(f"🚦 Pasarela en http://{args.host}:{args.port} → {args.upstream} "
+          f"({args.concurrency} por modelo, unión de peticiones {'no' if args.no_coalesce else 'sí'})")
+    print(f"   Estado: http://{args.host}:{args.port}/gateway/stats  Métricas: /metrics")
+    sys.stdout.flush()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print_stats(gateway.stats())
+
+if __name__ == "__main__":
+    main()
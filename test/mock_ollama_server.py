@@ -0,0 +1,557 @@
+#!/usr/bin/env python3
+"""
+Servidor Ollama simulado para pruebas de rendimiento sin modelos reales
+Implementa /api/version, /api/tags, /api/ps, /api/show, /api/pull, /api/generate y /api/chat
+(con y sin streaming)
+con tiempos deterministas: retardo de carga por modelo, velocidad de evaluación del prompt,
+velocidad de generación, número máximo de peticiones en paralelo e inyección de errores.
+Como Ollama, reutiliza el prefijo del prompt que ya está en caché (historial o 'context').
+Los modelos deepseek-r1 empiezan sus respuestas con un bloque <think>…</think> (think_ratio).
+
+Uso: python mock_ollama_server.py [--port 11434] [--token-rate 30] [--parallel 4] [--error-rate 0.05]
+     python mock_ollama_server.py --config mock.json
+
+Ejemplo de configuración (todas las claves son opcionales):
+{
+  "parallel": 2,
+  "memory_gb": 8,
+  "error_rate": 0.0,
+  "pull_rate_mb": 500,
+  "models": {
+    "deepseek-r1:1.5b": {"load_delay": 1.5, "prompt_rate": 800, "token_rate": 60, "size_gb": 1.1,
+                         "think_ratio": 0.7},
+    "deepseek-r1:32b": {"load_delay": 12, "prompt_rate": 90, "token_rate": 6, "size_gb": 20}
+  }
+}
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# Importar utilidades comunes
+try:
+    from ollama_test_utils import AVAILABLE_MODELS
+except ImportError as e:
+    print(f"❌ Error: No se puede importar {e.name or 'un módulo'}: {e}")
+    print("   Asegúrate de que los scripts de test/ estén en el mismo directorio "
+          "y de haber instalado test/requirements.txt")
+    sys.exit(1)
+
+MOCK_VERSION = "0.0.0-mock"
+
+# Texto que se repite para construir las respuestas (siempre el mismo, para que sean deterministas)
+MOCK_WORDS = ("Esta es una respuesta simulada por el servidor de pruebas de Ollama "
+              "para medir el rendimiento del cliente sin cargar modelos reales .").split()
+# Texto del bloque <think>…</think> de los modelos que razonan
+MOCK_THINKING = ("Veamos , primero analizo el enunciado y después compruebo cada paso "
+                 "antes de dar la respuesta .").split()
+
+# Valores por defecto de cada modelo
+DEFAULT_MODEL_CONFIG = {
+    "load_delay": 2.0,     # segundos para cargar el modelo en memoria
+    "prompt_rate": 500.0,  # tokens/s al evaluar el prompt
+    "token_rate": 30.0,    # tokens/s al generar
+    "size_gb": None,       # tamaño; por defecto se deduce de la etiqueta (p. ej. 7b)
+    "max_tokens": 128,     # longitud de la respuesta si no se fija num_predict
+    "think_ratio": None    # fracción de tokens de razonamiento; por defecto 0.6 en deepseek-r1
+}
+
+def parse_keep_alive(value: Any, default: float = 300) -> float:
+    """Convertir keep_alive de Ollama (segundos o '5m', '1h', '-1') a segundos; negativo = siempre"""
+    if value is None:
+        return default
+    if isinstance(value, (int, float)):
+        return float("inf") if value < 0 else float(value)
+    match = re.fullmatch(r"(-?\d+(?:\.\d+)?)(ms|s|m|h)?", str(value).strip())
+    if not match:
+        return default
+    amount = float(match.group(1))
+    if amount < 0:
+        return float("inf")
+    return amount * {"ms": 0.001, "s": 1, "m": 60, "h": 3600, None: 1}[match.group(2)]
+
+def guess_size_gb(model_name: str) -> float:
+    """Estimar el tamaño de un modelo a partir de su número de parámetros (~0.65GB por mil millones)"""
+    match = re.search(r"(\d+(?:\.\d+)?)b\b", model_name)
+    return round(float(match.group(1)) * 0.65, 1) if match else 4.7
+
+def count_tokens(text: str) -> int:
+    """Aproximación del número de tokens de un texto (~4 caracteres por token)"""
+    return max(1, len(text) // 4)
+
+class MockModel:
+    """Parámetros de rendimiento de un modelo simulado"""
+
+    def __init__(self, name: str, config: Dict[str, Any]):
+        settings = {**DEFAULT_MODEL_CONFIG, **config}
+        self.name = name
+        self.load_delay = float(settings["load_delay"])
+        self.prompt_rate = float(settings["prompt_rate"])
+        self.token_rate = float(settings["token_rate"])
+        self.max_tokens = int(settings["max_tokens"])
+        think_ratio = settings["think_ratio"]
+        if think_ratio is None:
+            think_ratio = 0.6 if name.startswith("deepseek-r1") else 0.0
+        self.think_ratio = float(think_ratio)
+        size_gb = settings["size_gb"] if settings["size_gb"] is not None else guess_size_gb(name)
+        self.size = int(size_gb * 1024**3)
+        self.digest = hashlib.sha256(name.encode()).hexdigest()
+        self.load_lock = threading.Lock()
+        # Texto que queda en la caché KV tras la última petición (prompt + respuesta)
+        self.cached = ""
+
+    def tag(self) -> Dict[str, Any]:
+        """Entrada del modelo en /api/tags"""
+        family = self.name.split(":")[0].split("/")[-1]
+        match = re.search(r"(\d+(?:\.\d+)?b)\b", self.name)
+        return {
+            "name": self.name,
+            "model": self.name,
+            "size": self.size,
+            "digest": self.digest,
+            "details": {
+                "family": family,
+                "parameter_size": match.group(1).upper() if match else "7B",
+                "quantization_level": "Q4_K_M"
+            }
+        }
+
+    def show(self) -> Dict[str, Any]:
+        """Respuesta de /api/show"""
+        details = self.tag()["details"]
+        architecture = "qwen2" if "deepseek-r1" in self.name else "llama"
+        return {
+            "modelfile": f"FROM {self.name}",
+            "details": {**details, "format": "gguf", "families": [architecture]},
+            "model_info": {
+                "general.architecture": architecture,
+                "general.parameter_count": int(self.size / 0.65 / 1024**3 * 1e9),
+                f"{architecture}.context_length": 131072 if architecture == "qwen2" else 8192
+            }
+        }
+
+class MockOllama:
+    """Estado del servidor simulado: modelos, memoria, huecos de ejecución y errores"""
+
+    def __init__(self, models: Dict[str, Dict[str, Any]], parallel: int = 4,
+                 memory_gb: Optional[float] = None, error_rate: float = 0.0, seed: int = 0,
+                 pull_rate_mb: float = 500.0):
+        self.models = {name: MockModel(name, config) for name, config in models.items()}
+        self.pull_rate = pull_rate_mb * 1024**2
+        # Bytes ya descargados de cada modelo a medio descargar (para reanudar)
+        self.partial: Dict[str, int] = {}
+        self.slots = threading.BoundedSemaphore(parallel)
+        self.memory = int(memory_gb * 1024**3) if memory_gb else None
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        # Modelos residentes: nombre -> instante en que caducan (orden LRU)
+        self.loaded: "OrderedDict[str, float]" = OrderedDict()
+        self.active: Dict[str, int] = {}
+
+    def should_fail(self) -> bool:
+        """Decidir (con la semilla configurada) si se inyecta un error en esta petición"""
+        with self.lock:
+            return self.random.random() < self.error_rate
+
+    def _expire(self) -> None:
+        now = time.time()
+        for name, expires in list(self.loaded.items()):
+            if expires <= now and not self.active.get(name):
+                del self.loaded[name]
+
+    def pull(self, name: str, step: float = 0.1) -> Iterator[Dict[str, Any]]:
+        """
+        Simular /api/pull: los modelos ya descargados terminan al momento; el resto se
+        descarga como una sola capa a 'pull_rate' bytes/s, reanudando donde se quedó.
+        Con la inyección de errores la descarga puede cortarse a mitad.
+        """
+        yield {"status": "pulling manifest"}
+        model = self.models.get(name) or MockModel(name, {})
+        layer = {"digest": f"sha256:{model.digest}", "total": model.size}
+        with self.lock:
+            completed = model.size if name in self.models else self.partial.get(name, 0)
+        fail_at = model.size // 2 if completed < model.size // 2 and self.should_fail() else None
+        yield {"status": f"pulling {model.digest[:12]}", **layer, "completed": completed}
+        while completed < model.size:
+            time.sleep(step)
+            completed = min(model.size, completed + int(self.pull_rate * step))
+            with self.lock:
+                self.partial[name] = completed
+            if fail_at is not None and completed >= fail_at:
+                yield {"error": "mock: descarga interrumpida"}
+                return
+            yield {"status": f"pulling {model.digest[:12]}", **layer, "completed": completed}
+        yield {"status": f"pulling {model.digest[:12]}", **layer, "completed": model.size}
+        yield {"status": "verifying sha256 digest"}
+        yield {"status": "writing manifest"}
+        with self.lock:
+            self.partial.pop(name, None)
+            self.models.setdefault(name, model)
+        yield {"status": "success"}
+
+    def loaded_models(self) -> List[Tuple[MockModel, float]]:
+        """Modelos en memoria con su instante de caducidad"""
+        with self.lock:
+            self._expire()
+            return [(self.models[name], expires) for name, expires in self.loaded.items()]
+
+    def ensure_loaded(self, model: MockModel, keep_alive: float) -> float:
+        """Cargar el modelo si no está residente y devolver el tiempo de carga en segundos"""
+        with model.load_lock:
+            with self.lock:
+                self._expire()
+                resident = model.name in self.loaded
+            load_time = 0.0
+            if not resident:
+                start = time.time()
+                time.sleep(model.load_delay)
+                load_time = time.time() - start
+            with self.lock:
+                self.loaded[model.name] = time.time() + keep_alive
+                self.loaded.move_to_end(model.name)
+                self._evict(keep=model.name)
+            return load_time
+
+    def _evict(self, keep: str) -> None:
+        """Expulsar modelos inactivos (LRU) hasta que todo quepa en la memoria configurada"""
+        if self.memory is None:
+            return
+        for name in list(self.loaded):
+            if sum(self.models[n].size for n in self.loaded) <= self.memory:
+                return
+            if name != keep and not self.active.get(name):
+                del self.loaded[name]
+
+    def unload(self, model: MockModel) -> None:
+        """Descargar un modelo (keep_alive=0)"""
+        with self.lock:
+            self.loaded.pop(model.name, None)
+
+    def begin(self, model: MockModel) -> None:
+        with self.lock:
+            self.active[model.name] = self.active.get(model.name, 0) + 1
+
+    def end(self, model: MockModel, keep_alive: float) -> None:
+        with self.lock:
+            self.active[model.name] -= 1
+            if model.name in self.loaded:
+                if keep_alive == 0 and not self.active[model.name]:
+                    del self.loaded[model.name]
+                else:
+                    self.loaded[model.name] = time.time() + keep_alive
+
+    def run(self, model: MockModel, prompt: str, options: Dict[str, Any],
+            keep_alive: float, think: bool = False) -> Iterator[Dict[str, Any]]:
+        """
+        Simular una generación: esperar un hueco libre, cargar el modelo, evaluar el prompt y
+        producir tokens al ritmo configurado. Devuelve un fragmento por token y uno final con
+        las métricas, igual que /api/generate. Los modelos que razonan empiezan con un bloque
+        <think>…</think>, o lo envían en el campo 'thinking' si la petición lleva think=true.
+        """
+        start = time.time()
+        with self.slots:
+            self.begin(model)
+            try:
+                load_time = self.ensure_loaded(model, keep_alive)
+                # Como Ollama, solo se evalúa la parte del prompt que no comparte prefijo con la caché
+                with self.lock:
+                    reused = len(os.path.commonprefix([model.cached, prompt]))
+                prompt_tokens = count_tokens(prompt[reused:])
+                prompt_start = time.time()
+                time.sleep(prompt_tokens / model.prompt_rate)
+                prompt_time = time.time() - prompt_start
+
+                num_predict = int(options.get("num_predict", model.max_tokens))
+                if num_predict < 0:
+                    num_predict = model.max_tokens
+                tokens = min(num_predict, model.max_tokens)
+                # Con etiquetas, el bloque ocupa al menos sus dos tokens <think> y </think>
+                thinking = round(tokens * model.think_ratio)
+                if thinking and not think:
+                    thinking = max(thinking, 2)
+                eval_start = time.time()
+                words = []
+                for index in range(tokens):
+                    target = eval_start + (index + 1) / model.token_rate
+                    time.sleep(max(0.0, target - time.time()))
+                    if index < thinking:
+                        if think:
+                            word = (" " if index else "") + MOCK_THINKING[index % len(MOCK_THINKING)]
+                            yield {"response": "", "thinking": word, "done": False}
+                            continue
+                        if index == 0:
+                            word = "<think>"
+                        elif index == thinking - 1:
+                            word = "\n</think>\n\n"
+                        else:
+                            word = ("\n" if index == 1 else " ") + MOCK_THINKING[(index - 1) % len(MOCK_THINKING)]
+                    else:
+                        answer_index = index - thinking
+                        word = MOCK_WORDS[answer_index % len(MOCK_WORDS)]
+                        if answer_index:
+                            word = " " + word
+                    words.append(word)
+                    yield {"response": word, "done": False}
+                eval_time = time.time() - eval_start
+                cached = prompt + "\n" + "".join(words)
+                with self.lock:
+                    model.cached = cached
+            finally:
+                self.end(model, keep_alive)
+
+        yield {
+            "response": "",
+            "done": True,
+            "done_reason": "length" if tokens == num_predict else "stop",
+            # El contexto codifica el texto carácter a carácter para poder reconstruirlo
+            "context": [ord(c) for c in cached],
+            "total_duration": int((time.time() - start) * 1e9),
+            "load_duration": int(load_time * 1e9),
+            "prompt_eval_count": prompt_tokens,
+            "prompt_eval_duration": int(prompt_time * 1e9),
+            "eval_count": tokens,
+            "eval_duration": int(eval_time * 1e9)
+        }
+
+class MockHandler(BaseHTTPRequestHandler):
+    """Manejador HTTP de la API simulada"""
+
+    protocol_version = "HTTP/1.1"
+    server: "MockHTTPServer"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def send_json(self, data: Dict[str, Any], status: int = 200) -> None:
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_json(self) -> Optional[Dict[str, Any]]:
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            data = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError:
+            return None
+        return data if isinstance(data, dict) else None
+
+    def do_GET(self) -> None:
+        mock = self.server.mock
+        if self.path == "/api/version":
+            self.send_json({"version": MOCK_VERSION})
+        elif self.path == "/api/tags":
+            self.send_json({"models": [model.tag() for model in mock.models.values()]})
+        elif self.path == "/api/ps":
+            models = []
+            for model, expires in mock.loaded_models():
+                entry = model.tag()
+                entry["size_vram"] = model.size
+                if expires != float("inf"):
+                    entry["expires_at"] = datetime.fromtimestamp(expires, timezone.utc).isoformat()
+                else:
+                    entry["expires_at"] = (datetime.now(timezone.utc) + timedelta(days=3650)).isoformat()
+                models.append(entry)
+            self.send_json({"models": models})
+        else:
+            self.send_json({"error": "not found"}, 404)
+
+    def do_POST(self) -> None:
+        if self.path == "/api/show":
+            request = self.read_json() or {}
+            model = self.server.mock.models.get(request.get("model") or request.get("name", ""))
+            if model is None:
+                self.send_json({"error": f"model '{request.get('model')}' not found"}, 404)
+            else:
+                self.send_json(model.show())
+            return
+        if self.path == "/api/pull":
+            request = self.read_json() or {}
+            name = request.get("model") or request.get("name")
+            if not name:
+                self.send_json({"error": "model is required"}, 400)
+            else:
+                self.send_ndjson(self.server.mock.pull(name))
+            return
+        if self.path not in ("/api/generate", "/api/chat"):
+            self.send_json({"error": "not found"}, 404)
+            return
+        request = self.read_json()
+        if request is None:
+            self.send_json({"error": "invalid JSON"}, 400)
+            return
+        mock = self.server.mock
+        model = mock.models.get(request.get("model", ""))
+        if model is None:
+            self.send_json({"error": f"model '{request.get('model')}' not found"}, 404)
+            return
+
+        chat = self.path == "/api/chat"
+        if chat:
+            prompt = "\n".join(str(m.get("content", "")) for m in request.get("messages", []))
+        else:
+            prompt = request.get("prompt", "")
+            if prompt and request.get("context"):
+                prompt = "".join(map(chr, request["context"])) + "\n" + prompt
+        keep_alive = parse_keep_alive(request.get("keep_alive"))
+
+        # Sin prompt ni mensajes: solo cargar (o descargar con keep_alive=0)
+        if not prompt:
+            if keep_alive == 0:
+                mock.unload(model)
+                self.send_json(self.wrap({"response": "", "done": True, "done_reason": "unload"}, model, chat))
+            else:
+                load_time = mock.ensure_loaded(model, keep_alive)
+                self.send_json(self.wrap({"response": "", "done": True, "done_reason": "load",
+                                          "load_duration": int(load_time * 1e9)}, model, chat))
+            return
+
+        if mock.should_fail():
+            self.send_json({"error": "mock: error inyectado"}, 500)
+            return
+
+        chunks = mock.run(model, prompt, request.get("options") or {}, keep_alive, bool(request.get("think")))
+        if request.get("stream", True):
+            self.stream_chunks(chunks, model, chat)
+        else:
+            text = []
+            thinking = []
+            for chunk in chunks:
+                text.append(chunk["response"])
+                thinking.append(chunk.get("thinking", ""))
+            final = dict(chunk)
+            final["response"] = "".join(text)
+            if any(thinking):
+                final["thinking"] = "".join(thinking)
+            self.send_json(self.wrap(final, model, chat))
+
+    def wrap(self, chunk: Dict[str, Any], model: MockModel, chat: bool) -> Dict[str, Any]:
+        """Dar a un fragmento el formato de /api/generate o /api/chat"""
+        data = {"model": model.name, "created_at": datetime.now(timezone.utc).isoformat(), **chunk}
+        if chat:
+            data["message"] = {"role": "assistant", "content": data.pop("response")}
+            if "thinking" in data:
+                data["message"]["thinking"] = data.pop("thinking")
+            data.pop("context", None)
+        return data
+
+    def send_ndjson(self, items: Iterator[Dict[str, Any]]) -> bool:
+        """Enviar objetos como NDJSON con codificación chunked; False si el cliente cerró la conexión"""
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for item in items:
+                line = (json.dumps(item) + "\n").encode()
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+            return False
+        return True
+
+    def stream_chunks(self, chunks: Iterator[Dict[str, Any]], model: MockModel, chat: bool) -> None:
+        """Enviar los fragmentos de una generación como NDJSON"""
+        if not self.send_ndjson(self.wrap(chunk, model, chat) for chunk in chunks):
+            # El cliente cerró la conexión: se abandona la generación y se libera el hueco
+            chunks.close()
+
+class MockHTTPServer(ThreadingHTTPServer):
+    """Servidor HTTP con el estado simulado adjunto"""
+
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], mock: MockOllama, verbose: bool = False):
+        super().__init__(address, MockHandler)
+        self.mock = mock
+        self.verbose = verbose
+
+def start_in_thread(mock: MockOllama, host: str = "127.0.0.1", port: int = 0) -> MockHTTPServer:
+    """Arrancar el servidor en un hilo de fondo (port=0 elige un puerto libre)"""
+    server = MockHTTPServer((host, port), mock)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def build_mock(config: Dict[str, Any], model_defaults: Dict[str, Any],
+               server_defaults: Dict[str, Any]) -> MockOllama:
+    """Crear el estado simulado a partir del fichero de configuración y los valores por defecto"""
+    settings = {**server_defaults, **{k: v for k, v in config.items() if k != "models"}}
+    names = config.get("models") or {name: {} for name in AVAILABLE_MODELS.values()}
+    models = {name: {**model_defaults, **(overrides or {})} for name, overrides in names.items()}
+    return MockOllama(
+        models,
+        parallel=int(settings["parallel"]),
+        memory_gb=settings["memory_gb"],
+        error_rate=float(settings["error_rate"]),
+        seed=int(settings["seed"]),
+        pull_rate_mb=float(settings["pull_rate_mb"])
+    )
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description="Servidor Ollama simulado para pruebas de rendimiento")
+    parser.add_argument("--host", default="127.0.0.1", help="Dirección de escucha (por defecto: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=11434, help="Puerto (por defecto: 11434)")
+    parser.add_argument("--config", type=argparse.FileType("r"), default=None,
+                        help="Fichero JSON con la configuración por modelo")
+    parser.add_argument("--load-delay", type=float, default=DEFAULT_MODEL_CONFIG["load_delay"],
+                        help="Segundos de carga de cada modelo")
+    parser.add_argument("--prompt-rate", type=float, default=DEFAULT_MODEL_CONFIG["prompt_rate"],
+                        help="Tokens/s al evaluar el prompt")
+    parser.add_argument("--token-rate", type=float, default=DEFAULT_MODEL_CONFIG["token_rate"],
+                        help="Tokens/s al generar")
+    parser.add_argument("--max-tokens", type=int, default=DEFAULT_MODEL_CONFIG["max_tokens"],
+                        help="Longitud de las respuestas si no se fija num_predict")
+    parser.add_argument("--parallel", type=int, default=4,
+                        help="Peticiones que se procesan a la vez (como OLLAMA_NUM_PARALLEL)")
+    parser.add_argument("--memory-gb", type=float, default=None,
+                        help="Memoria para modelos; se expulsan los menos usados (por defecto: ilimitada)")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="Fracción de peticiones que fallan con un error 500")
+    parser.add_argument("--seed", type=int, default=0, help="Semilla para la inyección de errores")
+    parser.add_argument("--pull-rate", type=float, default=500,
+                        help="MB/s de las descargas simuladas con /api/pull (por defecto: 500)")
+    parser.add_argument("--verbose", action="store_true", help="Mostrar cada petición recibida")
+    args = parser.parse_args()
+
+    config = json.load(args.config) if args.config else {}
+    model_defaults = {
+        "load_delay": args.load_delay,
+        "prompt_rate": args.prompt_rate,
+        "token_rate": args.token_rate,
+        "max_tokens": args.max_tokens
+    }
+    server_defaults = {
+        "parallel": args.parallel,
+        "memory_gb": args.memory_gb,
+        "error_rate": args.error_rate,
+        "seed": args.seed,
+        "pull_rate_mb": args.pull_rate
+    }
+    mock = build_mock(config, model_defaults, server_defaults)
+    server = MockHTTPServer((args.host, args.port), mock, verbose=args.verbose)
+    print(f"🧪 Ollama simulado en http://{args.host}:{args.port} con {len(mock.models)} modelos")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n⏹️  Servidor detenido")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Índice local de modelos indexado por digest
+Guarda en disco la familia, el número de parámetros, la cuantización, la longitud de
+contexto y el tamaño de cada modelo descargado (/api/tags y /api/show) para que la
+categoría, la planificación por tamaño y el arranque de los scripts sean búsquedas
+locales en vez de consultas repetidas al servidor. Al actualizarse solo se llama a
+/api/show para los modelos cuyo digest ha cambiado.
+
+Uso: python model_catalog.py list
+     python model_catalog.py refresh
+     python model_catalog.py clear
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import requests
+
+# Ruta por defecto junto a los datos de Ollama; se puede cambiar con OLLAMA_CATALOG
+DEFAULT_CATALOG_PATH = Path(os.environ.get(
+    "OLLAMA_CATALOG",
+    Path(__file__).resolve().parent.parent / "data" / "catalog" / "models.json"
+))
+
+# Segundos durante los que las consultas al índice (categoría, tamaño) no vuelven a pedir /api/tags;
+# la lista de modelos de los scripts siempre se actualiza
+DEFAULT_MAX_AGE = 300
+
+# Categoría de los tests según el nombre del modelo, en orden de prioridad
+CATEGORY_PATTERNS = [
+    ("opencoder", "opencoder"),
+    ("deepseek-coder", "deepseek-coder"),
+    ("deepseek-r1", "deepseek-r1"),
+    ("genaiimagecsprompt", "genaiimagecsprompt")
+]
+
+def category_from_name(model_name: str) -> str:
+    """Categorizar un modelo por su nombre (cuando no está en el índice)"""
+    for pattern, category in CATEGORY_PATTERNS:
+        if pattern in model_name:
+            return category
+    return "general"
+
+def context_length(model_info: Dict[str, Any]) -> Optional[int]:
+    """Longitud de contexto de /api/show: la clave es '<arquitectura>.context_length'"""
+    architecture = model_info.get("general.architecture")
+    if f"{architecture}.context_length" in model_info:
+        return model_info[f"{architecture}.context_length"]
+    for key, value in model_info.items():
+        if key.endswith(".context_length"):
+            return value
+    return None
+
+class ModelCatalog:
+    """Entradas por digest más un mapa nombre -> digest, guardados en un fichero JSON"""
+
+    def __init__(self, path: Path = DEFAULT_CATALOG_PATH, max_age: float = DEFAULT_MAX_AGE):
+        self.path = Path(path)
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self.names: Dict[str, str] = {}
+        self.server: Optional[str] = None
+        self.updated = 0.0
+        self._load()
+
+    def _load(self) -> None:
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return
+        self.entries = data.get("entries", {})
+        self.names = data.get("names", {})
+        self.server = data.get("server")
+        self.updated = data.get("updated", 0.0)
+
+    def save(self) -> None:
+        """Escribir el índice de forma atómica"""
+        data = {"server": self.server, "updated": self.updated,
+                "names": self.names, "entries": self.entries}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        tmp.write_text(json.dumps(data, indent=2, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, self.path)
+
+    def is_stale(self) -> bool:
+        return time.time() - self.updated > self.max_age
+
+    def _show(self, client, model: Dict[str, Any]) -> Dict[str, Any]:
+        """Entrada de un modelo nuevo o modificado a partir de /api/show"""
+        name = model.get("name")
+        details = dict(model.get("details") or {})
+        model_info: Dict[str, Any] = {}
+        response = client.post("/api/show", {"model": name}, timeout=30)
+        if response.status_code == 200:
+            data = response.json()
+            details.update(data.get("details") or {})
+            model_info = data.get("model_info") or {}
+        return {
+            "digest": model.get("digest", ""),
+            "family": details.get("family"),
+            "families": details.get("families") or [],
+            "parameter_size": details.get("parameter_size"),
+            "parameter_count": model_info.get("general.parameter_count"),
+            "quantization": details.get("quantization_level"),
+            "context_length": context_length(model_info),
+            "size": model.get("size", 0),
+            "category": category_from_name(name)
+        }
+
+    def refresh(self, client, force: bool = False) -> Optional[Dict[str, int]]:
+        """
+        Sincronizar con /api/tags si el índice ha caducado, es de otro servidor o force=True.
+        Devuelve cuántas entradas se añadieron, se quitaron y se conservaron,
+        o None si no hizo falta consultar al servidor.
+        """
+        with self.lock:
+            if not force and not self.is_stale() and self.server == client.base_url:
+                return None
+            response = client.get("/api/tags", timeout=10)
+            response.raise_for_status()
+            models = response.json().get("models", [])
+            names: Dict[str, str] = {}
+            entries: Dict[str, Dict[str, Any]] = {}
+            added = 0
+            for model in models:
+                digest = model.get("digest", "")
+                names[model.get("name")] = digest
+                if digest in entries:
+                    continue
+                if digest in self.entries:
+                    entries[digest] = self.entries[digest]
+                else:
+                    entries[digest] = self._show(client, model)
+                    added += 1
+            removed = len(set(self.entries) - set(entries))
+            self.entries, self.names, self.server = entries, names, client.base_url
+            self.updated = time.time()
+            self.save()
+            return {"added": added, "removed": removed, "kept": len(entries) - added}
+
+    def digest(self, model_name: str) -> str:
+        """Digest de un modelo ('' si no está); /api/tags añade ':latest' a los modelos sin etiqueta"""
+        return self.names.get(model_name) or self.names.get(f"{model_name}:latest", "")
+
+    def get(self, model_name: str) -> Optional[Dict[str, Any]]:
+        """Entrada de un modelo por nombre"""
+        return self.entries.get(self.digest(model_name))
+
+    def category(self, model_name: str) -> str:
+        """Categoría del modelo; los alias con el mismo digest comparten categoría"""
+        entry = self.get(model_name)
+        return entry["category"] if entry else category_from_name(model_name)
+
+    def models(self) -> List[str]:
+        """Nombres de los modelos descargados, en el orden de /api/tags"""
+        return list(self.names)
+
+    def sizes(self) -> Dict[str, int]:
+        """Tamaño en bytes de cada modelo, indexado por nombre"""
+        return {name: self.entries[digest]["size"] for name, digest in self.names.items()}
+
+    def digests(self) -> Dict[str, str]:
+        """Digest de cada modelo, indexado por nombre"""
+        return dict(self.names)
+
+    def clear(self) -> None:
+        """Vaciar el índice; la siguiente consulta lo reconstruye"""
+        with self.lock:
+            self.entries, self.names, self.updated = {}, {}, 0.0
+            if self.path.exists():
+                self.path.unlink()
+
+def print_catalog(catalog: ModelCatalog) -> None:
+    """Tabla con los datos de cada modelo del índice"""
+    if not catalog.names:
+        print("📋 El índice de modelos está vacío")
+        return
+    print(f"📋 {len(catalog.names)} modelos en {catalog.path}")
+    print(f"{'Modelo':<40}{'Categoría':<20}{'Familia':<20}{'Parám.':>8}{'Cuant.':>9}"
+          f"{'Contexto':>10}{'Tamaño':>9}")
+    for name in catalog.models():
+        entry = catalog.get(name)
+        ctx = entry["context_length"] or "?"
+        print(f"{name:<40}{entry['category']:<20}{entry['family'] or '?':<20}"
+              f"{entry['parameter_size'] or '?':>8}{entry['quantization'] or '?':>9}"
+              f"{ctx:>10}{entry['size'] / 1024**3:>8.1f}G")
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description="Consultar o actualizar el índice local de modelos")
+    parser.add_argument("--catalog", type=Path, default=DEFAULT_CATALOG_PATH,
+                        help=f"Fichero del índice (por defecto: {DEFAULT_CATALOG_PATH})")
+    parser.add_argument("command", choices=["list", "refresh", "clear"])
+    args = parser.parse_args()
+
+    catalog = ModelCatalog(args.catalog)
+    if args.command == "clear":
+        catalog.clear()
+        print(f"🗑️  Índice borrado: {catalog.path}")
+        return
+
+    # Importación tardía: ollama_test_utils también usa este módulo
+    from ollama_test_utils import check_ollama_status, get_client
+    if args.command == "refresh" or catalog.is_stale():
+        if not check_ollama_status():
+            sys.exit(1)
+        try:
+            changes = catalog.refresh(get_client(), force=True)
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"❌ No se pudo actualizar el índice: {e}")
+            sys.exit(1)
+        print(f"🔄 Índice actualizado: {changes['added']} nuevos, {changes['removed']} eliminados, "
+              f"{changes['kept']} sin cambios")
+    print_catalog(catalog)
+
+if __name__ == "__main__":
+    main()
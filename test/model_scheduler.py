@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Planificador de tests consciente del cambio de modelos
+Ordena el trabajo para cargar cada modelo una sola vez: empieza por los modelos que ya
+están en memoria (/api/ps), agrupa todas las peticiones de un mismo modelo y sigue por
+tamaño (/api/tags), de menor a mayor.
+
+Uso: python model_scheduler.py [--repeat N] [--memory-gb X] [--load-gbps Y]
+"""
+
+import argparse
+import sys
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+# Importar utilidades comunes
+try:
+    from ollama_test_utils import (
+        check_ollama_status,
+        get_available_models,
+        get_catalog,
+        get_loaded_models
+    )
+except ImportError as e:
+    print(f"❌ Error: No se puede importar {e.name or 'un módulo'}: {e}")
+    print("   Asegúrate de que los scripts de test/ estén en el mismo directorio "
+          "y de haber instalado test/requirements.txt")
+    sys.exit(1)
+
+# Velocidad de carga supuesta (GB/s) cuando no hay medidas reales de load_duration
+DEFAULT_LOAD_GBPS = 1.0
+
+def get_model_sizes() -> Dict[str, int]:
+    """Obtener el tamaño en bytes de cada modelo descargado según el índice local de modelos"""
+    return get_catalog().sizes()
+
+def plan_order(jobs: List[str], sizes: Dict[str, int], loaded: List[str]) -> List[str]:
+    """
+    Reordenar una lista de trabajos (un nombre de modelo por petición) para minimizar cargas:
+    primero los modelos ya residentes, después el resto de menor a mayor tamaño,
+    con todas las peticiones de cada modelo seguidas.
+    """
+    counts: Dict[str, int] = OrderedDict()
+    for model in jobs:
+        counts[model] = counts.get(model, 0) + 1
+    resident = [model for model in counts if model in loaded]
+    pending = sorted((model for model in counts if model not in loaded), key=lambda m: sizes.get(m, 0))
+    return [model for model in resident + pending for _ in range(counts[model])]
+
+def tags_order(jobs: List[str]) -> List[str]:
+    """
+    Orden de referencia: el que sigue un barrido sin planificar, con los modelos en el orden
+    de /api/tags y todas las peticiones de cada modelo seguidas
+    """
+    counts: Dict[str, int] = OrderedDict()
+    for model in jobs:
+        counts[model] = counts.get(model, 0) + 1
+    return [model for model in counts for _ in range(counts[model])]
+
+def round_robin_order(jobs: List[str]) -> List[str]:
+    """Pasadas sucesivas sobre los modelos en el orden de /api/tags (una petición de cada vez)"""
+    remaining: Dict[str, int] = OrderedDict()
+    for model in jobs:
+        remaining[model] = remaining.get(model, 0) + 1
+    order = []
+    while remaining:
+        for model in list(remaining):
+            order.append(model)
+            remaining[model] -= 1
+            if remaining[model] == 0:
+                del remaining[model]
+    return order
+
+def simulate_loads(order: List[str], sizes: Dict[str, int], loaded: List[str],
+                   memory_budget: int) -> List[str]:
+    """
+    Simular la memoria del servidor (expulsión LRU dentro de 'memory_budget' bytes)
+    y devolver la lista de cargas que provocaría ejecutar 'order'.
+    """
+    resident: Dict[str, int] = OrderedDict((model, sizes.get(model, 0)) for model in loaded)
+    loads = []
+    for model in order:
+        if model in resident:
+            resident.move_to_end(model)
+            continue
+        size = sizes.get(model, 0)
+        while resident and sum(resident.values()) + size > memory_budget:
+            resident.popitem(last=False)
+        resident[model] = size
+        loads.append(model)
+    return loads
+
+def estimate_load_time(model: str, sizes: Dict[str, int], load_gbps: float,
+                       measured: Optional[Dict[str, float]] = None) -> float:
+    """Tiempo de carga estimado en segundos: el medido si lo hay, o tamaño / velocidad de carga"""
+    if measured and measured.get(model):
+        return measured[model]
+    return sizes.get(model, 0) / (1024**3) / load_gbps
+
+def default_memory_budget(sizes: Dict[str, int], memory_gb: Optional[float]) -> int:
+    """Memoria disponible para modelos; por defecto, la del modelo más grande (memoria justa)"""
+    if memory_gb:
+        return int(memory_gb * 1024**3)
+    return max(sizes.values(), default=0)
+
+def compare_orders(jobs: List[str], sizes: Dict[str, int], loaded: List[str], memory_budget: int,
+                   load_gbps: float = DEFAULT_LOAD_GBPS,
+                   measured: Optional[Dict[str, float]] = None) -> Dict[str, float]:
+    """
+    Comparar cargas y tiempo de carga estimado del orden planificado con el de /api/tags
+    (la referencia del ahorro) y con el de pasadas sucesivas sobre los modelos
+    """
+    orders = {
+        "tags": tags_order(jobs),
+        "round_robin": round_robin_order(jobs),
+        "planned": plan_order(jobs, sizes, loaded)
+    }
+    comparison: Dict[str, float] = {}
+    for name, order in orders.items():
+        loads = simulate_loads(order, sizes, loaded, memory_budget)
+        comparison[f"{name}_loads"] = len(loads)
+        comparison[f"{name}_load_time"] = sum(estimate_load_time(m, sizes, load_gbps, measured) for m in loads)
+    comparison["saved_load_time"] = comparison["tags_load_time"] - comparison["planned_load_time"]
+    return comparison
+
+def print_comparison(comparison: Dict[str, float], memory_budget: int) -> None:
+    """Mostrar el ahorro de cargas del orden planificado frente al orden de /api/tags"""
+    print(f"\n🧠 Planificación de modelos (memoria supuesta: {memory_budget / 1024**3:.1f}GB)")
+    print(f"   Orden de /api/tags:  {comparison['tags_loads']} cargas, "
+          f"~{comparison['tags_load_time']:.1f}s de carga")
+    print(f"   Pasadas sucesivas:   {comparison['round_robin_loads']} cargas, "
+          f"~{comparison['round_robin_load_time']:.1f}s de carga")
+    print(f"   Orden planificado:   {comparison['planned_loads']} cargas, "
+          f"~{comparison['planned_load_time']:.1f}s de carga")
+    print(f"   ⚡ Tiempo de carga evitado frente al orden de /api/tags: ~{comparison['saved_load_time']:.1f}s")
+
+def main():
+    """Función principal: mostrar el plan para un barrido de todos los modelos"""
+    parser = argparse.ArgumentParser(description="Planificar el orden de un barrido de modelos")
+    parser.add_argument("--repeat", type=int, default=1,
+                        help="Peticiones por modelo (por defecto: 1)")
+    parser.add_argument("--memory-gb", type=float, default=None,
+                        help="Memoria disponible para modelos (por defecto: el tamaño del mayor)")
+    parser.add_argument("--load-gbps", type=float, default=DEFAULT_LOAD_GBPS,
+                        help=f"Velocidad de carga supuesta en GB/s (por defecto: {DEFAULT_LOAD_GBPS})")
+    args = parser.parse_args()
+
+    if not check_ollama_status():
+        return
+    models = get_available_models()
+    if not models:
+        print("📋 No hay modelos disponibles")
+        return
+
+    sizes = get_model_sizes()
+    loaded = list(get_loaded_models())
+    jobs = [model for model in models for _ in range(args.repeat)]
+    order = plan_order(jobs, sizes, loaded)
+
+    print("📋 Orden planificado:")
+    for model in OrderedDict.fromkeys(order):
+        status = "en memoria" if model in loaded else f"{sizes.get(model, 0) / 1024**3:.1f}GB"
+        print(f"   • {model} x{order.count(model)} ({status})")
+
+    memory_budget = default_memory_budget(sizes, args.memory_gb)
+    print_comparison(compare_orders(jobs, sizes, loaded, memory_budget, args.load_gbps), memory_budget)
+
+if __name__ == "__main__":
+    main()
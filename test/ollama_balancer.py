@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+Balanceador de carga del lado del cliente para varios nodos de Ollama
+Comprueba la salud de cada nodo con /api/version, reparte las peticiones al nodo con
+menos peticiones en curso y prefiere los nodos que ya tienen el modelo cargado
+(/api/ps) para evitar cargas en frío. Si un nodo no responde se reintenta en otro.
+
+Se activa definiendo OLLAMA_NODES con las URLs separadas por comas:
+  OLLAMA_NODES=http://nodo1:11434,http://nodo2:11434 python test_all_models.py --workers 8
+
+Uso: python ollama_balancer.py [URL ...]   (muestra el estado de los nodos)
+"""
+
+import os
+import sys
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Set
+
+import requests
+from urllib3.exceptions import ConnectTimeoutError
+
+from ollama_client import OllamaClient
+
+# Nodos configurados por entorno; vacío = un solo servidor (OLLAMA_URL)
+DEFAULT_NODES = [url.strip() for url in os.environ.get("OLLAMA_NODES", "").split(",") if url.strip()]
+
+def is_connect_failure(error: requests.exceptions.RequestException) -> bool:
+    """
+    El nodo no llegó a recibir la petición (conexión rechazada, DNS o timeout al conectar).
+    Un timeout de lectura también llega como ConnectionError al leer un stream, pero el nodo
+    está vivo y generando (p. ej. cargando un modelo en frío): reenviarla a otro solo añade carga.
+    """
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    if isinstance(error, requests.exceptions.Timeout):
+        return False
+    if not isinstance(error, requests.exceptions.ConnectionError):
+        return False
+    reason = error.args[0] if error.args else None
+    # urllib3 entrega la causa dentro de MaxRetryError.reason; NewConnectionError hereda de ConnectTimeoutError
+    reason = getattr(reason, "reason", reason)
+    return isinstance(reason, ConnectTimeoutError)
+
+class Node:
+    """Estado de un nodo: salud, peticiones en curso y modelos residentes"""
+
+    def __init__(self, client: OllamaClient):
+        self.client = client
+        self.url = client.base_url
+        self.healthy = True
+        self.version: Optional[str] = None
+        self.outstanding = 0
+        self.served = 0
+        self.models: Set[str] = set()
+
+class BalancedOllamaClient:
+    """
+    Cliente con la misma interfaz que OllamaClient que reparte las peticiones entre nodos.
+    Un nodo con el modelo cargado se prefiere mientras no tenga más de 'affinity_slack'
+    peticiones en curso por encima del nodo más desocupado.
+    """
+
+    def __init__(self, base_urls: List[str], health_interval: float = 10, affinity_slack: int = 2,
+                 retries: int = 1, **client_kwargs):
+        if not base_urls:
+            raise ValueError("se necesita al menos un nodo")
+        # Pocos reintentos por nodo: ante un fallo de conexión es mejor saltar a otro nodo
+        self.nodes = [Node(OllamaClient(url, retries=retries, **client_kwargs)) for url in base_urls]
+        self.base_url = ", ".join(node.url for node in self.nodes)
+        self.affinity_slack = affinity_slack
+        self.lock = threading.Lock()
+        self._stop = threading.Event()
+        self.refresh()
+        self._checker = threading.Thread(target=self._health_loop, args=(health_interval,), daemon=True)
+        self._checker.start()
+
+    def __enter__(self) -> "BalancedOllamaClient":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Detener las comprobaciones de salud y cerrar las conexiones de todos los nodos"""
+        self._stop.set()
+        for node in self.nodes:
+            node.client.close()
+
+    def refresh(self) -> None:
+        """Comprobar la salud de cada nodo y actualizar sus modelos residentes"""
+        for node in self.nodes:
+            try:
+                response = node.client.get("/api/version", timeout=2)
+                healthy = response.status_code == 200
+                version = response.json().get("version") if healthy else None
+                models = None
+                if healthy:
+                    ps = node.client.get("/api/ps", timeout=2)
+                    if ps.status_code == 200:
+                        models = {m.get("name") for m in ps.json().get("models", [])}
+            except (requests.exceptions.RequestException, ValueError):
+                healthy, version, models = False, None, None
+            with self.lock:
+                node.healthy = healthy
+                node.version = version
+                if models is not None:
+                    node.models = models
+
+    def _health_loop(self, interval: float) -> None:
+        while not self._stop.wait(interval):
+            self.refresh()
+
+    def _acquire(self, model: Optional[str], tried: Set[str]) -> Optional[Node]:
+        """Elegir nodo para una petición y contarla como en curso"""
+        with self.lock:
+            candidates = [n for n in self.nodes if n.healthy and n.url not in tried]
+            if not candidates:
+                # Todos marcados como caídos: probar igualmente antes de rendirse
+                candidates = [n for n in self.nodes if n.url not in tried]
+            if not candidates:
+                return None
+            # A igualdad de peticiones en curso, el que menos ha servido (reparto rotatorio)
+            load = lambda n: (n.outstanding, n.served)
+            node = min(candidates, key=load)
+            warm = [n for n in candidates if model in n.models]
+            if warm:
+                best_warm = min(warm, key=load)
+                if best_warm.outstanding - node.outstanding <= self.affinity_slack:
+                    node = best_warm
+            node.outstanding += 1
+            node.served += 1
+            if model:
+                # El nodo cargará el modelo al atender la petición
+                node.models.add(model)
+            return node
+
+    def _release(self, node: Node) -> None:
+        with self.lock:
+            node.outstanding -= 1
+
+    def _mark_down(self, node: Node) -> None:
+        with self.lock:
+            node.healthy = False
+            node.models.clear()
+
+    def _forget_if_unload(self, node: Node, payload: Dict[str, Any]) -> None:
+        """keep_alive=0 sin prompt descarga el modelo del nodo"""
+        if payload.get("keep_alive") == 0 and not payload.get("prompt") and not payload.get("messages"):
+            with self.lock:
+                node.models.discard(payload.get("model"))
+
+    def request(self, method: str, path: str, timeout: Optional[float] = None,
+                **kwargs) -> requests.Response:
+        """
+        Enviar la petición al nodo elegido, saltando a otro solo si no se puede conectar;
+        los timeouts y los cortes de una conexión ya establecida se devuelven al que llama
+        """
+        payload = kwargs.get("json") or {}
+        model = payload.get("model")
+        tried: Set[str] = set()
+        while True:
+            node = self._acquire(model, tried)
+            if node is None:
+                raise requests.exceptions.ConnectionError(f"ningún nodo disponible ({self.base_url})")
+            try:
+                response = node.client.request(method, path, timeout=timeout, **kwargs)
+            except requests.exceptions.ConnectionError as e:
+                self._release(node)
+                if not is_connect_failure(e):
+                    raise
+                self._mark_down(node)
+                tried.add(node.url)
+                continue
+            except BaseException:
+                self._release(node)
+                raise
+            if kwargs.get("stream"):
+                self._release_on_close(response, node)
+            else:
+                self._release(node)
+            self._forget_if_unload(node, payload)
+            return response
+
+    def _release_on_close(self, response: requests.Response, node: Node) -> None:
+        """Con stream=True el nodo sigue con la petición en curso hasta que se cierra la respuesta"""
+        close = response.close
+        released = False
+
+        def close_and_release() -> None:
+            nonlocal released
+            try:
+                close()
+            finally:
+                # close() puede llamarse varias veces: el nodo se libera solo la primera
+                with self.lock:
+                    if not released:
+                        released = True
+                        node.outstanding -= 1
+
+        response.close = close_and_release
+
+    def get(self, path: str, timeout: Optional[float] = None, **kwargs) -> requests.Response:
+        """Petición GET a la API"""
+        return self.request("GET", path, timeout=timeout, **kwargs)
+
+    def post(self, path: str, payload: Dict[str, Any], timeout: Optional[float] = None,
+             **kwargs) -> requests.Response:
+        """Petición POST con cuerpo JSON a la API"""
+        return self.request("POST", path, timeout=timeout, json=payload, **kwargs)
+
+    def stream(self, path: str, payload: Dict[str, Any],
+               timeout: Optional[float] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Versión en streaming: el nodo cuenta la petición como en curso hasta que se cierra
+        el generador. Solo se cambia de nodo si no se pudo conectar con él.
+        """
+        model = payload.get("model")
+        tried: Set[str] = set()
+        while True:
+            node = self._acquire(model, tried)
+            if node is None:
+                raise requests.exceptions.ConnectionError(f"ningún nodo disponible ({self.base_url})")
+            started = False
+            try:
+                for chunk in node.client.stream(path, payload, timeout=timeout):
+                    started = True
+                    yield chunk
+                return
+            except requests.exceptions.ConnectionError as e:
+                if started or not is_connect_failure(e):
+                    raise
+                self._mark_down(node)
+                tried.add(node.url)
+            finally:
+                self._release(node)
+
+    def describe(self) -> List[Dict[str, Any]]:
+        """Estado de cada nodo para mostrarlo en los informes"""
+        with self.lock:
+            return [{
+                "url": node.url,
+                "healthy": node.healthy,
+                "version": node.version,
+                "outstanding": node.outstanding,
+                "served": node.served,
+                "models": sorted(node.models)
+            } for node in self.nodes]
+
+def print_nodes(client: BalancedOllamaClient) -> None:
+    """Mostrar la salud, la carga y los modelos residentes de cada nodo"""
+    print(f"🌐 Nodos de Ollama: {len(client.nodes)}")
+    for node in client.describe():
+        status = f"✅ v{node['version']}" if node["healthy"] else "❌ sin respuesta"
+        print(f"   • {node['url']} {status}, {node['served']} peticiones atendidas")
+        if node["models"]:
+            print(f"     en memoria: {', '.join(node['models'])}")
+
+def main():
+    """Función principal: comprobar los nodos indicados o los de OLLAMA_NODES"""
+    urls = sys.argv[1:] or DEFAULT_NODES
+    if not urls:
+        print("❌ Indica las URLs de los nodos o define OLLAMA_NODES")
+        sys.exit(1)
+    with BalancedOllamaClient(urls) as client:
+        print_nodes(client)
+        if not any(node["healthy"] for node in client.describe()):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
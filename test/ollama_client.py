@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Cliente HTTP reutilizable para la API de Ollama
+Mantiene un pool de conexiones keep-alive para no pagar el coste de abrir
+una conexión TCP en cada petición, y reintenta solo los errores de conexión.
+"""
+
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, AsyncIterator, Dict, Iterator, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# URL por defecto; se puede cambiar con la variable de entorno OLLAMA_URL
+DEFAULT_BASE_URL = os.environ.get("OLLAMA_URL", "http://localhost:11434")
+
+class OllamaClient:
+    """Cliente síncrono con pool de conexiones, timeouts configurables y reintentos con backoff"""
+
+    def __init__(self, base_url: str = DEFAULT_BASE_URL, timeout: float = 180,
+                 connect_timeout: float = 5, pool_size: int = 10,
+                 retries: int = 3, backoff: float = 0.5,
+                 headers: Optional[Dict[str, str]] = None):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.retries = retries
+        self.backoff = backoff
+        # Cabeceras que se añaden a todas las peticiones (p. ej. X-Priority para gateway.py)
+        self.headers = dict(headers or {})
+        self.session = requests.Session()
+        # Sin reintentos de urllib3: los gestionamos aquí para limitarlos a errores de conexión
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def __enter__(self) -> "OllamaClient":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Cerrar todas las conexiones del pool"""
+        self.session.close()
+
+    def request(self, method: str, path: str, timeout: Optional[float] = None,
+                **kwargs) -> requests.Response:
+        """
+        Enviar una petición reutilizando las conexiones del pool.
+        Solo se reintentan los errores de conexión (el servidor no llegó a recibir la petición);
+        los timeouts de lectura y los errores HTTP se devuelven tal cual.
+        """
+        read_timeout = self.timeout if timeout is None else timeout
+        if self.headers:
+            kwargs["headers"] = {**self.headers, **(kwargs.get("headers") or {})}
+        attempt = 0
+        while True:
+            try:
+                return self.session.request(
+                    method,
+                    f"{self.base_url}{path}",
+                    timeout=(self.connect_timeout, read_timeout),
+                    **kwargs
+                )
+            except requests.exceptions.ConnectionError:
+                if attempt >= self.retries:
+                    raise
+                time.sleep(self.backoff * (2 ** attempt))
+                attempt += 1
+
+    def get(self, path: str, timeout: Optional[float] = None, **kwargs) -> requests.Response:
+        """Petición GET a la API"""
+        return self.request("GET", path, timeout=timeout, **kwargs)
+
+    def post(self, path: str, payload: Dict[str, Any], timeout: Optional[float] = None,
+             **kwargs) -> requests.Response:
+        """Petición POST con cuerpo JSON a la API"""
+        return self.request("POST", path, timeout=timeout, json=payload, **kwargs)
+
+    def stream(self, path: str, payload: Dict[str, Any],
+               timeout: Optional[float] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Enviar una petición en streaming y devolver los fragmentos NDJSON ya decodificados.
+        Un error HTTP se lanza como requests.exceptions.HTTPError con la respuesta adjunta.
+        """
+        with self.post(path, payload, timeout=timeout, stream=True) as response:
+            if response.status_code != 200:
+                raise requests.exceptions.HTTPError(response.text, response=response)
+            for line in response.iter_lines():
+                if line:
+                    yield json.loads(line)
+
+class AsyncOllamaClient:
+    """
+    Variante asíncrona del cliente. Ejecuta las peticiones del cliente síncrono en un
+    pool de hilos propio, de modo que comparte sus conexiones keep-alive y sus reintentos.
+    """
+
+    def __init__(self, client: Optional[OllamaClient] = None, max_workers: int = 10, **kwargs):
+        self.client = client or OllamaClient(pool_size=max_workers, **kwargs)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    async def __aenter__(self) -> "AsyncOllamaClient":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Detener el pool de hilos y cerrar las conexiones"""
+        self.executor.shutdown(wait=False)
+        self.client.close()
+
+    async def request(self, method: str, path: str, timeout: Optional[float] = None,
+                      **kwargs) -> requests.Response:
+        """Versión asíncrona de OllamaClient.request"""
+        loop = asyncio.get_running_loop()
+        call = partial(self.client.request, method, path, timeout=timeout, **kwargs)
+        return await loop.run_in_executor(self.executor, call)
+
+    async def get(self, path: str, timeout: Optional[float] = None, **kwargs) -> requests.Response:
+        """Petición GET asíncrona"""
+        return await self.request("GET", path, timeout=timeout, **kwargs)
+
+    async def post(self, path: str, payload: Dict[str, Any], timeout: Optional[float] = None,
+                   **kwargs) -> requests.Response:
+        """Petición POST asíncrona con cuerpo JSON"""
+        return await self.request("POST", path, timeout=timeout, json=payload, **kwargs)
+
+    async def stream(self, path: str, payload: Dict[str, Any],
+                     timeout: Optional[float] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Versión asíncrona de OllamaClient.stream: entrega cada fragmento en cuanto llega"""
+        loop = asyncio.get_running_loop()
+        chunks = self.client.stream(path, payload, timeout=timeout)
+        done = object()
+        try:
+            while True:
+                chunk = await loop.run_in_executor(self.executor, next, chunks, done)
+                if chunk is done:
+                    break
+                yield chunk
+        finally:
+            await loop.run_in_executor(self.executor, chunks.close)
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Métricas del cliente en formato Prometheus/OpenMetrics
+Cada petición hecha con generate() o generate_stream() se registra en histogramas de
+latencia, TTFT, tokens/s, evaluación del prompt y carga, y en contadores de peticiones,
+errores, timeouts y cortes por presupuesto de tiempo, etiquetados por modelo y categoría.
+
+Las métricas se pueden exponer en un endpoint HTTP para que Prometheus las recoja
+(start_metrics_server) o volcar a un fichero de texto OpenMetrics (write_metrics).
+"""
+
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+OPENMETRICS_CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+# Límites superiores de los buckets de cada histograma
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+TTFT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30)
+TOKENS_PER_SECOND_BUCKETS = (1, 2, 5, 10, 20, 30, 50, 75, 100, 150, 200)
+PROMPT_EVAL_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+LOAD_BUCKETS = (0.1, 0.5, 1, 2, 5, 10, 20, 30, 60, 120)
+
+LABEL_NAMES = ("model", "category")
+
+def _format_value(value: float) -> str:
+    """Número en el formato de exposición (enteros sin decimales, +Inf para el infinito)"""
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+def _escape(value: str) -> str:
+    """Escapar barras, comillas y saltos de línea en el valor de una etiqueta"""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(labels: Sequence[Tuple[str, str]]) -> str:
+    """Etiquetas en la forma {k="v",...}"""
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(str(value))}"' for key, value in labels) + "}"
+
+class Counter:
+    """Contador monótono con una serie por combinación de etiquetas"""
+
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, labels: Tuple[str, ...], amount: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self, openmetrics: bool) -> List[str]:
+        # En OpenMetrics la familia se declara sin el sufijo _total
+        family = self.name[:-len("_total")] if openmetrics else self.name
+        lines = [f"# HELP {family} {self.description}", f"# TYPE {family} counter"]
+        for labels, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_format_labels(list(zip(LABEL_NAMES, labels)))} {_format_value(value)}")
+        return lines
+
+class Histogram:
+    """Histograma acumulativo con buckets fijos y una serie por combinación de etiquetas"""
+
+    def __init__(self, name: str, description: str, buckets: Sequence[float]):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self.series: Dict[Tuple[str, ...], Dict[str, Any]] = {}
+
+    def observe(self, labels: Tuple[str, ...], value: float) -> None:
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series["counts"][i] += 1
+                break
+        series["sum"] += value
+        series["count"] += 1
+
+    def render(self, openmetrics: bool) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        for labels, series in sorted(self.series.items()):
+            base = list(zip(LABEL_NAMES, labels))
+            cumulative = 0
+            for bound, count in zip(self.buckets, series["counts"]):
+                cumulative += count
+                # OpenMetrics exige que 'le' sea siempre un número en coma flotante
+                le = repr(float(bound)) if openmetrics and bound != float("inf") else _format_value(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(base + [('le', le)])} {cumulative}")
+            lines.append(f"{self.name}_count{_format_labels(base)} {series['count']}")
+            lines.append(f"{self.name}_sum{_format_labels(base)} {_format_value(series['sum'])}")
+        return lines
+
+class MetricsRegistry:
+    """Conjunto de métricas de inferencia del cliente, seguro entre hilos"""
+
+    def __init__(self, prefix: str = "ollama_client"):
+        self.lock = threading.Lock()
+        self.requests = Counter(f"{prefix}_requests_total", "Peticiones enviadas a Ollama")
+        self.errors = Counter(f"{prefix}_errors_total",
+                              "Peticiones fallidas sin contar los timeouts ni los cortes por presupuesto")
+        self.timeouts = Counter(f"{prefix}_timeouts_total", "Peticiones que superaron el timeout")
+        self.deadline_cuts = Counter(f"{prefix}_deadline_cuts_total",
+                                     "Peticiones cortadas al agotarse el presupuesto de tiempo")
+        self.cache_hits = Counter(f"{prefix}_cache_hits_total",
+                                  "Respuestas servidas desde la caché (fuera de las métricas de latencia)")
+        self.latency = Histogram(f"{prefix}_request_latency_seconds",
+                                 "Latencia extremo a extremo de las peticiones correctas", LATENCY_BUCKETS)
+        self.ttft = Histogram(f"{prefix}_ttft_seconds",
+                              "Tiempo hasta el primer token (solo streaming)", TTFT_BUCKETS)
+        self.tokens_per_second = Histogram(f"{prefix}_tokens_per_second",
+                                           "Velocidad de generación (eval_count / eval_duration)",
+                                           TOKENS_PER_SECOND_BUCKETS)
+        self.prompt_eval = Histogram(f"{prefix}_prompt_eval_seconds",
+                                     "Tiempo de evaluación del prompt en el servidor", PROMPT_EVAL_BUCKETS)
+        self.load = Histogram(f"{prefix}_load_seconds",
+                              "Tiempo de carga del modelo en el servidor", LOAD_BUCKETS)
+        self.metrics = [self.requests, self.errors, self.timeouts, self.deadline_cuts, self.cache_hits,
+                        self.latency, self.ttft, self.tokens_per_second, self.prompt_eval, self.load]
+
+    def observe(self, result: Dict[str, Any], category: str) -> None:
+        """Registrar el diccionario de resultado de una petición"""
+        labels = (result["model"], category)
+        with self.lock:
+            if result.get("cached"):
+                self.cache_hits.inc(labels)
+                return
+            self.requests.inc(labels)
+            if not result["success"]:
+                if result["error"] == "timeout":
+                    self.timeouts.inc(labels)
+                elif result["error"] == "deadline":
+                    self.deadline_cuts.inc(labels)
+                else:
+                    self.errors.inc(labels)
+                return
+            self.latency.observe(labels, result["wall_time"])
+            if result.get("ttft") is not None:
+                self.ttft.observe(labels, result["ttft"])
+            if result.get("eval_duration"):
+                self.tokens_per_second.observe(labels, result["eval_count"] / (result["eval_duration"] / 1e9))
+            if result.get("prompt_eval_duration") is not None:
+                self.prompt_eval.observe(labels, result["prompt_eval_duration"] / 1e9)
+            if result.get("load_duration") is not None:
+                self.load.observe(labels, result["load_duration"] / 1e9)
+
+    def render(self, openmetrics: bool = True) -> str:
+        """Texto de exposición en formato OpenMetrics o en el formato clásico de Prometheus"""
+        with self.lock:
+            lines = [line for metric in self.metrics for line in metric.render(openmetrics)]
+        if openmetrics:
+            lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+# Registro global en el que escriben generate() y generate_stream()
+METRICS = MetricsRegistry()
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    """Servir /metrics; se responde en OpenMetrics si el cliente lo acepta"""
+
+    def do_GET(self) -> None:
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        openmetrics = "application/openmetrics-text" in self.headers.get("Accept", "")
+        body = self.server.registry.render(openmetrics).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", OPENMETRICS_CONTENT_TYPE if openmetrics else PROMETHEUS_CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass  # Los scrapes periódicos no deben ensuciar la salida del benchmark
+
+def start_metrics_server(port: int, host: str = "0.0.0.0",
+                         registry: Optional[MetricsRegistry] = None) -> ThreadingHTTPServer:
+    """Exponer las métricas en http://host:port/metrics desde un hilo de fondo"""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    server.registry = registry or METRICS
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def write_metrics(path: Path, registry: Optional[MetricsRegistry] = None) -> None:
+    """Volcar las métricas a un fichero de texto OpenMetrics"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text((registry or METRICS).render(openmetrics=True), encoding="utf-8")
@@ -5,11 +5,23 @@ Módulo compartido entre test_all_models.py y test_ollama.py
 """
 
 import requests
+import threading
 import time
-from typing import List, Dict, Any, Optional
+from contextlib import closing
+from typing import Callable, List, Dict, Any, Optional, Union
+
+from ollama_balancer import DEFAULT_NODES, BalancedOllamaClient
+from ollama_client import DEFAULT_BASE_URL, OllamaClient
+from model_catalog import ModelCatalog, category_from_name
+from ollama_metrics import METRICS
+from resource_sampler import ResourceSampler
+from response_cache import ResponseCache, cache_key, is_deterministic
+from think_parser import ThinkParser, split_reasoning
 
 # Configuración
-OLLAMA_BASE_URL = "http://localhost:11434"
+OLLAMA_BASE_URL = DEFAULT_BASE_URL
+# Varios nodos (OLLAMA_NODES) activan el balanceo de carga en el cliente
+OLLAMA_NODES = DEFAULT_NODES
 
 # Prompts específicos para cada tipo de modelo
 MODEL_TESTS = {
@@ -31,6 +43,22 @@ MODEL_TESTS = {
     }
 }
 
+# Modelos disponibles para testing
+AVAILABLE_MODELS = {
+    "opencoder-8b": "opencoder:8b",
+    "opencoder-1.5b": "opencoder:1.5b", 
+    "deepseek-coder-6.7b": "deepseek-coder:6.7b",
+    "deepseek-coder-1.3b": "deepseek-coder:1.3b",
+    "deepseek-r1": "deepseek-r1",
+    "deepseek-r1-1.5b": "deepseek-r1:1.5b",
+    "deepseek-r1-7b": "deepseek-r1:7b",
+    "deepseek-r1-8b": "deepseek-r1:8b",
+    "deepseek-r1-14b": "deepseek-r1:14b",
+    "deepseek-r1-32b": "deepseek-r1:32b",
+    "deepseek-r1-70b": "deepseek-r1:70b",
+    "genaiimagecsprompt": "alientelligence/genaiimagecsprompt"
+}
+
 # Prompts de ejemplo para diferentes tipos de modelos
 EXAMPLE_PROMPTS = {
     "coding": "Escribe una función en Python que calcule el factorial de un número usando recursión.",
@@ -39,10 +67,132 @@ EXAMPLE_PROMPTS = {
     "general": "Explica brevemente qué es la inteligencia artificial y sus aplicaciones principales."
 }
 
+# Métricas (en nanosegundos, salvo los contadores) que devuelve /api/generate
+SERVER_METRICS = [
+    "total_duration",
+    "load_duration",
+    "prompt_eval_count",
+    "prompt_eval_duration",
+    "eval_count",
+    "eval_duration"
+]
+
+# Cliente compartido por todas las utilidades (se crea al usarlo por primera vez)
+_client: Optional[OllamaClient] = None
+_client_lock = threading.Lock()
+
+def make_client(pool_size: int = 10, headers: Optional[Dict[str, str]] = None) -> OllamaClient:
+    """
+    Crear un cliente para OLLAMA_BASE_URL, o un balanceador si OLLAMA_NODES lista varios nodos.
+    'headers' se envía en todas las peticiones, a cualquier nodo.
+    """
+    if OLLAMA_NODES:
+        return BalancedOllamaClient(OLLAMA_NODES, pool_size=pool_size, headers=headers)
+    return OllamaClient(OLLAMA_BASE_URL, pool_size=pool_size, headers=headers)
+
+def get_client() -> OllamaClient:
+    """Obtener el cliente compartido, con su pool de conexiones keep-alive"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = make_client()
+        return _client
+
+def set_client(client: OllamaClient) -> None:
+    """Sustituir el cliente compartido (p. ej. para cambiar la URL o el tamaño del pool)"""
+    global _client
+    with _client_lock:
+        if _client is not None and _client is not client:
+            _client.close()
+        _client = client
+
+# Caché opcional de respuestas deterministas (desactivada salvo que se llame a set_cache)
+_cache: Optional[ResponseCache] = None
+
+def set_cache(cache: Optional[ResponseCache]) -> None:
+    """Activar la caché de respuestas para las peticiones con temperature 0 o seed fija"""
+    global _cache
+    _cache = cache
+
+def get_cache() -> Optional[ResponseCache]:
+    """Caché de respuestas activa, si la hay"""
+    return _cache
+
+# Muestreo de recursos opcional: cada petición terminada se registra con su inicio y su fin
+_sampler: Optional[ResourceSampler] = None
+
+def set_sampler(sampler: Optional[ResourceSampler]) -> None:
+    """Activar (o desactivar con None) el registro de peticiones en el muestreo de recursos"""
+    global _sampler
+    _sampler = sampler
+
+# Presupuesto global de tiempo: instante (time.time()) en que deben haber terminado todas las
+# peticiones; None = sin límite. Las que no han empezado se omiten y las que siguen en curso
+# se cortan cerrando la conexión, lo que detiene la generación y libera el hueco en el servidor.
+_deadline: Optional[float] = None
+
+# Error de las peticiones omitidas o cortadas al agotarse el presupuesto
+DEADLINE_ERROR = "deadline"
+
+def set_budget(seconds: Optional[float]) -> Optional[float]:
+    """Fijar un presupuesto de 'seconds' a partir de ahora (None lo quita); devuelve el instante límite"""
+    global _deadline
+    _deadline = time.time() + seconds if seconds is not None else None
+    return _deadline
+
+def budget_left() -> Optional[float]:
+    """Segundos que quedan del presupuesto, o None si no hay presupuesto"""
+    return max(0.0, _deadline - time.time()) if _deadline is not None else None
+
+def budget_exhausted() -> bool:
+    """Se ha alcanzado el instante límite del presupuesto"""
+    return _deadline is not None and time.time() >= _deadline
+
+def _bounded_timeout(timeout: float) -> float:
+    """Timeout de lectura recortado para no pasar del instante límite"""
+    left = budget_left()
+    return timeout if left is None else max(0.001, min(timeout, left))
+
+def skipped_result(model_name: str) -> Dict[str, Any]:
+    """Resultado de una petición que no se envió porque el presupuesto ya estaba agotado"""
+    result = new_result(model_name)
+    result["started_at"] = time.time()
+    result["error"] = DEADLINE_ERROR
+    result["skipped"] = True
+    return result
+
+def _cache_key(path: str, payload: Dict[str, Any]) -> Optional[str]:
+    """Clave de caché de una petición, o None si no se puede cachear"""
+    if _cache is None or not is_deterministic(payload.get("options")):
+        return None
+    digest = get_catalog().digest(payload["model"])
+    return cache_key(path, payload, digest) if digest else None
+
+# Índice local de modelos; se carga del disco y solo consulta al servidor si ha caducado
+_catalog: Optional[ModelCatalog] = None
+_catalog_lock = threading.Lock()
+
+def _refresh_catalog(force: bool) -> ModelCatalog:
+    """Actualizar el índice compartido; los errores de red se propagan"""
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = ModelCatalog()
+        _catalog.refresh(get_client(), force=force)
+        return _catalog
+
+def get_catalog(force: bool = False) -> ModelCatalog:
+    """Índice de modelos actualizado con /api/tags si ha caducado (o con force=True)"""
+    try:
+        return _refresh_catalog(force)
+    except (requests.exceptions.RequestException, ValueError) as e:
+        print(f"⚠️  No se pudo actualizar el índice de modelos: {e}")
+    return _catalog
+
 def check_ollama_status() -> bool:
     """Verificar si Ollama está ejecutándose"""
     try:
-        response = requests.get(f"{OLLAMA_BASE_URL}/api/version", timeout=5)
+        response = get_client().get("/api/version", timeout=5)
         if response.status_code == 200:
             version = response.json().get("version", "unknown")
             print(f"✅ Ollama está ejecutándose (versión: {version})")
@@ -52,187 +202,475 @@ def check_ollama_status() -> bool:
             return False
     except requests.exceptions.RequestException as e:
         print(f"❌ No se puede conectar con Ollama: {e}")
-        print(f"   Asegúrate de que Ollama esté ejecutándose en {OLLAMA_BASE_URL}")
+        print(f"   Asegúrate de que Ollama esté ejecutándose en {get_client().base_url}")
         return False
 
 def get_available_models() -> List[str]:
-    """Obtener lista de modelos disponibles"""
+    """
+    Obtener la lista actual de modelos con /api/tags; el índice local solo evita
+    repetir /api/show para los modelos cuyo digest no ha cambiado
+    """
     try:
-        response = requests.get(f"{OLLAMA_BASE_URL}/api/tags", timeout=10)
-        if response.status_code == 200:
-            models = response.json().get("models", [])
-            return [model.get("name") for model in models]
-        else:
-            print(f"❌ Error al obtener modelos: {response.status_code}")
-            return []
-    except requests.exceptions.RequestException as e:
-        print(f"❌ Error de conexión: {e}")
+        return _refresh_catalog(force=True).models()
+    except (requests.exceptions.RequestException, ValueError) as e:
+        print(f"❌ Error al obtener modelos: {e}")
         return []
 
+def get_ollama_version() -> str:
+    """Obtener la versión del servidor Ollama ('unknown' si no se puede consultar)"""
+    try:
+        response = get_client().get("/api/version", timeout=5)
+        if response.status_code == 200:
+            return response.json().get("version", "unknown")
+    except requests.exceptions.RequestException:
+        pass
+    return "unknown"
+
+def get_model_digests() -> Dict[str, str]:
+    """Obtener el digest actual (/api/tags) de cada modelo descargado, indexado por nombre"""
+    return get_catalog(force=True).digests()
+
 def list_available_models() -> List[str]:
     """Listar modelos disponibles en Ollama con información detallada"""
+    models = get_available_models()
+    catalog = get_catalog()
+    if not models:
+        print("📋 No hay modelos descargados")
+        return []
+    print("📋 Modelos disponibles:")
+    for name in models:
+        entry = catalog.get(name)
+        size_gb = entry["size"] / (1024**3)
+        details = ", ".join(str(value) for value in (entry["parameter_size"], entry["quantization"]) if value)
+        print(f"   • {name} ({size_gb:.1f}GB{', ' + details if details else ''})")
+    return models
+
+def get_loaded_models() -> Dict[str, Dict[str, Any]]:
+    """Obtener los modelos cargados en memoria según /api/ps, indexados por nombre"""
     try:
-        response = requests.get(f"{OLLAMA_BASE_URL}/api/tags", timeout=10)
+        response = get_client().get("/api/ps", timeout=10)
         if response.status_code == 200:
             models = response.json().get("models", [])
-            if models:
-                print("📋 Modelos disponibles:")
-                for model in models:
-                    name = model.get("name", "unknown")
-                    size = model.get("size", 0)
-                    size_gb = size / (1024**3) if size > 0 else 0
-                    print(f"   • {name} ({size_gb:.1f}GB)")
-                return [model.get("name") for model in models]
-            else:
-                print("📋 No hay modelos descargados")
-                return []
+            return {model.get("name"): model for model in models}
+    except requests.exceptions.RequestException:
+        pass
+    return {}
+
+def load_model(model_name: str, keep_alive: Union[str, int] = "5m", timeout: int = 600) -> Dict[str, Any]:
+    """
+    Cargar un modelo en memoria sin generar texto (petición sin prompt) y mantenerlo
+    residente durante 'keep_alive'. Con keep_alive=0 el modelo se descarga.
+    """
+    # Descargar (keep_alive=0) libera memoria y se permite aunque se haya agotado el presupuesto
+    unloading = keep_alive in (0, "0")
+    if not unloading and budget_exhausted():
+        return skipped_result(model_name)
+    result = new_result(model_name)
+    payload = {"model": model_name, "stream": False, "keep_alive": keep_alive}
+    start_time = result["started_at"] = time.time()
+    try:
+        response = get_client().post("/api/generate", payload,
+                                     timeout=timeout if unloading else _bounded_timeout(timeout))
+        if response.status_code == 200:
+            result["success"] = True
         else:
-            print(f"❌ Error al obtener modelos: {response.status_code}")
-            return []
+            result["status_code"] = response.status_code
+            result["error"] = response.text
+    except requests.exceptions.Timeout:
+        result["error"] = DEADLINE_ERROR if budget_exhausted() and not unloading else "timeout"
     except requests.exceptions.RequestException as e:
-        print(f"❌ Error al conectar con Ollama: {e}")
-        return []
+        result["error"] = str(e)
+    result["wall_time"] = time.time() - start_time
+    return result
+
+def unload_model(model_name: str, wait: float = 30) -> bool:
+    """Descargar un modelo de memoria y esperar hasta 'wait' segundos a que desaparezca de /api/ps"""
+    if not load_model(model_name, keep_alive=0)["success"]:
+        return False
+    deadline = time.time() + wait
+    while model_name in get_loaded_models():
+        if time.time() > deadline:
+            return False
+        time.sleep(0.5)
+    return True
 
 def categorize_model(model_name: str) -> str:
-    """Categorizar un modelo basado en su nombre"""
-    if "opencoder" in model_name:
-        return "opencoder"
-    elif "deepseek-coder" in model_name:
-        return "deepseek-coder"
-    elif "deepseek-r1" in model_name:
-        return "deepseek-r1"
-    elif "genaiimagecsprompt" in model_name:
-        return "genaiimagecsprompt"
-    else:
-        return "general"
+    """Categorizar un modelo con el índice local (por digest) o, si no está, por su nombre"""
+    if _catalog is not None:
+        return _catalog.category(model_name)
+    return category_from_name(model_name)
 
-def test_single_model(model_name: str, prompt: str, description: str, max_tokens: int = 300) -> bool:
-    """Probar un modelo individual"""
-    print(f"\n🤖 Probando: {model_name}")
-    print(f"📝 Tipo: {description}")
-    print(f"📋 Prompt: {prompt[:80]}{'...' if len(prompt) > 80 else ''}")
-    print("-" * 60)
-    
+def percentile(values: List[float], pct: float) -> float:
+    """Calcular un percentil (0-100) con interpolación lineal"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    lower = int(rank)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+def latency_summary(values: List[float]) -> Dict[str, float]:
+    """Resumir una lista de latencias en segundos (p50, p90, p99, media y máximo)"""
+    return {
+        "p50": percentile(values, 50),
+        "p90": percentile(values, 90),
+        "p99": percentile(values, 99),
+        "mean": sum(values) / len(values) if values else 0.0,
+        "max": max(values) if values else 0.0
+    }
+
+def build_payload(model_name: str, prompt: str, stream: bool, max_tokens: Optional[int] = 300,
+                  options: Optional[Dict[str, Any]] = None,
+                  keep_alive: Optional[Union[str, int]] = None) -> Dict[str, Any]:
+    """Construir el cuerpo de una petición a /api/generate"""
     payload = {
         "model": model_name,
         "prompt": prompt,
-        "stream": False,
-        "options": {
+        "stream": stream
+    }
+    if keep_alive is not None:
+        payload["keep_alive"] = keep_alive
+    if max_tokens is not None:
+        payload["options"] = {
             "num_predict": max_tokens,
             "temperature": 0.7,
             "top_p": 0.9
         }
+    if options:
+        payload.setdefault("options", {}).update(options)
+    return payload
+
+def new_result(model_name: str) -> Dict[str, Any]:
+    """Crear el diccionario de métricas vacío de una petición"""
+    return {
+        "model": model_name,
+        "success": False,
+        "error": None,
+        "status_code": None,
+        "response": "",
+        "started_at": 0.0,
+        "wall_time": 0.0,
+        "cached": False
     }
+
+def generate(model_name: str, prompt: str, max_tokens: Optional[int] = 300, timeout: int = 180,
+             options: Optional[Dict[str, Any]] = None,
+             client: Optional[OllamaClient] = None,
+             keep_alive: Optional[Union[str, int]] = None) -> Dict[str, Any]:
+    """Ejecutar una petición a /api/generate sin imprimir nada y devolver sus métricas"""
+    payload = build_payload(model_name, prompt, False, max_tokens, options, keep_alive)
+    cache_id = _cache_key("/api/generate", payload)
+    cached = _cache.get(cache_id) if cache_id else None
+    if cached is not None:
+        METRICS.observe(cached, categorize_model(model_name))
+        return cached
+    if budget_exhausted():
+        return skipped_result(model_name)
+    result = new_result(model_name)
     
+    start_time = result["started_at"] = time.time()
     try:
-        start_time = time.time()
-        response = requests.post(
-            f"{OLLAMA_BASE_URL}/api/generate",
-            json=payload,
-            timeout=180  # 3 minutos
-        )
-        end_time = time.time()
-        
+        # Sin streaming no hay resultado parcial: al llegar al límite se abandona la conexión
+        response = (client or get_client()).post("/api/generate", payload, timeout=_bounded_timeout(timeout))
         if response.status_code == 200:
-            result = response.json()
-            response_text = result.get("response", "")
-            total_duration = result.get("total_duration", 0) / 1e9
-            
-            print(f"✅ Respuesta ({total_duration:.2f}s):")
-            print(response_text[:200] + "..." if len(response_text) > 200 else response_text)
-            print(f"\n⏱️  Tiempo: {total_duration:.2f}s")
-            print(f"📊 Tokens: {result.get('eval_count', 0)}")
-            return True
+            data = response.json()
+            result["success"] = True
+            result["response"] = data.get("response", "")
+            for key in SERVER_METRICS:
+                result[key] = data.get(key, 0)
         else:
-            print(f"❌ Error: {response.status_code} - {response.text}")
-            return False
-            
+            result["status_code"] = response.status_code
+            result["error"] = response.text
     except requests.exceptions.Timeout:
-        print("❌ Timeout")
-        return False
+        result["error"] = DEADLINE_ERROR if budget_exhausted() else "timeout"
     except requests.exceptions.RequestException as e:
-        print(f"❌ Error: {e}")
-        return False
+        result["error"] = str(e)
+    result["wall_time"] = time.time() - start_time
+    if cache_id and result["success"]:
+        _cache.put(cache_id, result)
+    METRICS.observe(result, categorize_model(model_name))
+    if _sampler is not None:
+        _sampler.record(result)
+    return result
+
+def generate_stream(model_name: str, prompt: str, max_tokens: Optional[int] = 300, timeout: int = 180,
+                    options: Optional[Dict[str, Any]] = None,
+                    on_token: Optional[Callable[[str], None]] = None,
+                    client: Optional[OllamaClient] = None,
+                    keep_alive: Optional[Union[str, int]] = None,
+                    context: Optional[List[int]] = None) -> Dict[str, Any]:
+    """
+    Ejecutar /api/generate en modo streaming, consumiendo los fragmentos NDJSON según llegan.
+    Además de las métricas del servidor registra el tiempo hasta el primer token (ttft)
+    y los intervalos entre tokens (token_gaps). 'on_token' recibe cada fragmento de texto.
+    Si se pasa 'context' (puede ser una lista vacía), el resultado incluye el nuevo contexto
+    para encadenar la siguiente petición.
+    """
+    payload = build_payload(model_name, prompt, True, max_tokens, options, keep_alive)
+    if context is not None:
+        payload["context"] = context
+    return _stream_request("/api/generate", payload, timeout, on_token, client)
+
+def chat_stream(model_name: str, messages: List[Dict[str, str]], max_tokens: Optional[int] = 300,
+                timeout: int = 180, options: Optional[Dict[str, Any]] = None,
+                on_token: Optional[Callable[[str], None]] = None,
+                client: Optional[OllamaClient] = None,
+                keep_alive: Optional[Union[str, int]] = None) -> Dict[str, Any]:
+    """Versión de generate_stream para /api/chat: envía la conversación completa en 'messages'"""
+    payload = build_payload(model_name, "", True, max_tokens, options, keep_alive)
+    del payload["prompt"]
+    payload["messages"] = messages
+    return _stream_request("/api/chat", payload, timeout, on_token, client)
+
+def _stream_request(path: str, payload: Dict[str, Any], timeout: int,
+                    on_token: Optional[Callable[[str], None]],
+                    client: Optional[OllamaClient]) -> Dict[str, Any]:
+    """Consumir una respuesta en streaming de /api/generate o /api/chat y medirla"""
+    model_name = payload["model"]
+    cache_id = _cache_key(path, payload)
+    cached = _cache.get(cache_id) if cache_id else None
+    if cached is not None:
+        if on_token and cached["response"]:
+            on_token(cached["response"])
+        METRICS.observe(cached, categorize_model(model_name))
+        return cached
+    if budget_exhausted():
+        result = skipped_result(model_name)
+        result["ttft"] = None
+        return result
+    result = new_result(model_name)
+    result["ttft"] = None
+    result["token_gaps"] = []
+    chunks = []
+    
+    start_time = result["started_at"] = time.time()
+    # Separa el razonamiento (<think>…</think> o el campo 'thinking') de la respuesta
+    thinker = ThinkParser(start_time)
+    try:
+        last_token_time = None
+        # 'timeout' es el tiempo máximo de espera entre fragmentos
+        with closing((client or get_client()).stream(path, payload, timeout=_bounded_timeout(timeout))) as stream:
+            for data in stream:
+                if "error" in data:
+                    result["error"] = data["error"]
+                    break
+                # /api/chat devuelve el texto dentro de 'message'
+                message = data.get("message") or data
+                text = message.get("content", "") if "message" in data else data.get("response", "")
+                thinking = message.get("thinking", "")
+                if text or thinking:
+                    now = time.time()
+                    if last_token_time is None:
+                        result["ttft"] = now - start_time
+                    else:
+                        result["token_gaps"].append(now - last_token_time)
+                    last_token_time = now
+                    thinker.feed(text, thinking, now)
+                if text:
+                    chunks.append(text)
+                    if on_token:
+                        on_token(text)
+                if data.get("done"):
+                    result["success"] = True
+                    for key in SERVER_METRICS:
+                        result[key] = data.get(key, 0)
+                    if "context" in payload:
+                        result["context"] = data.get("context", [])
+                    break
+                if budget_exhausted():
+                    # Al salir, closing() cierra la conexión y Ollama deja de generar
+                    result["error"] = DEADLINE_ERROR
+                    break
+            else:
+                result["error"] = "stream cerrado antes de terminar"
+    except requests.exceptions.HTTPError as e:
+        result["status_code"] = e.response.status_code
+        result["error"] = e.response.text
+    except requests.exceptions.Timeout:
+        result["error"] = DEADLINE_ERROR if budget_exhausted() else "timeout"
+    except requests.exceptions.RequestException as e:
+        # Un timeout de lectura a mitad del stream llega como ConnectionError
+        result["error"] = DEADLINE_ERROR if budget_exhausted() else str(e)
+    result["response"] = "".join(chunks)
+    result["wall_time"] = time.time() - start_time
+    result["reasoning"] = thinker.finish()
+    if result["error"] == DEADLINE_ERROR:
+        # Métricas parciales medidas en el cliente hasta el corte
+        gaps = result["token_gaps"]
+        result["truncated"] = True
+        result["partial_tokens"] = len(gaps) + 1 if result["ttft"] is not None else 0
+        result["partial_tps"] = len(gaps) / sum(gaps) if gaps and sum(gaps) > 0 else None
+    if cache_id and result["success"]:
+        _cache.put(cache_id, result)
+    METRICS.observe(result, categorize_model(model_name))
+    if _sampler is not None:
+        _sampler.record(result)
+    return result
 
-def test_model(model_name: str, prompt: str, max_tokens: int = 500) -> bool:
+def format_error(result: Dict[str, Any]) -> str:
+    """Formatear el error de una petición fallida"""
+    if result["error"] == DEADLINE_ERROR:
+        if result.get("skipped"):
+            return "sin enviar: presupuesto de tiempo agotado"
+        if result.get("truncated"):
+            tps = f", {result['partial_tps']:.1f} tokens/s" if result["partial_tps"] else ""
+            return (f"cortada por el presupuesto a los {result['wall_time']:.1f}s "
+                    f"({result['partial_tokens']} tokens{tps})")
+        return f"abandonada por el presupuesto a los {result['wall_time']:.1f}s"
+    if result.get("status_code"):
+        return f"{result['status_code']} - {result['error']}"
+    return str(result["error"])
+
+def make_printer(limit: Optional[int] = None) -> Callable[[str], None]:
+    """Crear un callback que imprime los tokens según llegan, cortando tras 'limit' caracteres"""
+    printed = [0]
+    
+    def print_token(text: str) -> None:
+        if limit is not None and printed[0] >= limit:
+            return
+        if limit is not None and printed[0] + len(text) >= limit:
+            text = text[:limit - printed[0]] + "..."
+        printed[0] += len(text)
+        print(text, end="", flush=True)
+    
+    return print_token
+
+def print_stream_metrics(result: Dict[str, Any]) -> None:
+    """Mostrar las métricas de latencia de una petición en streaming"""
+    if result.get("ttft") is not None:
+        print(f"⚡ Primer token: {result['ttft']:.3f}s")
+    gaps = result.get("token_gaps", [])
+    if gaps:
+        itl = latency_summary(gaps)
+        print(f"⏳ Entre tokens: p50 {itl['p50'] * 1000:.1f}ms, p90 {itl['p90'] * 1000:.1f}ms, "
+              f"p99 {itl['p99'] * 1000:.1f}ms, máx {itl['max'] * 1000:.1f}ms")
+    if result["success"]:
+        print(f"🧮 Servidor: carga {result['load_duration'] / 1e9:.2f}s, "
+              f"prompt {result['prompt_eval_duration'] / 1e9:.2f}s, "
+              f"generación {result['eval_duration'] / 1e9:.2f}s")
+    reasoning = result.get("reasoning")
+    if reasoning:
+        print(f"🧠 Razonamiento: {reasoning['reasoning_tokens']} tokens, "
+              f"termina a los {_seconds(reasoning['think_time'])}")
+        tps = f"{reasoning['answer_tps']:.1f} tokens/s" if reasoning["answer_tps"] else "-"
+        print(f"💬 Respuesta: {reasoning['answer_tokens']} tokens, primer token a los "
+              f"{_seconds(reasoning['answer_ttft'])}, {tps}")
+
+def _seconds(value: Optional[float]) -> str:
+    """Segundos con tres decimales, o un aviso si la fase no llegó a producirse"""
+    return f"{value:.3f}s" if value is not None else "- (cortado por max_tokens)"
+
+def run_single_model(model_name: str, prompt: str, description: str, max_tokens: int = 300,
+                     stream: bool = False, options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Probar un modelo individual mostrando la respuesta y devolver las métricas de la petición"""
+    print(f"\n🤖 Probando: {model_name}")
+    print(f"📝 Tipo: {description}")
+    print(f"📋 Prompt: {prompt[:80]}{'...' if len(prompt) > 80 else ''}")
+    print("-" * 60)
+    
+    if stream:
+        print("✅ Respuesta (streaming):")
+        result = generate_stream(model_name, prompt, max_tokens, timeout=180, options=options,
+                                 on_token=make_printer(200))
+        print()
+    else:
+        result = generate(model_name, prompt, max_tokens, timeout=180, options=options)  # 3 minutos
+    
+    if result["success"]:
+        total_duration = result["total_duration"] / 1e9
+        
+        reasoning_text, response_text = split_reasoning(result["response"])
+        if reasoning_text:
+            # Los 200 caracteres se reservan para la respuesta, no para el razonamiento
+            if stream:
+                print("💬 Respuesta final:")
+            else:
+                print(f"✅ Respuesta ({total_duration:.2f}s, razonamiento de {len(reasoning_text)} caracteres omitido):")
+            print(response_text[:200] + "..." if len(response_text) > 200 else response_text)
+        elif not stream:
+            print(f"✅ Respuesta ({total_duration:.2f}s):")
+            print(response_text[:200] + "..." if len(response_text) > 200 else response_text)
+        print(f"\n⏱️  Tiempo: {total_duration:.2f}s")
+        print(f"📊 Tokens: {result['eval_count']}")
+        if result["cached"]:
+            print("💾 Respuesta servida desde la caché (no cuenta en las métricas de latencia)")
+        elif stream:
+            print_stream_metrics(result)
+    elif result["error"] == DEADLINE_ERROR:
+        print(f"⏳ {format_error(result).capitalize()}")
+    elif result["error"] == "timeout":
+        print("❌ Timeout")
+    else:
+        print(f"❌ Error: {format_error(result)}")
+    return result
+
+def test_single_model(model_name: str, prompt: str, description: str, max_tokens: int = 300,
+                      stream: bool = False, options: Optional[Dict[str, Any]] = None) -> bool:
+    """Probar un modelo individual"""
+    return run_single_model(model_name, prompt, description, max_tokens, stream, options)["success"]
+
+def test_model(model_name: str, prompt: str, max_tokens: int = 500, stream: bool = False,
+               options: Optional[Dict[str, Any]] = None) -> bool:
     """Probar un modelo específico con un prompt (versión completa)"""
     print(f"\n🤖 Probando modelo: {model_name}")
     print(f"📝 Prompt: {prompt[:100]}{'...' if len(prompt) > 100 else ''}")
     print("-" * 60)
     
-    payload = {
-        "model": model_name,
-        "prompt": prompt,
-        "stream": False,
-        "options": {
-            "num_predict": max_tokens,
-            "temperature": 0.7,
-            "top_p": 0.9
-        }
-    }
+    if stream:
+        print("✅ Respuesta (streaming):")
+        result = generate_stream(model_name, prompt, max_tokens, timeout=120, options=options,
+                                 on_token=make_printer())
+        print()
+    else:
+        result = generate(model_name, prompt, max_tokens, timeout=120, options=options)  # 2 minutos de timeout
     
-    try:
-        start_time = time.time()
-        response = requests.post(
-            f"{OLLAMA_BASE_URL}/api/generate",
-            json=payload,
-            timeout=120  # 2 minutos de timeout
-        )
-        end_time = time.time()
+    if result["success"]:
+        total_duration = result["total_duration"] / 1e9
         
-        if response.status_code == 200:
-            result = response.json()
-            response_text = result.get("response", "")
-            total_duration = result.get("total_duration", 0) / 1e9
-            
+        if not stream:
             print(f"✅ Respuesta ({total_duration:.2f}s):")
-            print(response_text)
-            print(f"\n⏱️  Tiempo total: {total_duration:.2f}s")
-            print(f"📊 Tokens generados: {result.get('eval_count', 0)}")
-            return True
-        else:
-            error_msg = response.text
-            print(f"❌ Error en la respuesta: {response.status_code}")
-            print(f"   Detalles: {error_msg}")
-            return False
-            
-    except requests.exceptions.Timeout:
+            print(result["response"])
+        print(f"\n⏱️  Tiempo total: {total_duration:.2f}s")
+        print(f"📊 Tokens generados: {result['eval_count']}")
+        if result["cached"]:
+            print("💾 Respuesta servida desde la caché (no cuenta en las métricas de latencia)")
+        elif stream:
+            print_stream_metrics(result)
+        return True
+    elif result["error"] == DEADLINE_ERROR:
+        print(f"⏳ {format_error(result).capitalize()}")
+        return False
+    elif result["error"] == "timeout":
         print("❌ Timeout: La respuesta tardó demasiado")
         return False
-    except requests.exceptions.RequestException as e:
-        print(f"❌ Error de conexión: {e}")
+    elif result["status_code"]:
+        print(f"❌ Error en la respuesta: {result['status_code']}")
+        print(f"   Detalles: {result['error']}")
+        return False
+    else:
+        print(f"❌ Error de conexión: {result['error']}")
         return False
 
-def test_image_generation(model_name: str, prompt: str) -> bool:
+def test_image_generation(model_name: str, prompt: str, stream: bool = False) -> bool:
     """Probar generación de imágenes (para modelos como SDXL)"""
     print(f"\n🎨 Probando generación de imagen con: {model_name}")
     print(f"📝 Prompt: {prompt}")
     print("-" * 60)
     
-    payload = {
-        "model": model_name,
-        "prompt": prompt,
-        "stream": False
-    }
+    # Sin opciones de muestreo: se usan las del propio modelo
+    if stream:
+        result = generate_stream(model_name, prompt, max_tokens=None, timeout=300, on_token=make_printer())
+        print()
+    else:
+        result = generate(model_name, prompt, max_tokens=None, timeout=300)  # 5 minutos para generación de imágenes
     
-    try:
-        start_time = time.time()
-        response = requests.post(
-            f"{OLLAMA_BASE_URL}/api/generate",
-            json=payload,
-            timeout=300  # 5 minutos para generación de imágenes
-        )
-        end_time = time.time()
-        
-        if response.status_code == 200:
-            result = response.json()
-            print("✅ Imagen generada exitosamente")
-            print(f"⏱️  Tiempo: {end_time - start_time:.2f}s")
-            return True
-        else:
-            print(f"❌ Error: {response.status_code} - {response.text}")
-            return False
-            
-    except requests.exceptions.RequestException as e:
-        print(f"❌ Error: {e}")
-        return False 
\ No newline at end of file
+    if result["success"]:
+        print("✅ Imagen generada exitosamente")
+        print(f"⏱️  Tiempo: {result['wall_time']:.2f}s")
+        if stream:
+            print_stream_metrics(result)
+        return True
+    else:
+        print(f"❌ Error: {format_error(result)}")
+        return False
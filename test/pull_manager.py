@@ -0,0 +1,391 @@
+#!/usr/bin/env python3
+"""
+Descarga de varios modelos en paralelo con /api/pull
+Lanza varias descargas a la vez (limitando cuántas y, opcionalmente, cuándo empieza
+una nueva según el caudal total), muestra el progreso de cada capa, comprueba antes
+el espacio libre en data/ollama, reintenta las descargas interrumpidas (Ollama
+reanuda las capas a medio descargar) y termina con el caudal agregado.
+
+Uso: python pull_manager.py [modelo ...] [--parallel 3] [--max-mbps 200] [--json]
+     (sin modelos descarga los de AVAILABLE_MODELS que falten)
+"""
+
+import argparse
+import json
+import os
+import re
+import shutil
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing, nullcontext, redirect_stdout
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import requests
+
+# Importar utilidades comunes
+try:
+    from ollama_test_utils import (
+        check_ollama_status,
+        get_available_models,
+        get_client,
+        AVAILABLE_MODELS
+    )
+except ImportError as e:
+    print(f"❌ Error: No se puede importar {e.name or 'un módulo'}: {e}")
+    print("   Asegúrate de que los scripts de test/ estén en el mismo directorio "
+          "y de haber instalado test/requirements.txt")
+    sys.exit(1)
+
+# Volumen de modelos de docker-compose.yml; se puede cambiar con OLLAMA_MODELS_DIR
+DEFAULT_MODELS_DIR = Path(os.environ.get(
+    "OLLAMA_MODELS_DIR",
+    Path(__file__).resolve().parent.parent / "data" / "ollama"
+))
+
+# Tamaño aproximado con cuantización Q4 (GB por mil millones de parámetros), para
+# estimar el espacio necesario antes de que el servidor informe del tamaño real
+GB_PER_BILLION = 0.65
+DEFAULT_SIZE_GB = 5.0
+
+# Segundos de historial para calcular el caudal actual
+RATE_WINDOW = 5.0
+
+class DiskSpaceError(Exception):
+    """Lo que queda por descargar no cabe en disco"""
+
+def estimate_size(model_name: str) -> int:
+    """Bytes estimados de un modelo a partir de la etiqueta (p. ej. ':7b')"""
+    match = re.search(r"(\d+(?:\.\d+)?)b\b", model_name)
+    size_gb = float(match.group(1)) * GB_PER_BILLION if match else DEFAULT_SIZE_GB
+    return int(size_gb * 1024**3)
+
+def free_space(path: Path) -> int:
+    """Bytes libres en el sistema de ficheros de 'path' (o del primer directorio que exista)"""
+    path = path.resolve()
+    while not path.exists():
+        path = path.parent
+    return shutil.disk_usage(path).free
+
+def format_bytes(size: float) -> str:
+    """Tamaño legible en MB o GB"""
+    if size >= 1024**3:
+        return f"{size / 1024**3:.1f}GB"
+    return f"{size / 1024**2:.0f}MB"
+
+class PullJob:
+    """Estado de la descarga de un modelo: capas, intentos y bytes descargados en esta sesión"""
+
+    def __init__(self, model: str):
+        self.model = model
+        self.status = "pendiente"
+        # Otros hilos suman las capas de todas las descargas mientras esta añade las suyas
+        self.lock = threading.Lock()
+        self.layers: Dict[str, Dict[str, int]] = {}
+        self.attempts = 0
+        self.error: Optional[str] = None
+        self.success = False
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.resumed_from = 0
+        self.last_report = 0.0
+
+    def _layers(self) -> List[Dict[str, int]]:
+        with self.lock:
+            return [dict(layer) for layer in self.layers.values()]
+
+    @property
+    def total(self) -> int:
+        return sum(layer["total"] for layer in self._layers())
+
+    @property
+    def completed(self) -> int:
+        return sum(layer["completed"] for layer in self._layers())
+
+    @property
+    def downloaded(self) -> int:
+        """Bytes descargados en esta sesión (sin contar lo que ya había de descargas anteriores)"""
+        return sum(layer["completed"] - layer["initial"] for layer in self._layers())
+
+    @property
+    def elapsed(self) -> float:
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+class PullManager:
+    """
+    Ejecuta las descargas en un pool de 'parallel' hilos. Ollama descarga por su cuenta,
+    así que el cliente no puede limitar el ancho de banda de una descarga en curso: con
+    'max_mbps' una descarga nueva espera mientras el caudal total supera el límite.
+    """
+
+    def __init__(self, client, parallel: int = 3, max_mbps: Optional[float] = None,
+                 retries: int = 3, backoff: float = 5.0, timeout: float = 300,
+                 models_dir: Path = DEFAULT_MODELS_DIR, reserve_gb: float = 2.0,
+                 json_output: bool = False):
+        self.client = client
+        self.parallel = parallel
+        self.max_rate = max_mbps * 1024**2 if max_mbps else None
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.models_dir = models_dir
+        self.reserve = int(reserve_gb * 1024**3)
+        self.json_output = json_output
+        self.jobs: List[PullJob] = []
+        self.lock = threading.Lock()
+        self.history: deque = deque()
+        self.start_time = 0.0
+
+    def emit(self, job: PullJob, event: str, **fields) -> None:
+        """Informar del progreso: una línea JSON por evento o un mensaje legible"""
+        if self.json_output:
+            line = {"time": round(time.time(), 3), "model": job.model, "event": event,
+                    "completed": job.completed, "total": job.total, **fields}
+            with self.lock:
+                print(json.dumps(line, ensure_ascii=False), flush=True)
+            return
+        messages = {
+            "start": f"⬇️  {job.model}: iniciando descarga (intento {job.attempts})",
+            "status": f"   {job.model}: {fields.get('status')}",
+            "progress": (f"   {job.model}: {job.completed / job.total * 100 if job.total else 0:.0f}% "
+                         f"({format_bytes(job.completed)}/{format_bytes(job.total)}, "
+                         f"{fields.get('rate', 0) / 1024**2:.1f}MB/s)"),
+            "retry": f"⚠️  {job.model}: {fields.get('error')}; reintento en {fields.get('wait', 0):g}s",
+            "done": f"✅ {job.model}: descargado en {job.elapsed:.1f}s",
+            "failed": f"❌ {job.model}: {job.error}"
+        }
+        with self.lock:
+            print(messages[event], flush=True)
+
+    def rate(self) -> float:
+        """Caudal total (bytes/s) en los últimos RATE_WINDOW segundos"""
+        with self.lock:
+            if len(self.history) < 2:
+                return 0.0
+            (t0, b0), (t1, b1) = self.history[0], self.history[-1]
+            return (b1 - b0) / (t1 - t0) if t1 > t0 else 0.0
+
+    def _account(self) -> None:
+        """Guardar un punto del historial de bytes descargados para calcular el caudal"""
+        now = time.time()
+        total = sum(job.downloaded for job in self.jobs)
+        with self.lock:
+            self.history.append((now, total))
+            while len(self.history) > 2 and self.history[0][0] < now - RATE_WINDOW:
+                self.history.popleft()
+
+    def _wait_for_bandwidth(self) -> None:
+        """Con límite de caudal, no empezar una descarga nueva mientras se supere"""
+        if self.max_rate is None:
+            return
+        while self.rate() > self.max_rate and any(j.status == "descargando" for j in self.jobs):
+            time.sleep(1)
+
+    def _check_space(self, job: PullJob) -> None:
+        """Abortar si lo que queda por descargar de todas las capas conocidas no cabe en disco"""
+        remaining = sum(j.total - j.completed for j in self.jobs if j.status == "descargando")
+        free = free_space(self.models_dir)
+        if remaining > free - self.reserve:
+            raise DiskSpaceError(f"sin espacio: faltan {format_bytes(remaining)} y quedan "
+                                 f"{format_bytes(free)} libres en {self.models_dir}")
+
+    def _on_chunk(self, job: PullJob, data: Dict[str, Any]) -> None:
+        status = data.get("status", "")
+        digest = data.get("digest")
+        if digest and data.get("total"):
+            completed = data.get("completed", 0)
+            with job.lock:
+                layer = job.layers.get(digest)
+                if layer is None:
+                    # Primera noticia de la capa: lo ya completado viene de una descarga anterior
+                    job.layers[digest] = {"total": data["total"], "completed": completed, "initial": completed}
+                    job.resumed_from += completed
+                else:
+                    layer["completed"] = completed
+            if layer is None:
+                self._check_space(job)
+            self._account()
+            now = time.time()
+            if now - job.last_report >= 2:
+                job.last_report = now
+                self.emit(job, "progress", rate=self.rate())
+        elif status and status != job.status:
+            job.status = "descargando" if status.startswith("pulling") else status
+            self.emit(job, "status", status=status)
+
+    def _pull_once(self, job: PullJob) -> None:
+        """Un intento de descarga; lanza una excepción si se interrumpe"""
+        payload = {"model": job.model, "stream": True}
+        job.status = "descargando"
+        with closing(self.client.stream("/api/pull", payload, timeout=self.timeout)) as stream:
+            for data in stream:
+                if "error" in data:
+                    raise RuntimeError(data["error"])
+                self._on_chunk(job, data)
+                if data.get("status") == "success":
+                    return
+        raise RuntimeError("stream cerrado antes de terminar")
+
+    def pull(self, job: PullJob) -> PullJob:
+        """Descargar un modelo reintentando con espera exponencial"""
+        self._wait_for_bandwidth()
+        job.started = time.time()
+        for attempt in range(self.retries + 1):
+            job.attempts = attempt + 1
+            self.emit(job, "start")
+            try:
+                self._pull_once(job)
+                job.success = True
+                job.status = "completado"
+                break
+            except DiskSpaceError as e:
+                # Reintentar no sirve: hay que liberar espacio
+                job.error = str(e)
+                break
+            except requests.exceptions.HTTPError as e:
+                job.error = f"{e.response.status_code} - {e.response.text.strip()}"
+                if e.response.status_code < 500:
+                    # Modelo inexistente o petición incorrecta: no se arregla reintentando
+                    break
+            except (requests.exceptions.RequestException, RuntimeError, ValueError) as e:
+                job.error = str(e)
+            if attempt < self.retries:
+                wait = self.backoff * 2 ** attempt
+                self.emit(job, "retry", error=job.error, wait=wait)
+                job.status = "esperando"
+                time.sleep(wait)
+        job.finished = time.time()
+        if job.success:
+            job.error = None
+            self.emit(job, "done")
+        else:
+            job.status = "fallido"
+            self.emit(job, "failed")
+        return job
+
+    def run(self, models: List[str]) -> List[PullJob]:
+        """Descargar todos los modelos con como mucho 'parallel' descargas a la vez"""
+        self.jobs = [PullJob(model) for model in models]
+        self.start_time = time.time()
+        with ThreadPoolExecutor(max_workers=self.parallel) as executor:
+            list(executor.map(self.pull, self.jobs))
+        return self.jobs
+
+    def summary(self) -> Dict[str, Any]:
+        """Totales de la sesión"""
+        wall_time = time.time() - self.start_time
+        downloaded = sum(job.downloaded for job in self.jobs)
+        return {
+            "event": "summary",
+            "models": len(self.jobs),
+            "succeeded": sum(job.success for job in self.jobs),
+            "failed": [job.model for job in self.jobs if not job.success],
+            "downloaded": downloaded,
+            "seconds": round(wall_time, 3),
+            "rate": downloaded / wall_time if wall_time > 0 else 0.0
+        }
+
+    def print_report(self) -> None:
+        """Resumen por modelo y caudal agregado"""
+        summary = self.summary()
+        print("\n" + "=" * 50)
+        print("📊 RESUMEN DE DESCARGAS")
+        print("=" * 50)
+        for job in self.jobs:
+            rate = job.downloaded / job.elapsed if job.elapsed else 0.0
+            resumed = f", reanudado desde {format_bytes(job.resumed_from)}" if job.resumed_from else ""
+            icon = "✅" if job.success else "❌"
+            print(f"{icon} {job.model}: {format_bytes(job.total)}, {format_bytes(job.downloaded)} descargados "
+                  f"en {job.elapsed:.1f}s ({rate / 1024**2:.1f}MB/s), {job.attempts} intentos{resumed}")
+            if job.error:
+                print(f"   {job.error}")
+        print(f"\n🎯 {summary['succeeded']}/{summary['models']} modelos descargados")
+        print(f"🚀 Caudal agregado: {format_bytes(summary['downloaded'])} en {summary['seconds']:.1f}s "
+              f"({summary['rate'] / 1024**2:.1f}MB/s)")
+
+def parse_args() -> argparse.Namespace:
+    """Leer los argumentos de la línea de comandos"""
+    parser = argparse.ArgumentParser(description="Descargar varios modelos en paralelo")
+    parser.add_argument("models", nargs="*",
+                        help="Modelos (clave de AVAILABLE_MODELS o nombre); por defecto, "
+                             "los de AVAILABLE_MODELS que no estén descargados")
+    parser.add_argument("--parallel", type=int, default=3,
+                        help="Descargas simultáneas (por defecto: 3)")
+    parser.add_argument("--max-mbps", type=float, default=None,
+                        help="No empezar descargas nuevas mientras el caudal total supere estos MB/s")
+    parser.add_argument("--retries", type=int, default=3,
+                        help="Reintentos por modelo si la descarga se interrumpe (por defecto: 3)")
+    parser.add_argument("--backoff", type=float, default=5.0,
+                        help="Espera antes del primer reintento, doblándose en cada uno (por defecto: 5s)")
+    parser.add_argument("--timeout", type=float, default=300,
+                        help="Segundos máximos sin recibir progreso (por defecto: 300)")
+    parser.add_argument("--models-dir", type=Path, default=DEFAULT_MODELS_DIR,
+                        help=f"Directorio de los modelos para comprobar el espacio "
+                             f"(por defecto: {DEFAULT_MODELS_DIR})")
+    parser.add_argument("--reserve-gb", type=float, default=2.0,
+                        help="Espacio que debe quedar libre tras las descargas (por defecto: 2GB)")
+    parser.add_argument("--update", action="store_true",
+                        help="Volver a descargar también los modelos ya presentes (actualizarlos)")
+    parser.add_argument("--json", action="store_true",
+                        help="Mostrar el progreso como una línea JSON por evento")
+    return parser.parse_args()
+
+def select_models(args: argparse.Namespace) -> Optional[List[str]]:
+    """Modelos a descargar tras comprobar el servidor y el espacio libre; None si no se puede"""
+    if not check_ollama_status():
+        return None
+    downloaded = set(get_available_models())
+    models = [AVAILABLE_MODELS.get(name, name) for name in args.models] or list(AVAILABLE_MODELS.values())
+    if not args.update:
+        # /api/tags añade ':latest' a los modelos sin etiqueta
+        pending = [m for m in models if m not in downloaded and f"{m}:latest" not in downloaded]
+        for model in sorted(set(models) - set(pending)):
+            print(f"⏭️  {model} ya está descargado (usa --update para actualizarlo)")
+        models = pending
+    if not models:
+        print("📋 No hay modelos que descargar")
+        return models
+
+    needed = sum(estimate_size(model) for model in models)
+    free = free_space(args.models_dir)
+    print(f"💽 Espacio estimado: {format_bytes(needed)}, libre: {format_bytes(free)} en {args.models_dir}")
+    if needed > free - args.reserve_gb * 1024**3:
+        print(f"❌ No hay espacio suficiente (se reservan {args.reserve_gb:g}GB); descarga menos modelos")
+        return None
+    return models
+
+def main():
+    """Función principal"""
+    args = parse_args()
+
+    # Con --json la salida estándar solo lleva eventos JSON; los mensajes van a stderr
+    with redirect_stdout(sys.stderr) if args.json else nullcontext():
+        print("📦 Gestor de Descargas de Ollama")
+        print("=" * 50)
+        models = select_models(args)
+    if models is None:
+        sys.exit(1)
+    if not models:
+        return
+
+    manager = PullManager(get_client(), parallel=args.parallel, max_mbps=args.max_mbps,
+                          retries=args.retries, backoff=args.backoff, timeout=args.timeout,
+                          models_dir=args.models_dir, reserve_gb=args.reserve_gb,
+                          json_output=args.json)
+    jobs = manager.run(models)
+    if args.json:
+        print(json.dumps(manager.summary(), ensure_ascii=False))
+    else:
+        manager.print_report()
+    # Actualizar el índice local con los modelos nuevos
+    get_available_models()
+    if not all(job.success for job in jobs):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""
+Muestreo de recursos de Ollama alineado con las peticiones
+Un hilo de fondo lee a intervalo fijo el uso de CPU y la memoria residente del
+contenedor 'ollama' (cgroup) o de los procesos 'ollama' locales (procfs), además de
+la memoria de cada modelo según /api/ps. Cada petición terminada se anota con las
+muestras tomadas entre su inicio y su fin, para relacionar los picos de latencia
+con la presión de memoria o la contención de CPU.
+
+Uso: python resource_sampler.py [--duration 10] [--interval 1] [--container ollama]
+     (los scripts de prueba lo activan con --resources FICHERO)
+"""
+
+import argparse
+import bisect
+import json
+import os
+import statistics
+import subprocess
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import requests
+
+# Contenedor de docker-compose.yml
+DEFAULT_CONTAINER = "ollama"
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+class ProcessSource:
+    """Procesos locales cuyo nombre empieza por 'ollama' (el servidor y sus runners)"""
+
+    def __init__(self, prefix: str = "ollama"):
+        self.prefix = prefix
+        self.name = "procfs"
+
+    def _pids(self) -> List[str]:
+        pids = []
+        for entry in os.listdir("/proc"):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f"/proc/{entry}/comm") as f:
+                    if f.read().strip().startswith(self.prefix):
+                        pids.append(entry)
+            except OSError:
+                continue
+        return pids
+
+    def read(self) -> Optional[Tuple[float, int]]:
+        """Segundos de CPU acumulados y bytes residentes; None si no hay procesos"""
+        cpu, rss, found = 0.0, 0, False
+        for pid in self._pids():
+            try:
+                with open(f"/proc/{pid}/stat") as f:
+                    # El nombre va entre paréntesis y puede contener espacios
+                    fields = f.read().rsplit(")", 1)[1].split()
+                with open(f"/proc/{pid}/statm") as f:
+                    pages = int(f.read().split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            # utime y stime son los campos 14 y 15 de /proc/PID/stat
+            cpu += (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+            rss += pages * PAGE_SIZE
+            found = True
+        return (cpu, rss) if found else None
+
+class CgroupSource:
+    """Contadores del cgroup de un contenedor (cgroup v2 o v1)"""
+
+    def __init__(self, cpu_file: Path, memory_file: Path, cpu_scale: float,
+                 cpu_key: Optional[str] = None):
+        self.cpu_file = cpu_file
+        self.memory_file = memory_file
+        self.cpu_scale = cpu_scale
+        self.cpu_key = cpu_key
+        self.name = f"cgroup {memory_file.parent}"
+
+    def read(self) -> Optional[Tuple[float, int]]:
+        try:
+            text = self.cpu_file.read_text()
+            memory = int(self.memory_file.read_text().split()[0])
+        except (OSError, ValueError, IndexError):
+            return None
+        if self.cpu_key:
+            # cpu.stat (v2): líneas 'clave valor'
+            values = dict(line.split() for line in text.splitlines() if line.strip())
+            usage = int(values[self.cpu_key])
+        else:
+            usage = int(text.split()[0])
+        return usage / self.cpu_scale, memory
+
+def container_id(name: str) -> Optional[str]:
+    """Identificador completo del contenedor según 'docker inspect'"""
+    try:
+        output = subprocess.run(["docker", "inspect", "--format", "{{.Id}}", name],
+                                capture_output=True, text=True, timeout=10, check=True)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return output.stdout.strip() or None
+
+def find_cgroup(container: str) -> Optional[CgroupSource]:
+    """Buscar el cgroup del contenedor con los drivers systemd y cgroupfs"""
+    cid = container_id(container)
+    if not cid:
+        return None
+    root = Path("/sys/fs/cgroup")
+    for path in (root / "system.slice" / f"docker-{cid}.scope", root / "docker" / cid):
+        if (path / "memory.current").exists():
+            return CgroupSource(path / "cpu.stat", path / "memory.current", 1e6, "usage_usec")
+    cpu = root / "cpuacct" / "docker" / cid / "cpuacct.usage"
+    memory = root / "memory" / "docker" / cid / "memory.usage_in_bytes"
+    if cpu.exists() and memory.exists():
+        return CgroupSource(cpu, memory, 1e9)
+    return None
+
+def detect_source(container: str = DEFAULT_CONTAINER):
+    """El cgroup del contenedor si se encuentra; si no, los procesos locales"""
+    source = find_cgroup(container)
+    if source is not None:
+        return source
+    source = ProcessSource()
+    return source if source.read() is not None else None
+
+class ResourceSampler:
+    """
+    Hilo que toma una muestra cada 'interval' segundos: CPU (100% = un núcleo),
+    memoria residente y memoria de cada modelo según /api/ps.
+    Las peticiones se registran con record() al terminar.
+    """
+
+    def __init__(self, client=None, interval: float = 1.0, container: str = DEFAULT_CONTAINER):
+        self.client = client
+        self.interval = interval
+        self.source = detect_source(container)
+        self.samples: List[Dict[str, Any]] = []
+        self.requests: List[Dict[str, Any]] = []
+        self.lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._last: Optional[Tuple[float, float]] = None
+        self.started = 0.0
+
+    def describe(self) -> str:
+        if self.source is None:
+            return "sin acceso a cgroup ni procfs, solo /api/ps"
+        return self.source.name
+
+    def start(self) -> "ResourceSampler":
+        self.started = time.time()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        self.sample()
+
+    def __enter__(self) -> "ResourceSampler":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def _loop(self) -> None:
+        while True:
+            self.sample()
+            if self._stop.wait(self.interval):
+                return
+
+    def _model_memory(self) -> Optional[Dict[str, int]]:
+        if self.client is None:
+            return None
+        try:
+            response = self.client.get("/api/ps", timeout=2)
+            if response.status_code == 200:
+                return {m.get("name"): m.get("size", 0) for m in response.json().get("models", [])}
+        except (requests.exceptions.RequestException, ValueError):
+            pass
+        return None
+
+    def sample(self) -> None:
+        """Tomar una muestra; la CPU se calcula respecto a la muestra anterior"""
+        now = time.time()
+        sample: Dict[str, Any] = {"time": now, "cpu": None, "rss": None}
+        reading = self.source.read() if self.source else None
+        if reading is not None:
+            cpu_seconds, sample["rss"] = reading
+            if self._last is not None and now > self._last[0]:
+                sample["cpu"] = max(0.0, (cpu_seconds - self._last[1]) / (now - self._last[0]) * 100)
+            self._last = (now, cpu_seconds)
+        sample["models"] = self._model_memory()
+        with self.lock:
+            self.samples.append(sample)
+
+    def record(self, result: Dict[str, Any]) -> None:
+        """Registrar una petición terminada con su inicio y su fin"""
+        if result.get("cached") or not result.get("started_at"):
+            return
+        with self.lock:
+            self.requests.append({
+                "model": result["model"],
+                "start": result["started_at"],
+                "end": result["started_at"] + result["wall_time"],
+                "wall_time": result["wall_time"],
+                "ttft": result.get("ttft"),
+                "success": result["success"],
+                "load_duration": result.get("load_duration", 0) / 1e9
+            })
+
+    def _window(self, start: float, end: float) -> List[Dict[str, Any]]:
+        """Muestras tomadas durante una petición, o la más cercana si es más corta que el intervalo"""
+        times = [s["time"] for s in self.samples]
+        lo, hi = bisect.bisect_left(times, start), bisect.bisect_right(times, end)
+        if lo < hi:
+            return self.samples[lo:hi]
+        if not self.samples:
+            return []
+        nearest = min(range(max(0, lo - 1), min(len(times), lo + 1)), key=lambda i: abs(times[i] - end))
+        return [self.samples[nearest]]
+
+    def annotated_requests(self) -> List[Dict[str, Any]]:
+        """Cada petición con la CPU, la memoria y los modelos residentes durante su ejecución"""
+        annotated = []
+        with self.lock:
+            for request in sorted(self.requests, key=lambda r: r["start"]):
+                window = self._window(request["start"], request["end"])
+                cpu = [s["cpu"] for s in window if s["cpu"] is not None]
+                rss = [s["rss"] for s in window if s["rss"] is not None]
+                models = [s["models"] for s in window if s["models"] is not None]
+                annotated.append({
+                    **request,
+                    "offset": request["start"] - self.started,
+                    "samples": len(window),
+                    "cpu_mean": statistics.mean(cpu) if cpu else None,
+                    "cpu_max": max(cpu) if cpu else None,
+                    "rss_max": max(rss) if rss else None,
+                    "models_loaded": sorted(set().union(*models)) if models else None,
+                    "model_memory_max": max(sum(m.values()) for m in models) if models else None
+                })
+        return annotated
+
+    def write(self, path: Path) -> None:
+        """Guardar las muestras y las peticiones anotadas en un fichero JSON"""
+        data = {
+            "source": self.describe(),
+            "interval": self.interval,
+            "started": self.started,
+            "samples": [{**s, "offset": s["time"] - self.started} for s in self.samples],
+            "requests": self.annotated_requests()
+        }
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(data, indent=2, ensure_ascii=False), encoding="utf-8")
+
+    def print_summary(self, slowest: int = 5) -> None:
+        """Resumen general, por modelo y de las peticiones más lentas"""
+        cpu = [s["cpu"] for s in self.samples if s["cpu"] is not None]
+        rss = [s["rss"] for s in self.samples if s["rss"] is not None]
+        models = [sum(s["models"].values()) for s in self.samples if s["models"] is not None]
+        print(f"\n🖥️  Recursos ({self.describe()}, {len(self.samples)} muestras cada {self.interval:g}s)")
+        if cpu:
+            print(f"   CPU media {statistics.mean(cpu):.0f}% (máx {max(cpu):.0f}%)")
+        if rss:
+            print(f"   Memoria residente máx {max(rss) / 1024**3:.1f}GB")
+        if models:
+            print(f"   Memoria de modelos (/api/ps) máx {max(models) / 1024**3:.1f}GB")
+
+        annotated = self.annotated_requests()
+        if not annotated:
+            return
+        by_model: Dict[str, List[Dict[str, Any]]] = {}
+        for request in annotated:
+            by_model.setdefault(request["model"], []).append(request)
+        print(f"   {'Modelo':<36}{'Peticiones':>11}{'Latencia máx':>14}{'CPU media':>11}{'RSS máx':>10}")
+        for model, items in by_model.items():
+            cpu_means = [r["cpu_mean"] for r in items if r["cpu_mean"] is not None]
+            rss_max = [r["rss_max"] for r in items if r["rss_max"] is not None]
+            cpu_text = f"{statistics.mean(cpu_means):.0f}%" if cpu_means else "-"
+            rss_text = f"{max(rss_max) / 1024**3:.1f}GB" if rss_max else "-"
+            print(f"   {model:<36}{len(items):>11}{max(r['wall_time'] for r in items):>13.2f}s"
+                  f"{cpu_text:>11}{rss_text:>10}")
+
+        print("   🐢 Peticiones más lentas:")
+        for request in sorted(annotated, key=lambda r: r["wall_time"], reverse=True)[:slowest]:
+            details = []
+            if request["cpu_max"] is not None:
+                details.append(f"CPU máx {request['cpu_max']:.0f}%")
+            if request["rss_max"] is not None:
+                details.append(f"RSS {request['rss_max'] / 1024**3:.1f}GB")
+            if request["load_duration"] > 0.1:
+                details.append(f"carga {request['load_duration']:.2f}s")
+            loaded = request["models_loaded"]
+            if loaded is not None:
+                names = ", ".join(loaded) if len(loaded) <= 3 else f"{len(loaded)} modelos"
+                details.append(f"en memoria: {names or 'ninguno'} "
+                               f"({request['model_memory_max'] / 1024**3:.1f}GB)")
+            print(f"      • {request['model']} a los {request['offset']:.1f}s: "
+                  f"{request['wall_time']:.2f}s ({'; '.join(details)})")
+
+def main():
+    """Función principal: muestrear durante un tiempo fijo y mostrar el resumen"""
+    parser = argparse.ArgumentParser(description="Muestrear CPU y memoria de Ollama")
+    parser.add_argument("--duration", type=float, default=10, help="Segundos de muestreo (por defecto: 10)")
+    parser.add_argument("--interval", type=float, default=1.0, help="Segundos entre muestras (por defecto: 1)")
+    parser.add_argument("--container", default=DEFAULT_CONTAINER,
+                        help=f"Contenedor de Ollama (por defecto: {DEFAULT_CONTAINER})")
+    parser.add_argument("--output", type=Path, default=None, help="Guardar las muestras en un fichero JSON")
+    args = parser.parse_args()
+
+    # Importación tardía: ollama_test_utils también usa este módulo
+    from ollama_test_utils import get_client
+    sampler = ResourceSampler(get_client(), args.interval, args.container)
+    print(f"🖥️  Muestreando {args.duration:g}s ({sampler.describe()})...")
+    with sampler:
+        time.sleep(args.duration)
+    sampler.print_summary()
+    if args.output:
+        sampler.write(args.output)
+        print(f"💾 Muestras guardadas en {args.output}")
+
+if __name__ == "__main__":
+    main()
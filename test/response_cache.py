@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Caché determinista de respuestas para repetir ejecuciones sin volver a inferir
+La clave es el hash del digest del modelo, el prompt (o los mensajes) y las opciones,
+y solo se usa cuando la respuesta es reproducible: temperature 0 o una seed fija.
+Tiene dos niveles: un LRU en memoria y un almacén en disco limitado por tamaño.
+
+Los resultados servidos desde la caché llevan cached=True y no cuentan en las
+métricas de latencia.
+
+Uso: python response_cache.py stats
+     python response_cache.py clear
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+# Directorio por defecto junto a los datos de Ollama; se puede cambiar con OLLAMA_CACHE
+DEFAULT_CACHE_DIR = Path(os.environ.get(
+    "OLLAMA_CACHE",
+    Path(__file__).resolve().parent.parent / "data" / "cache"
+))
+
+# Campos de la petición que no cambian la respuesta
+IGNORED_FIELDS = ("model", "stream", "keep_alive")
+
+def is_deterministic(options: Optional[Dict[str, Any]]) -> bool:
+    """Una respuesta es reproducible con temperature 0 o con una seed fija"""
+    options = options or {}
+    return options.get("temperature") == 0 or options.get("seed") is not None
+
+def cache_key(path: str, payload: Dict[str, Any], digest: str) -> str:
+    """Hash del endpoint, el digest del modelo y el resto de la petición"""
+    request = {key: value for key, value in payload.items() if key not in IGNORED_FIELDS}
+    content = json.dumps({"path": path, "digest": digest, "request": request},
+                         sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    """LRU en memoria respaldado por un directorio con expulsión por tamaño total"""
+
+    def __init__(self, path: Path = DEFAULT_CACHE_DIR, memory_entries: int = 256,
+                 max_bytes: int = 256 * 1024**2):
+        self.path = Path(path)
+        self.memory_entries = memory_entries
+        self.max_bytes = max_bytes
+        self.memory: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        # Índice del disco: clave -> (tamaño, último uso), ordenado del menos al más reciente
+        self.index: "OrderedDict[str, list]" = OrderedDict()
+        self.disk_bytes = 0
+        self._scan()
+
+    def _scan(self) -> None:
+        """Reconstruir el índice del disco a partir de los ficheros existentes"""
+        if not self.path.exists():
+            return
+        entries = []
+        for file in self.path.glob("*/*.json"):
+            stat = file.stat()
+            entries.append((stat.st_mtime, file.stem, stat.st_size))
+        for mtime, key, size in sorted(entries):
+            self.index[key] = [size, mtime]
+            self.disk_bytes += size
+
+    def _file(self, key: str) -> Path:
+        return self.path / key[:2] / f"{key}.json"
+
+    def _remember(self, key: str, result: Dict[str, Any]) -> None:
+        self.memory[key] = result
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_entries:
+            self.memory.popitem(last=False)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Buscar una respuesta; devuelve una copia marcada con cached=True"""
+        with self.lock:
+            result = self.memory.get(key)
+            if result is not None:
+                self.memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return {**result, "cached": True}
+            if key in self.index:
+                file = self._file(key)
+                try:
+                    result = json.loads(file.read_text(encoding="utf-8"))
+                except (OSError, ValueError):
+                    # Fichero borrado o a medio escribir: se trata como un fallo
+                    self.disk_bytes -= self.index.pop(key)[0]
+                else:
+                    now = time.time()
+                    os.utime(file, (now, now))
+                    self.index[key][1] = now
+                    self.index.move_to_end(key)
+                    self._remember(key, result)
+                    self.stats["disk_hits"] += 1
+                    return {**result, "cached": True}
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, key: str, result: Dict[str, Any]) -> None:
+        """Guardar una respuesta correcta en memoria y en disco"""
+        stored = {k: v for k, v in result.items() if k != "cached"}
+        data = json.dumps(stored, ensure_ascii=False).encode("utf-8")
+        file = self._file(key)
+        with self.lock:
+            self._remember(key, stored)
+            file.parent.mkdir(parents=True, exist_ok=True)
+            tmp = file.with_name(file.name + ".tmp")
+            tmp.write_bytes(data)
+            os.replace(tmp, file)
+            if key in self.index:
+                self.disk_bytes -= self.index[key][0]
+            self.index[key] = [len(data), time.time()]
+            self.index.move_to_end(key)
+            self.disk_bytes += len(data)
+            self.stats["stores"] += 1
+            self._evict()
+
+    def _evict(self) -> None:
+        """Borrar del disco las entradas usadas hace más tiempo hasta caber en max_bytes"""
+        while self.disk_bytes > self.max_bytes and len(self.index) > 1:
+            key, (size, _) = self.index.popitem(last=False)
+            try:
+                self._file(key).unlink()
+            except FileNotFoundError:
+                pass
+            self.memory.pop(key, None)
+            self.disk_bytes -= size
+            self.stats["evictions"] += 1
+
+    def clear(self) -> int:
+        """Vaciar la caché y devolver el número de entradas borradas"""
+        with self.lock:
+            removed = len(self.index)
+            for key in list(self.index):
+                try:
+                    self._file(key).unlink()
+                except FileNotFoundError:
+                    pass
+            self.index.clear()
+            self.memory.clear()
+            self.disk_bytes = 0
+            return removed
+
+    def hit_rate(self) -> float:
+        """Fracción de búsquedas servidas desde la caché"""
+        hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+        total = hits + self.stats["misses"]
+        return hits / total if total else 0.0
+
+    def print_stats(self) -> None:
+        """Mostrar aciertos, fallos y ocupación"""
+        stats = self.stats
+        print(f"💾 Caché de respuestas: {stats['memory_hits']} aciertos en memoria, "
+              f"{stats['disk_hits']} en disco, {stats['misses']} fallos "
+              f"({self.hit_rate() * 100:.0f}% de aciertos)")
+        print(f"   {len(self.index)} entradas, {self.disk_bytes / 1024**2:.1f}MB de "
+              f"{self.max_bytes / 1024**2:.0f}MB, {stats['evictions']} expulsadas")
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description="Consultar o vaciar la caché de respuestas")
+    parser.add_argument("--cache-dir", type=Path, default=DEFAULT_CACHE_DIR,
+                        help=f"Directorio de la caché (por defecto: {DEFAULT_CACHE_DIR})")
+    parser.add_argument("command", choices=["stats", "clear"])
+    args = parser.parse_args()
+
+    cache = ResponseCache(args.cache_dir)
+    if args.command == "stats":
+        print(f"💾 {cache.path}: {len(cache.index)} entradas, {cache.disk_bytes / 1024**2:.1f}MB")
+    else:
+        print(f"🗑️  {cache.clear()} entradas borradas de {cache.path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+Almacén persistente de resultados de benchmark
+Guarda las métricas de cada petición en un fichero JSONL de solo añadir y compara
+ejecuciones para detectar regresiones de rendimiento por modelo.
+
+Uso: python results_store.py list
+     python results_store.py baseline [RUN_ID]
+     python results_store.py report [--run RUN_ID] [--baseline RUN_ID] [--threshold 10]
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+# Importar utilidades comunes
+try:
+    from ollama_test_utils import percentile, SERVER_METRICS
+except ImportError as e:
+    print(f"❌ Error: No se puede importar {e.name or 'un módulo'}: {e}")
+    print("   Asegúrate de que los scripts de test/ estén en el mismo directorio "
+          "y de haber instalado test/requirements.txt")
+    sys.exit(1)
+
+# Ruta por defecto junto a los datos de Ollama; se puede cambiar con OLLAMA_RESULTS
+DEFAULT_RESULTS_PATH = Path(os.environ.get(
+    "OLLAMA_RESULTS",
+    Path(__file__).resolve().parent.parent / "data" / "benchmarks" / "results.jsonl"
+))
+
+# Campos de cada resultado que se guardan además de SERVER_METRICS
+RECORD_FIELDS = ["model", "category", "success", "error", "wall_time", "ttft"]
+
+class ResultsStore:
+    """Fichero JSONL de solo añadir con una línea por petición"""
+
+    def __init__(self, path: Path = DEFAULT_RESULTS_PATH):
+        self.path = Path(path)
+        self.baseline_path = self.path.with_name(self.path.stem + ".baseline")
+        self.lock = threading.Lock()
+
+    def start_run(self, source: str, ollama_version: str, digests: Dict[str, str]) -> "RunWriter":
+        """Empezar una nueva ejecución y devolver el objeto que añade sus resultados"""
+        return RunWriter(self, source, ollama_version, digests)
+
+    def append(self, record: Dict[str, Any]) -> None:
+        """Añadir un registro al final del fichero (seguro entre hilos)"""
+        line = json.dumps(record, ensure_ascii=False)
+        with self.lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+    def records(self) -> Iterator[Dict[str, Any]]:
+        """Recorrer todos los registros guardados, ignorando líneas corruptas"""
+        if not self.path.exists():
+            return
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+
+    def runs(self) -> List[Dict[str, Any]]:
+        """Listar las ejecuciones guardadas en orden cronológico"""
+        runs: Dict[str, Dict[str, Any]] = {}
+        for record in self.records():
+            run = runs.setdefault(record["run_id"], {
+                "run_id": record["run_id"],
+                "timestamp": record["timestamp"],
+                "source": record.get("source", ""),
+                "ollama_version": record.get("ollama_version", "unknown"),
+                "requests": 0
+            })
+            run["requests"] += 1
+        return sorted(runs.values(), key=lambda run: run["timestamp"])
+
+    def load_run(self, run_id: str) -> List[Dict[str, Any]]:
+        """Obtener los registros de una ejecución"""
+        return [record for record in self.records() if record["run_id"] == run_id]
+
+    def baselines(self) -> Dict[str, str]:
+        """Ejecución marcada como referencia para cada script (campo 'source')"""
+        if not self.baseline_path.exists():
+            return {}
+        text = self.baseline_path.read_text(encoding="utf-8").strip()
+        try:
+            data = json.loads(text)
+        except json.JSONDecodeError:
+            data = None
+        if isinstance(data, dict):
+            return {str(source): str(run_id) for source, run_id in data.items()}
+        # Formato anterior: un solo run_id, que vale como referencia de su propio script
+        run = next((run for run in self.runs() if run["run_id"] == text), None)
+        return {run["source"]: text} if run else {}
+
+    def get_baseline(self, source: str) -> Optional[str]:
+        """Obtener la ejecución marcada como referencia para un script, si la hay"""
+        return self.baselines().get(source)
+
+    def set_baseline(self, run_id: str, source: str) -> None:
+        """Marcar una ejecución como referencia de los informes de su script"""
+        baselines = self.baselines()
+        baselines[source] = run_id
+        self.baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        self.baseline_path.write_text(json.dumps(baselines, ensure_ascii=False, indent=2) + "\n",
+                                      encoding="utf-8")
+
+class RunWriter:
+    """Añade al almacén los resultados de una ejecución con sus metadatos comunes"""
+
+    def __init__(self, store: ResultsStore, source: str, ollama_version: str, digests: Dict[str, str]):
+        self.store = store
+        self.run_id = time.strftime("%Y%m%d-%H%M%S") + "-" + uuid.uuid4().hex[:6]
+        self.timestamp = time.time()
+        self.source = source
+        self.ollama_version = ollama_version
+        self.digests = digests
+
+    def add(self, result: Dict[str, Any]) -> None:
+        """Guardar el resultado de una petición (no se guardan las de la caché ni las no enviadas)"""
+        if result.get("cached") or result.get("skipped"):
+            return
+        record = {
+            "run_id": self.run_id,
+            "timestamp": self.timestamp,
+            "source": self.source,
+            "ollama_version": self.ollama_version,
+            "digest": self.digests.get(result["model"], "")
+        }
+        for key in RECORD_FIELDS + SERVER_METRICS:
+            record[key] = result.get(key)
+        self.store.append(record)
+
+def tokens_per_second(record: Dict[str, Any]) -> Optional[float]:
+    """Velocidad de generación según el servidor (eval_count / eval_duration)"""
+    if record.get("eval_count") and record.get("eval_duration"):
+        return record["eval_count"] / (record["eval_duration"] / 1e9)
+    return None
+
+def model_stats(records: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Agrupar por modelo y calcular medianas de tokens/s, latencia y TTFT"""
+    stats: Dict[str, Dict[str, Any]] = {}
+    for model in sorted({r["model"] for r in records}):
+        model_records = [r for r in records if r["model"] == model]
+        ok = [r for r in model_records if r["success"]]
+        speeds = [s for s in (tokens_per_second(r) for r in ok) if s is not None]
+        ttfts = [r["ttft"] for r in ok if r.get("ttft") is not None]
+        stats[model] = {
+            "requests": len(model_records),
+            "successful": len(ok),
+            "digest": model_records[-1].get("digest", ""),
+            "tokens_per_second": percentile(speeds, 50) if speeds else None,
+            "latency": percentile([r["wall_time"] for r in ok], 50) if ok else None,
+            "ttft": percentile(ttfts, 50) if ttfts else None
+        }
+    return stats
+
+def compare_runs(current: List[Dict[str, Any]], baseline: List[Dict[str, Any]],
+                 threshold: float) -> List[Dict[str, Any]]:
+    """Comparar dos ejecuciones modelo a modelo y marcar las regresiones por encima del umbral (%)"""
+    current_stats = model_stats(current)
+    baseline_stats = model_stats(baseline)
+    rows = []
+    for model, now in current_stats.items():
+        before = baseline_stats.get(model)
+        if before is None:
+            continue
+        row = {"model": model, "regressions": [], "digest_changed": now["digest"] != before["digest"]}
+        # Para tokens/s una bajada es regresión; para las latencias, una subida
+        for metric, higher_is_better in [("tokens_per_second", True), ("latency", False), ("ttft", False)]:
+            if now[metric] is None or not before[metric]:
+                row[metric] = None
+                continue
+            change = (now[metric] - before[metric]) / before[metric] * 100
+            row[metric] = (before[metric], now[metric], change)
+            if (-change if higher_is_better else change) > threshold:
+                row["regressions"].append(metric)
+        rows.append(row)
+    return rows
+
+def print_report(store: ResultsStore, run_id: Optional[str], baseline_id: Optional[str],
+                 threshold: float) -> bool:
+    """Mostrar el informe de regresiones; devuelve False si se detectó alguna"""
+    runs = store.runs()
+    if not runs:
+        print(f"📋 No hay resultados guardados en {store.path}")
+        return True
+    run_ids = [run["run_id"] for run in runs]
+    current = next((run for run in runs if run["run_id"] == run_id), None) if run_id else runs[-1]
+    if current is None:
+        print(f"❌ Ejecución '{run_id}' no encontrada")
+        return False
+
+    # Referencia: la indicada, la marcada con 'baseline' para este script o su ejecución anterior
+    baseline_id = baseline_id or store.get_baseline(current["source"])
+    if not baseline_id or baseline_id == current["run_id"]:
+        previous = [run for run in runs[:run_ids.index(current["run_id"])] if run["source"] == current["source"]]
+        if not previous:
+            print("📋 No hay una ejecución anterior con la que comparar")
+            return True
+        baseline_id = previous[-1]["run_id"]
+    baseline = next((run for run in runs if run["run_id"] == baseline_id), None)
+    if baseline is None:
+        print(f"❌ Ejecución de referencia '{baseline_id}' no encontrada")
+        return False
+    if baseline["source"] != current["source"]:
+        # Scripts distintos miden cargas distintas: la comparación daría regresiones falsas
+        print(f"❌ La referencia {baseline['run_id']} es de {baseline['source'] or 'otro script'} y "
+              f"la ejecución {current['run_id']} de {current['source'] or 'otro script'}: no son comparables")
+        return False
+
+    print("📊 INFORME DE REGRESIONES")
+    print("=" * 50)
+    print(f"   Actual:     {current['run_id']} (Ollama {current['ollama_version']})")
+    print(f"   Referencia: {baseline['run_id']} (Ollama {baseline['ollama_version']})")
+    print(f"   Umbral:     {threshold:.0f}%")
+    print("-" * 50)
+
+    def fmt(value: Any, unit: str) -> str:
+        if value is None:
+            return "-"
+        before, now, change = value
+        return f"{before:.2f}→{now:.2f}{unit} ({change:+.1f}%)"
+
+    rows = compare_runs(store.load_run(current["run_id"]), store.load_run(baseline["run_id"]), threshold)
+    if not rows:
+        print("📋 No hay modelos en común entre las dos ejecuciones")
+        return True
+    for row in rows:
+        status = "❌" if row["regressions"] else "✅"
+        digest = " [digest distinto]" if row["digest_changed"] else ""
+        print(f"{status} {row['model']}{digest}")
+        print(f"   tokens/s {fmt(row['tokens_per_second'], '')}   "
+              f"latencia {fmt(row['latency'], 's')}   TTFT {fmt(row['ttft'], 's')}")
+
+    regressions = [row for row in rows if row["regressions"]]
+    if regressions:
+        print(f"\n⚠️  Regresiones en {len(regressions)}/{len(rows)} modelos")
+        return False
+    print(f"\n🎉 Sin regresiones en {len(rows)} modelos")
+    return True
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description="Consultar los resultados de benchmark guardados")
+    parser.add_argument("--results", type=Path, default=DEFAULT_RESULTS_PATH,
+                        help=f"Fichero de resultados (por defecto: {DEFAULT_RESULTS_PATH})")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="Listar las ejecuciones guardadas")
+    baseline_parser = commands.add_parser("baseline", help="Marcar una ejecución como referencia")
+    baseline_parser.add_argument("run_id", nargs="?", help="Ejecución (por defecto: la última)")
+    report_parser = commands.add_parser("report", help="Comparar una ejecución con la referencia")
+    report_parser.add_argument("--run", help="Ejecución a evaluar (por defecto: la última)")
+    report_parser.add_argument("--baseline", help="Ejecución de referencia del mismo script (por "
+                                                  "defecto: la marcada o la anterior)")
+    report_parser.add_argument("--threshold", type=float, default=10,
+                               help="Porcentaje de empeoramiento que cuenta como regresión (por defecto: 10)")
+    args = parser.parse_args()
+
+    store = ResultsStore(args.results)
+    if args.command == "list":
+        runs = store.runs()
+        if not runs:
+            print(f"📋 No hay resultados guardados en {store.path}")
+        baselines = store.baselines()
+        for run in runs:
+            marker = " ⭐" if baselines.get(run["source"]) == run["run_id"] else ""
+            date = time.strftime("%Y-%m-%d %H:%M", time.localtime(run["timestamp"]))
+            print(f"   • {run['run_id']} {date} {run['source']} "
+                  f"(Ollama {run['ollama_version']}, {run['requests']} peticiones){marker}")
+    elif args.command == "baseline":
+        runs = store.runs()
+        run_id = args.run_id or (runs[-1]["run_id"] if runs else None)
+        run = next((run for run in runs if run["run_id"] == run_id), None)
+        if run is None:
+            print("❌ Ejecución no encontrada")
+            sys.exit(1)
+        store.set_baseline(run_id, run["source"])
+        print(f"⭐ Referencia de {run['source']}: {run_id}")
+    elif not print_report(store, args.run, args.baseline, args.threshold):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
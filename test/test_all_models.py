@@ -1,98 +1,365 @@
 #!/usr/bin/env python3
 """
 Script para probar automáticamente todos los modelos disponibles en Ollama
-Uso: python test_all_models.py
+Uso: python test_all_models.py [--workers N] [--per-model N] [--repeat N] [--stream] [--no-save]
+                              [--schedule [--memory-gb X]]
 """
 
+import argparse
 import sys
+import threading
 import time
-from typing import List, Dict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Callable, List, Dict, Any, Optional, Tuple
 
 # Importar utilidades comunes
 try:
     from ollama_test_utils import (
-        check_ollama_status, 
-        get_available_models, 
-        categorize_model, 
-        test_single_model, 
+        check_ollama_status,
+        budget_exhausted,
+        get_available_models,
+        get_cache,
+        categorize_model,
+        generate,
+        get_client,
+        generate_stream,
+        format_error,
+        get_model_digests,
+        get_loaded_models,
+        get_ollama_version,
+        make_client,
+        run_single_model,
+        set_cache,
+        set_client,
+        set_budget,
+        set_sampler,
+        skipped_result,
+        DEADLINE_ERROR,
         MODEL_TESTS
     )
-except ImportError:
-    print("❌ Error: No se puede importar ollama_test_utils.py")
-    print("   Asegúrate de que el archivo esté en el mismo directorio")
+    from ollama_metrics import start_metrics_server, write_metrics
+    from resource_sampler import ResourceSampler
+    from response_cache import ResponseCache
+    from results_store import ResultsStore, DEFAULT_RESULTS_PATH
+    from model_scheduler import (
+        compare_orders,
+        default_memory_budget,
+        get_model_sizes,
+        plan_order,
+        print_comparison
+    )
+except ImportError as e:
+    print(f"❌ Error: No se puede importar {e.name or 'un módulo'}: {e}")
+    print("   Asegúrate de que los scripts de test/ estén en el mismo directorio "
+          "y de haber instalado test/requirements.txt")
     sys.exit(1)
 
+# Prompt genérico para modelos no categorizados
+GENERAL_TEST = {
+    "prompt": "Explica brevemente qué es la inteligencia artificial.",
+    "description": "Test general"
+}
+
+def parse_args() -> argparse.Namespace:
+    """Leer los argumentos de la línea de comandos"""
+    parser = argparse.ArgumentParser(description="Test automático de todos los modelos de Ollama")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Peticiones simultáneas en total (1 = modo secuencial, por defecto)")
+    parser.add_argument("--per-model", type=int, default=1,
+                        help="Máximo de peticiones simultáneas a un mismo modelo (por defecto: 1)")
+    parser.add_argument("--repeat", type=int, default=1,
+                        help="Número de peticiones por modelo (por defecto: 1)")
+    parser.add_argument("--stream", action="store_true",
+                        help="Usar streaming y medir el tiempo hasta el primer token")
+    parser.add_argument("--results", type=Path, default=DEFAULT_RESULTS_PATH,
+                        help=f"Fichero donde guardar las métricas (por defecto: {DEFAULT_RESULTS_PATH})")
+    parser.add_argument("--no-save", action="store_true",
+                        help="No guardar las métricas de esta ejecución")
+    parser.add_argument("--schedule", action="store_true",
+                        help="Ordenar el trabajo para cargar cada modelo una sola vez "
+                             "(primero los residentes, después por tamaño)")
+    parser.add_argument("--memory-gb", type=float, default=None,
+                        help="Memoria para modelos que se supone al estimar las cargas evitadas "
+                             "(por defecto: el tamaño del mayor)")
+    parser.add_argument("--cache", action="store_true",
+                        help="Reutilizar respuestas ya generadas (fija --seed 0 si no se indica otra)")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="Semilla de generación; hace las respuestas reproducibles y cacheables")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="Exponer métricas Prometheus en http://localhost:PUERTO/metrics")
+    parser.add_argument("--metrics-file", type=Path, default=None,
+                        help="Volcar las métricas en formato OpenMetrics a este fichero al terminar")
+    parser.add_argument("--resources", type=Path, default=None,
+                        help="Muestrear CPU y memoria de Ollama y guardar en este fichero JSON "
+                             "las muestras alineadas con cada petición")
+    parser.add_argument("--resource-interval", type=float, default=1.0,
+                        help="Segundos entre muestras de recursos (por defecto: 1)")
+    parser.add_argument("--budget", type=float, default=None,
+                        help="Tiempo total máximo en segundos: al agotarse se cortan las peticiones "
+                             "en curso y no se empiezan más")
+    args = parser.parse_args()
+    if args.workers < 1 or args.per_model < 1 or args.repeat < 1:
+        parser.error("--workers, --per-model y --repeat deben ser >= 1")
+    if args.budget is not None and args.budget <= 0:
+        parser.error("--budget debe ser > 0")
+    return args
+
+def get_test_config(model_name: str) -> Tuple[str, Dict[str, str]]:
+    """Obtener la categoría y el test que corresponde a un modelo"""
+    category = categorize_model(model_name)
+    return category, MODEL_TESTS.get(category, GENERAL_TEST)
+
+def run_serial(jobs: List[str], stream: bool, on_result: Callable[[Dict[str, Any]], None],
+               options: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """Ejecutar los tests uno a uno mostrando la respuesta completa"""
+    results = []
+    for model_name in jobs:
+        category, test_config = get_test_config(model_name)
+        if budget_exhausted():
+            # El resto de la cola se registra como no probado, sin enviar nada
+            result = skipped_result(model_name)
+            result["category"] = category
+            results.append(result)
+            continue
+        result = run_single_model(
+            model_name,
+            test_config["prompt"],
+            test_config["description"],
+            stream=stream,
+            options=options
+        )
+        result["category"] = category
+        on_result(result)
+        results.append(result)
+
+        # Pausa entre tests (innecesaria si la respuesta salió de la caché)
+        if not result["cached"] and not budget_exhausted():
+            time.sleep(1)
+    return results
+
+def run_concurrent(jobs: List[str], workers: int, per_model: int, stream: bool,
+                   on_result: Callable[[Dict[str, Any]], None],
+                   options: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """Ejecutar los tests con un pool de hilos y un límite de peticiones por modelo"""
+    print_lock = threading.Lock()
+
+    def run_one(model_name: str) -> Dict[str, Any]:
+        category, test_config = get_test_config(model_name)
+        if stream:
+            result = generate_stream(model_name, test_config["prompt"], timeout=180, options=options)
+        else:
+            result = generate(model_name, test_config["prompt"], timeout=180, options=options)
+        result["category"] = category
+        on_result(result)
+        if result.get("skipped"):
+            return result
+        with print_lock:
+            if result["success"]:
+                if result["cached"]:
+                    print(f"💾 {model_name}: desde la caché, {result['eval_count']} tokens")
+                else:
+                    ttft = f", primer token {result['ttft']:.2f}s" if result.get("ttft") is not None else ""
+                    print(f"✅ {model_name}: {result['wall_time']:.2f}s, {result['eval_count']} tokens{ttft}")
+            else:
+                print(f"❌ {model_name}: {format_error(result)}")
+        return result
+
+    # Solo se envía un trabajo cuando su modelo tiene hueco: así ningún hilo del pool se queda
+    # bloqueado esperando a otra petición del mismo modelo mientras hay otros modelos pendientes.
+    # Se toma el primer trabajo listo en el orden de 'jobs' para respetar el orden planificado.
+    results: List[Dict[str, Any]] = [{}] * len(jobs)
+    pending = list(enumerate(jobs))
+    running = {model: 0 for model in set(jobs)}
+    in_flight: Dict[Any, Tuple[int, str]] = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while pending or in_flight:
+            while len(in_flight) < workers:
+                ready = next((job for job in pending if running[job[1]] < per_model), None)
+                if ready is None:
+                    break
+                pending.remove(ready)
+                running[ready[1]] += 1
+                in_flight[executor.submit(run_one, ready[1])] = ready
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                index, model_name = in_flight.pop(future)
+                running[model_name] -= 1
+                results[index] = future.result()
+    return results
+
+def print_summary(models: List[str], results: List[Dict[str, Any]], wall_time: float,
+                  concurrent: bool) -> None:
+    """Mostrar el resumen final en el orden original de los modelos"""
+    print("\n" + "=" * 50)
+    print("📊 RESUMEN DE TESTS")
+    print("=" * 50)
+
+    def describe(result: Dict[str, Any]) -> str:
+        if result["cached"]:
+            return "caché"
+        if result.get("skipped"):
+            return "sin probar"
+        if result.get("truncated"):
+            return f"cortada a {result['wall_time']:.2f}s, {result['partial_tokens']} tokens"
+        if result["error"] == DEADLINE_ERROR:
+            return f"abandonada a {result['wall_time']:.2f}s"
+        return f"{result['wall_time']:.2f}s"
+
+    for model_name in models:
+        model_results = [r for r in results if r["model"] == model_name]
+        successes = sum(1 for r in model_results if r["success"])
+        if all(r.get("skipped") for r in model_results):
+            status = "⏭️ "
+        elif successes == len(model_results):
+            status = "✅"
+        else:
+            status = "❌"
+        category = model_results[0]["category"]
+        times = ", ".join(describe(r) for r in model_results)
+        count = f" {successes}/{len(model_results)}" if len(model_results) > 1 else ""
+        print(f"{status} {model_name} ({category}){count} [{times}]")
+
+    successful_tests = sum(1 for r in results if r["success"])
+    print(f"\n🎯 Resultados: {successful_tests}/{len(results)} tests exitosos")
+
+    skipped = [r for r in results if r.get("skipped")]
+    cut = [r for r in results if r["error"] == DEADLINE_ERROR and not r.get("skipped")]
+    if skipped or cut:
+        untested = [m for m in models if all(r.get("skipped") for r in results if r["model"] == m)]
+        print(f"⏳ Presupuesto de tiempo agotado: {len(cut)} peticiones cortadas, "
+              f"{len(skipped)} sin enviar")
+        if untested:
+            print(f"   Modelos sin probar: {', '.join(untested)}")
+        # Sin streaming no hay métricas parciales: solo se sabe cuánto se esperó
+        for result in (r for r in cut if r.get("truncated")):
+            ttft = f", primer token {result['ttft']:.2f}s" if result.get("ttft") is not None else ""
+            tps = f", {result['partial_tps']:.1f} tokens/s" if result.get("partial_tps") else ""
+            print(f"   ✂️  {result['model']}: {result['partial_tokens']} tokens en "
+                  f"{result['wall_time']:.2f}s{ttft}{tps}")
+
+    cached = sum(1 for r in results if r["cached"])
+    if cached:
+        print(f"💾 {cached} respuestas servidas desde la caché (excluidas de los tiempos)")
+
+    # Con peticiones simultáneas los tiempos individuales se solapan y se alargan al compartir
+    # la GPU: solo el rendimiento total es comparable entre ejecuciones con distinto --workers.
+    # En modo secuencial no cuentan las pausas entre tests
+    measured = [r for r in results if r["success"] and not r["cached"]]
+    tokens = sum(r.get("eval_count", 0) for r in measured)
+    busy_time = wall_time if concurrent else sum(r["wall_time"] for r in results
+                                                 if not r["cached"] and not r.get("skipped"))
+    print(f"⏱️  Tiempo total: {wall_time:.2f}s")
+    if busy_time > 0 and measured:
+        print(f"🚀 Rendimiento: {len(measured) / busy_time:.2f} peticiones/s, "
+              f"{tokens / busy_time:.1f} tokens/s")
+
+    if successful_tests == len(results):
+        print("🎉 ¡Todos los tests pasaron exitosamente!")
+    elif successful_tests > 0:
+        print("⚠️  Algunos tests fallaron")
+    else:
+        print("❌ Todos los tests fallaron")
+
 def main():
     """Función principal"""
+    args = parse_args()
+
     print("🤖 Test Automático de Todos los Modelos")
     print("=" * 50)
-    
+
     # Verificar conexión
     if not check_ollama_status():
         return
-    
+
     # Obtener modelos disponibles
     models = get_available_models()
     if not models:
         print("📋 No hay modelos disponibles")
         print("   Descarga algunos modelos con: ./ollama.sh pull [modelo]")
         return
-    
+
     print(f"📋 Modelos encontrados: {len(models)}")
     for model in models:
         print(f"   • {model}")
-    
+
+    # Un pool de conexiones por worker para reutilizarlas entre peticiones
+    set_client(make_client(pool_size=args.workers))
+    if args.metrics_port:
+        start_metrics_server(args.metrics_port)
+        print(f"📈 Métricas en http://localhost:{args.metrics_port}/metrics")
+    sampler = None
+    if args.resources:
+        sampler = ResourceSampler(get_client(), args.resource_interval).start()
+        set_sampler(sampler)
+        print(f"🖥️  Muestreando recursos cada {args.resource_interval:g}s ({sampler.describe()})")
+
+    # Con una semilla fija las respuestas son reproducibles y se pueden cachear
+    options = None
+    if args.cache:
+        set_cache(ResponseCache())
+        if args.seed is None:
+            args.seed = 0
+        print(f"💾 Caché de respuestas activa en {get_cache().path} (seed {args.seed})")
+    if args.seed is not None:
+        options = {"seed": args.seed}
+
+    # Guardar cada resultado según termina
+    on_result: Callable[[Dict[str, Any]], None] = lambda result: None
+    if not args.no_save:
+        writer = ResultsStore(args.results).start_run("test_all_models", get_ollama_version(),
+                                                      get_model_digests())
+        on_result = writer.add
+        print(f"💾 Guardando resultados en {args.results} (ejecución {writer.run_id})")
+
+    # Cada modelo aparece 'repeat' veces seguidas
+    jobs = [model for model in models for _ in range(args.repeat)]
+    if args.schedule:
+        sizes = get_model_sizes()
+        loaded = list(get_loaded_models())
+        tags_jobs = jobs
+        jobs = plan_order(tags_jobs, sizes, loaded)
+        print(f"🧠 Orden planificado: {', '.join(dict.fromkeys(jobs))}")
+
     # Ejecutar tests
-    results = []
-    successful_tests = 0
-    
-    for model_name in models:
-        category = categorize_model(model_name)
-        
-        if category in MODEL_TESTS:
-            test_config = MODEL_TESTS[category]
-            success = test_single_model(
-                model_name, 
-                test_config["prompt"], 
-                test_config["description"]
-            )
-        else:
-            # Test genérico para modelos no categorizados
-            success = test_single_model(
-                model_name,
-                "Explica brevemente qué es la inteligencia artificial.",
-                "Test general"
-            )
-        
-        results.append({
-            "model": model_name,
-            "category": category,
-            "success": success
-        })
-        
-        if success:
-            successful_tests += 1
-        
-        # Pausa entre tests
-        time.sleep(1)
-    
-    # Resumen final
-    print("\n" + "=" * 50)
-    print("📊 RESUMEN DE TESTS")
-    print("=" * 50)
-    
-    for result in results:
-        status = "✅" if result["success"] else "❌"
-        print(f"{status} {result['model']} ({result['category']})")
-    
-    print(f"\n🎯 Resultados: {successful_tests}/{len(results)} tests exitosos")
-    
-    if successful_tests == len(results):
-        print("🎉 ¡Todos los tests pasaron exitosamente!")
-    elif successful_tests > 0:
-        print("⚠️  Algunos tests fallaron")
+    start_time = time.time()
+    if args.budget:
+        set_budget(args.budget)
+        print(f"⏳ Presupuesto de {args.budget:g}s: termina a las "
+              f"{time.strftime('%H:%M:%S', time.localtime(start_time + args.budget))}")
+    if args.workers == 1:
+        results = run_serial(jobs, args.stream, on_result, options)
     else:
-        print("❌ Todos los tests fallaron")
+        print(f"\n⚡ Modo concurrente: {args.workers} workers, "
+              f"máximo {args.per_model} peticiones por modelo")
+        results = run_concurrent(jobs, args.workers, args.per_model, args.stream, on_result, options)
+    wall_time = time.time() - start_time
+
+    # Resumen final
+    print_summary(models, results, wall_time, args.workers > 1)
+    if args.cache:
+        get_cache().print_stats()
+    if sampler:
+        sampler.stop()
+        sampler.print_summary()
+        sampler.write(args.resources)
+        print(f"🖥️  Muestras de recursos guardadas en {args.resources}")
+    if args.metrics_file:
+        write_metrics(args.metrics_file)
+        print(f"📈 Métricas guardadas en {args.metrics_file}")
+
+    if args.schedule:
+        # Estimar con los tiempos de carga medidos en esta ejecución cuando los haya
+        measured: Dict[str, float] = {}
+        for result in results:
+            if result["success"] and not result["cached"]:
+                measured[result["model"]] = max(measured.get(result["model"], 0.0),
+                                                result["load_duration"] / 1e9)
+        memory_budget = default_memory_budget(sizes, args.memory_gb)
+        print_comparison(compare_orders(tags_jobs, sizes, loaded, memory_budget, measured=measured),
+                         memory_budget)
+        total_load = sum(r["load_duration"] for r in results if r["success"] and not r["cached"]) / 1e9
+        print(f"   ⏱️  Tiempo de carga medido en esta ejecución: {total_load:.1f}s")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Separación del razonamiento y la respuesta de los modelos que "piensan" (deepseek-r1)
+Estos modelos generan un bloque <think>…</think> antes de la respuesta, o bien lo
+devuelven aparte en el campo 'thinking' de cada fragmento (Ollama con "think": true).
+ThinkParser recibe los fragmentos de un stream según llegan, los clasifica aunque una
+etiqueta venga partida entre dos fragmentos y anota cuándo termina el razonamiento y
+cuándo llega el primer token de la respuesta.
+
+Como Ollama envía un token por fragmento, los fragmentos se cuentan como tokens.
+"""
+
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+THINK_OPEN = "<think>"
+THINK_CLOSE = "</think>"
+
+def _partial_suffix(text: str, tag: str) -> int:
+    """Longitud del final de 'text' que puede ser el principio de 'tag'"""
+    for size in range(min(len(tag) - 1, len(text)), 0, -1):
+        if tag.startswith(text[-size:]):
+            return size
+    return 0
+
+def split_reasoning(text: str) -> Tuple[str, str]:
+    """Separar una respuesta completa en (razonamiento, respuesta)"""
+    stripped = text.lstrip()
+    if not stripped.startswith(THINK_OPEN):
+        return "", text
+    body = stripped[len(THINK_OPEN):]
+    reasoning, found, answer = body.partition(THINK_CLOSE)
+    if not found:
+        # Cortado por num_predict antes de terminar de razonar
+        return reasoning.strip(), ""
+    return reasoning.strip(), answer.strip()
+
+class ThinkParser:
+    """Clasifica en razonamiento o respuesta los fragmentos de un stream según llegan"""
+
+    def __init__(self, start_time: Optional[float] = None):
+        self.start_time = time.time() if start_time is None else start_time
+        self.phase = "start"  # start → thinking → answer
+        self.field_mode = False  # el razonamiento llega en 'thinking' y no entre etiquetas
+        self.pending = ""
+        self.pending_tokens = 0  # fragmentos retenidos al principio hasta saber su fase
+        self.reasoning: List[str] = []
+        self.answer: List[str] = []
+        self.reasoning_tokens = 0
+        self.answer_tokens = 0
+        self.last_thinking: Optional[float] = None
+        self.think_end: Optional[float] = None
+        self.answer_first: Optional[float] = None
+        self.answer_last: Optional[float] = None
+
+    def feed(self, text: str = "", thinking: str = "", now: Optional[float] = None) -> None:
+        """Procesar un fragmento: 'text' es la respuesta o 'content', 'thinking' el campo aparte"""
+        now = time.time() if now is None else now
+        if thinking:
+            self.field_mode = True
+            self.phase = "thinking"
+            self.reasoning.append(thinking)
+            self.reasoning_tokens += 1
+            self.last_thinking = now
+        if not text:
+            return
+        if self.field_mode and self.phase == "thinking":
+            self.phase = "answer"
+            self.think_end = self.last_thinking
+        is_reasoning, is_answer = self._feed_text(text, now)
+        if is_answer:
+            self.answer_tokens += 1
+        elif is_reasoning:
+            self.reasoning_tokens += 1
+
+    def _feed_text(self, text: str, now: float) -> Tuple[bool, bool]:
+        """Repartir el texto entre las fases; devuelve si aportó razonamiento y respuesta"""
+        is_reasoning = is_answer = False
+        buffer = self.pending + text
+        self.pending = ""
+        while buffer:
+            if self.phase == "start":
+                stripped = buffer.lstrip()
+                if not stripped or (THINK_OPEN.startswith(stripped) and stripped != THINK_OPEN):
+                    # Espacios iniciales o una etiqueta de apertura a medias: esperar al siguiente
+                    self.pending = buffer
+                    self.pending_tokens += 1
+                    return False, False
+                if stripped.startswith(THINK_OPEN):
+                    self.phase = "thinking"
+                    buffer = stripped[len(THINK_OPEN):]
+                    self.reasoning_tokens += self.pending_tokens
+                    is_reasoning = True
+                else:
+                    self.phase = "answer"
+                    self.answer_tokens += self.pending_tokens
+                self.pending_tokens = 0
+            elif self.phase == "thinking":
+                index = buffer.find(THINK_CLOSE)
+                if index >= 0:
+                    self.reasoning.append(buffer[:index])
+                    buffer = buffer[index + len(THINK_CLOSE):]
+                    self.phase = "answer"
+                    self.think_end = now
+                    is_reasoning = True
+                    continue
+                keep = _partial_suffix(buffer, THINK_CLOSE)
+                self.reasoning.append(buffer[:len(buffer) - keep])
+                self.pending = buffer[len(buffer) - keep:]
+                return True, is_answer
+            else:
+                self.answer.append(buffer)
+                if buffer.strip():
+                    if self.answer_first is None:
+                        self.answer_first = now
+                    self.answer_last = now
+                # Un fragmento con "</think>" y texto a la vez cuenta como razonamiento
+                is_answer = not is_reasoning
+                buffer = ""
+        return is_reasoning, is_answer
+
+    def finish(self) -> Optional[Dict[str, Any]]:
+        """Cerrar el stream y devolver las métricas, o None si el modelo no razonó"""
+        if self.pending:
+            (self.reasoning if self.phase == "thinking" else self.answer).append(self.pending)
+            self.answer_tokens += self.pending_tokens
+            self.pending = ""
+            self.pending_tokens = 0
+        if self.field_mode and self.phase == "thinking":
+            self.think_end = None  # el stream terminó sin llegar a la respuesta
+        if not self.reasoning_tokens:
+            return None
+        answer_time = (self.answer_last - self.answer_first) if self.answer_first is not None else 0.0
+        return {
+            "reasoning_tokens": self.reasoning_tokens,
+            "answer_tokens": self.answer_tokens,
+            "reasoning_chars": len("".join(self.reasoning).strip()),
+            "think_time": self.think_end - self.start_time if self.think_end is not None else None,
+            "answer_ttft": self.answer_first - self.start_time if self.answer_first is not None else None,
+            "answer_tps": (self.answer_tokens - 1) / answer_time if self.answer_tokens > 1 and answer_time > 0 else None
+        }
+
+    @property
+    def answer_text(self) -> str:
+        return "".join(self.answer).strip()
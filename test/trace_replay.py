@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+"""
+Grabación y reproducción de trazas de tráfico real
+  record  Proxy HTTP entre los clientes y Ollama que reenvía todas las peticiones (con
+          streaming) y escribe en un JSONL una línea por petición a /api/generate o
+          /api/chat: instante de llegada, modelo, prompt (o solo su longitud), opciones,
+          estado y duración. Las líneas tienen la forma de la entrada de batch_runner.py.
+  replay  Vuelve a enviar una traza respetando los tiempos entre llegadas, opcionalmente
+          acelerada (--speed 2, --speed 10), y muestra los percentiles de latencia por modelo.
+          Con --budget deja de enviar al agotarse el tiempo y corta las que siguen en curso.
+
+Uso: python trace_replay.py record trazas/produccion.jsonl [--port 11400] [--no-prompts]
+     python trace_replay.py replay trazas/produccion.jsonl [--speed 2] [--model deepseek-r1:7b]
+"""
+
+import argparse
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import requests
+
+# Importar utilidades comunes
+try:
+    from ollama_test_utils import (
+        chat_stream,
+        check_ollama_status,
+        format_error,
+        generate_stream,
+        get_client,
+        latency_summary,
+        make_client,
+        set_client,
+        set_budget,
+        budget_exhausted,
+        budget_left,
+        DEADLINE_ERROR,
+        EXAMPLE_PROMPTS
+    )
+    from ollama_client import DEFAULT_BASE_URL, OllamaClient
+except ImportError as e:
+    print(f"❌ Error: No se puede importar {e.name or 'un módulo'}: {e}")
+    print("   Asegúrate de que los scripts de test/ estén en el mismo directorio "
+          "y de haber instalado test/requirements.txt")
+    sys.exit(1)
+
+# Endpoints de inferencia que se graban; el resto solo se reenvía
+RECORDED_PATHS = ("/api/generate", "/api/chat")
+
+def prompt_text(path: str, payload: Dict[str, Any]) -> str:
+    """Texto completo que evalúa el modelo: el prompt o el contenido de todos los mensajes"""
+    if path == "/api/chat":
+        return "".join(str(m.get("content", "")) for m in payload.get("messages") or [])
+    return str(payload.get("prompt", ""))
+
+def trace_record(path: str, payload: Dict[str, Any], arrival: float, keep_prompts: bool) -> Dict[str, Any]:
+    """Línea de la traza para una petición recibida"""
+    record = {
+        "timestamp": arrival,
+        "path": path,
+        "model": payload.get("model"),
+        "prompt_chars": len(prompt_text(path, payload)),
+        "options": payload.get("options") or {},
+        "stream": payload.get("stream", True)
+    }
+    if "keep_alive" in payload:
+        # Sin prompt, con keep_alive, es una carga o descarga del modelo
+        record["keep_alive"] = payload["keep_alive"]
+    if keep_prompts:
+        if path == "/api/chat":
+            record["messages"] = payload.get("messages") or []
+        else:
+            record["prompt"] = payload.get("prompt", "")
+    elif path == "/api/chat":
+        record["turns"] = len(payload.get("messages") or [])
+    return record
+
+class TraceWriter:
+    """Fichero JSONL de solo añadir compartido por los hilos del proxy"""
+
+    def __init__(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.file = path.open("a", encoding="utf-8")
+        self.lock = threading.Lock()
+        self.count = 0
+
+    def write(self, record: Dict[str, Any]) -> None:
+        with self.lock:
+            self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self.file.flush()
+            self.count += 1
+
+    def close(self) -> None:
+        self.file.close()
+
+class RecordingHandler(BaseHTTPRequestHandler):
+    """Reenvía cada petición al servidor real y graba las de inferencia"""
+
+    protocol_version = "HTTP/1.1"
+    server: "RecordingProxy"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass  # Una línea por petición ensuciaría la salida en un proxy de producción
+
+    def do_GET(self) -> None:
+        self.forward("GET")
+
+    def do_HEAD(self) -> None:
+        # Los clientes comprueban con HEAD / si el servidor está vivo
+        self.forward("HEAD")
+
+    def do_POST(self) -> None:
+        self.forward("POST")
+
+    def do_DELETE(self) -> None:
+        self.forward("DELETE")
+
+    def forward(self, method: str) -> None:
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        arrival = time.time()
+        status = 502
+        try:
+            response = self.server.client.request(
+                method, self.path, data=body or None, stream=True, timeout=self.server.timeout,
+                headers={"Content-Type": self.headers.get("Content-Type", "application/json")}
+            )
+        except requests.exceptions.RequestException as e:
+            error = json.dumps({"error": f"proxy: {e}"}).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(error)))
+            self.end_headers()
+            self.wfile.write(error)
+        else:
+            with response:
+                status = response.status_code
+                if method == "HEAD":
+                    self.send_response(status)
+                    for header in ("Content-Type", "Content-Length"):
+                        if header in response.headers:
+                            self.send_header(header, response.headers[header])
+                    self.end_headers()
+                else:
+                    self.relay(response)
+        if method == "POST" and self.path in RECORDED_PATHS:
+            try:
+                payload = json.loads(body or b"{}")
+            except ValueError:
+                return
+            record = trace_record(self.path, payload, arrival, self.server.keep_prompts)
+            record.update({"status": status, "wall_time": time.time() - arrival})
+            self.server.writer.write(record)
+
+    def relay(self, response: requests.Response) -> None:
+        """Devolver la respuesta al cliente con codificación chunked según llega"""
+        self.send_response(response.status_code)
+        self.send_header("Content-Type", response.headers.get("Content-Type", "application/json"))
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for chunk in response.iter_content(chunk_size=None):
+                if chunk:
+                    self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+                    self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # El cliente se fue: se corta también la petición al servidor real
+            self.close_connection = True
+
+class RecordingProxy(ThreadingHTTPServer):
+    """Proxy con el cliente del servidor real y el fichero de la traza"""
+
+    daemon_threads = True
+
+    def __init__(self, address, upstream: str, writer: TraceWriter, keep_prompts: bool = True,
+                 timeout: float = 600):
+        super().__init__(address, RecordingHandler)
+        self.client = OllamaClient(upstream, timeout=timeout, pool_size=64)
+        self.writer = writer
+        self.keep_prompts = keep_prompts
+        self.timeout = timeout
+
+def load_trace(path: Path, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Leer una traza ordenada por instante de llegada (se ignoran las líneas no válidas)"""
+    records = []
+    with path.open(encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(record, dict) and record.get("model") and "timestamp" in record:
+                records.append(record)
+    records.sort(key=lambda r: r["timestamp"])
+    return records[:limit] if limit else records
+
+def synthetic_prompt(chars: int) -> str:
+    """
+    Prompt de relleno con la misma longitud que el original cuando la traza no lo guarda;
+    un prompt vacío (carga o descarga del modelo) se mantiene vacío
+    """
+    text = EXAMPLE_PROMPTS["general"] + " "
+    return (text * (chars // len(text) + 1))[:chars]
+
+class Replay:
+    """Reproduce una traza y acumula los resultados por modelo"""
+
+    def __init__(self, records: List[Dict[str, Any]], speed: float, model: Optional[str],
+                 max_tokens: Optional[int], timeout: float):
+        self.records = records
+        self.speed = speed
+        self.model = model
+        self.max_tokens = max_tokens
+        self.timeout = timeout
+        self.results: List[Dict[str, Any]] = []
+        self.unsent = 0  # peticiones de la traza que el presupuesto dejó sin enviar
+        self.lock = threading.Lock()
+
+    def execute(self, record: Dict[str, Any], scheduled_time: float) -> None:
+        """Enviar una petición de la traza con sus opciones originales"""
+        dispatch_time = time.time()
+        model = self.model or record["model"]
+        options = dict(record.get("options") or {})
+        if self.max_tokens is not None:
+            options["num_predict"] = min(options.get("num_predict") or self.max_tokens, self.max_tokens)
+        chars = record.get("prompt_chars", 0)
+        keep_alive = record.get("keep_alive")
+        if record.get("path") == "/api/chat":
+            messages = record.get("messages")
+            if messages is None:
+                messages = [{"role": "user", "content": synthetic_prompt(chars)}] if chars else []
+            result = chat_stream(model, messages, None, timeout=self.timeout, options=options,
+                                 keep_alive=keep_alive)
+        else:
+            prompt = record.get("prompt")
+            if prompt is None:
+                prompt = synthetic_prompt(chars)
+            result = generate_stream(model, prompt, None, timeout=self.timeout, options=options,
+                                     keep_alive=keep_alive)
+        result["queue_delay"] = dispatch_time - scheduled_time
+        result["recorded_wall_time"] = record.get("wall_time")
+        with self.lock:
+            self.results.append(result)
+
+    def run(self, max_inflight: int) -> float:
+        """
+        Enviar cada petición en su instante (escalado por 'speed'); devuelve el tiempo transcurrido.
+        Al agotarse el presupuesto no se envían más y el resto cuenta en 'unsent'.
+        """
+        start_time = time.time()
+        first = self.records[0]["timestamp"]
+        with ThreadPoolExecutor(max_workers=max_inflight) as executor:
+            for n, record in enumerate(self.records):
+                scheduled_time = start_time + (record["timestamp"] - first) / self.speed
+                wait = scheduled_time - time.time()
+                left = budget_left()
+                time.sleep(max(0.0, wait if left is None else min(wait, left)))
+                if budget_exhausted():
+                    self.unsent = len(self.records) - n
+                    break
+                # Si todos los workers están ocupados la petición espera en la cola del pool
+                executor.submit(self.execute, record, scheduled_time)
+        return time.time() - start_time
+
+def print_replay_report(replay: Replay, elapsed: float) -> None:
+    """Percentiles de latencia por modelo, comparados con la duración grabada"""
+    span = replay.records[-1]["timestamp"] - replay.records[0]["timestamp"]
+    print("\n" + "=" * 100)
+    print("📊 REPRODUCCIÓN DE LA TRAZA")
+    print("=" * 100)
+    # Las que esperaban en el pool al agotarse el presupuesto no llegaron a enviarse
+    sent = [r for r in replay.results if not r.get("skipped")]
+    cut = [r for r in sent if r["error"] == DEADLINE_ERROR]
+    unsent = len(replay.results) - len(sent) + replay.unsent
+    print(f"📨 {len(sent)} peticiones en {elapsed:.1f}s "
+          f"(traza de {span:.1f}s a {replay.speed:g}x = {span / replay.speed:.1f}s)")
+    print(f"{'Modelo':<36}{'n':>5}{'Errores':>9}{'p50':>9}{'p90':>9}{'p99':>9}{'TTFT p50':>10}{'Grabado p50':>13}")
+    by_model: Dict[str, List[Dict[str, Any]]] = {}
+    for result in sent:
+        by_model.setdefault(result["model"], []).append(result)
+    for model, results in sorted(by_model.items()):
+        ok = [r for r in results if r["success"]]
+        failed = [r for r in results if not r["success"] and r["error"] != DEADLINE_ERROR]
+        latency = latency_summary([r["wall_time"] for r in ok])
+        ttft = latency_summary([r["ttft"] for r in ok if r["ttft"] is not None])
+        recorded = [r["recorded_wall_time"] for r in results if r["recorded_wall_time"] is not None]
+        recorded_text = f"{latency_summary(recorded)['p50']:.2f}s" if recorded else "-"
+        print(f"{model:<36}{len(results):>5}{len(failed):>9}{latency['p50']:>8.2f}s"
+              f"{latency['p90']:>8.2f}s{latency['p99']:>8.2f}s{ttft['p50']:>9.2f}s{recorded_text:>13}")
+
+    errors = [r for r in sent if not r["success"] and r["error"] != DEADLINE_ERROR]
+    for result in errors[:5]:
+        print(f"❌ {result['model']}: {format_error(result)}")
+    if cut or unsent:
+        print(f"⏳ Presupuesto de tiempo agotado: {len(cut)} peticiones cortadas, {unsent} sin enviar")
+    lag = latency_summary([r["queue_delay"] for r in sent])
+    if lag["p99"] > 1.0:
+        print(f"⚠️  El reproductor se retrasó hasta {lag['max']:.1f}s respecto a la traza "
+              f"(p99 {lag['p99']:.1f}s): aumenta --max-inflight")
+
+def parse_args() -> argparse.Namespace:
+    """Leer los argumentos de la línea de comandos"""
+    parser = argparse.ArgumentParser(description="Grabar y reproducir trazas de peticiones a Ollama")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    record = subparsers.add_parser("record", help="Proxy que graba las peticiones que recibe")
+    record.add_argument("trace", type=Path, help="Fichero JSONL de la traza (se añade al final)")
+    record.add_argument("--host", default="0.0.0.0", help="Dirección de escucha (por defecto: 0.0.0.0)")
+    record.add_argument("--port", type=int, default=11400, help="Puerto del proxy (por defecto: 11400)")
+    record.add_argument("--upstream", default=DEFAULT_BASE_URL,
+                        help=f"Servidor Ollama real (por defecto: {DEFAULT_BASE_URL})")
+    record.add_argument("--no-prompts", action="store_true",
+                        help="Guardar solo la longitud de los prompts, no su contenido")
+
+    replay = subparsers.add_parser("replay", help="Reproducir una traza respetando los tiempos")
+    replay.add_argument("trace", type=Path, help="Fichero JSONL de la traza")
+    replay.add_argument("--speed", type=float, default=1.0,
+                        help="Multiplicador de velocidad: 2 reproduce la traza en la mitad de tiempo")
+    replay.add_argument("--model", default=None, help="Enviar todas las peticiones a este modelo")
+    replay.add_argument("--limit", type=int, default=None, help="Reproducir solo las N primeras peticiones")
+    replay.add_argument("--max-tokens", type=int, default=None,
+                        help="Límite de tokens por respuesta (por defecto: el de la traza)")
+    replay.add_argument("--max-inflight", type=int, default=32,
+                        help="Peticiones en curso como máximo (por defecto: 32)")
+    replay.add_argument("--timeout", type=float, default=300,
+                        help="Timeout por petición en segundos (por defecto: 300)")
+    replay.add_argument("--budget", type=float, default=None,
+                        help="Tiempo total máximo en segundos: al agotarse se cortan las peticiones "
+                             "en curso y no se envían más")
+    args = parser.parse_args()
+    if args.command == "replay" and args.speed <= 0:
+        parser.error("--speed debe ser > 0")
+    if args.command == "replay" and args.budget is not None and args.budget <= 0:
+        parser.error("--budget debe ser > 0")
+    return args
+
+def main():
+    """Función principal"""
+    args = parse_args()
+
+    if args.command == "record":
+        writer = TraceWriter(args.trace)
+        proxy = RecordingProxy((args.host, args.port), args.upstream, writer, not args.no_prompts)
+        print(f"🎙️  Grabando en {args.trace}: apunta los clientes a http://{args.host}:{args.port} "
+              f"(reenvía a {args.upstream})")
+        try:
+            proxy.serve_forever()
+        except KeyboardInterrupt:
+            print(f"\n⏹️  {writer.count} peticiones grabadas en {args.trace}")
+        finally:
+            writer.close()
+        return
+
+    print("▶️  Reproducción de Trazas")
+    print("=" * 50)
+    records = load_trace(args.trace, args.limit)
+    if not records:
+        print(f"📋 La traza {args.trace} no tiene peticiones")
+        return
+    if not check_ollama_status():
+        return
+
+    set_client(make_client(pool_size=args.max_inflight))
+    models = sorted({args.model or r["model"] for r in records})
+    print(f"🔁 {len(records)} peticiones a {args.speed:g}x sobre {', '.join(models)} ({get_client().base_url})")
+    replay = Replay(records, args.speed, args.model, args.max_tokens, args.timeout)
+    if args.budget:
+        set_budget(args.budget)
+    elapsed = replay.run(args.max_inflight)
+    print_replay_report(replay, elapsed)
+
+if __name__ == "__main__":
+    main()